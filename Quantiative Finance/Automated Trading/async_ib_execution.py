@@ -0,0 +1,915 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A non-blocking asyncio execution handler for Interactive Brokers,
+built on the TWS API (ibapi), and a mock TWS server to test it.
+"""
+
+
+import asyncio
+import datetime
+import itertools
+import struct
+import threading
+import time
+
+from ibapi import comm
+from ibapi.client import EClient
+from ibapi.contract import Contract
+from ibapi.decoder import Decoder
+from ibapi.message import IN, OUT
+from ibapi.order import Order
+from ibapi.server_versions import (
+    MAX_CLIENT_VER, MIN_CLIENT_VER, MIN_SERVER_VER_MARKET_CAP_PRICE,
+    MIN_SERVER_VER_ORDER_CONTAINER, MIN_SERVER_VER_PLACE_ORDER_CONID,
+    MIN_SERVER_VER_SEC_ID_TYPE, MIN_SERVER_VER_TRADING_CLASS
+)
+from ibapi.wrapper import EWrapper
+
+from event import EventType, FillEvent
+from event_bus import EventBus
+from execution import ExecutionHandler
+
+
+async def read_message(reader):
+    """
+    Reads one message of the TWS API from a stream: a 4-byte big-endian
+    length followed by that many bytes.
+
+    Parameters
+    ----------
+    reader : 'StreamReader'
+        The stream.
+
+    Raises
+    ------
+    asyncio.IncompleteReadError
+        If the stream is closed.
+
+    Returns
+    -------
+    'bytes'
+        The body of the message.
+
+    """
+
+    size, = struct.unpack("!I", await reader.readexactly(4))
+    return await reader.readexactly(size)
+
+
+async def read_fields(reader):
+    """
+    Reads one message of the TWS API from a stream and splits it into 
+    its NUL-terminated fields.
+
+    Parameters
+    ----------
+    reader : 'StreamReader'
+        The stream.
+
+    Raises
+    ------
+    asyncio.IncompleteReadError
+        If the stream is closed.
+
+    Returns
+    -------
+    'tuple'
+        The fields of the message, as bytes.
+
+    """
+
+    return comm.read_fields(await read_message(reader))
+
+
+def make_message(*fields):
+    """
+    Encodes fields as a length-prefixed message of the TWS API.
+
+    """
+
+    return comm.make_msg("".join(comm.make_field(f) for f in fields))
+
+
+
+class IBOrderError(Exception):
+    """
+    Raised by the acknowledgement of an order that TWS rejected, or did
+    not acknowledge in time (with no error code).
+
+    """
+
+    def __init__(self, order_id, error_code, error_string):
+        super(IBOrderError, self).__init__(
+            "Order %s rejected (%s): %s" % (order_id, error_code, error_string)
+        )
+        self.order_id = order_id
+        self.error_code = error_code
+        self.error_string = error_string
+
+
+
+class _StreamConnection(object):
+    """
+    Stands in for the ibapi Connection of an EClient, writing its
+    messages to an asyncio stream instead of a blocking socket.
+
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+
+    def sendMsg(self, msg):
+        self.writer.write(msg)
+
+
+    def isConnected(self):
+        return not self.writer.is_closing()
+
+
+    def disconnect(self):
+        self.writer.close()
+
+
+
+class _ExecutionWrapper(EWrapper):
+    """
+    The EWrapper of an AsyncIBExecution, passing the callbacks it
+    uses on to the handler.
+
+    """
+
+    def __init__(self, handler):
+        EWrapper.__init__(self)
+        self.handler = handler
+
+
+    def nextValidId(self, orderId):
+        self.handler._handle_next_valid_id(orderId)
+
+
+    def openOrder(self, orderId, contract, order, orderState):
+        self.handler._acknowledge(orderId)
+
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice,
+                    *args):
+        self.handler._handle_order_status(
+            orderId, status, filled, remaining, avgFillPrice
+        )
+
+
+    def error(self, reqId, errorCode, errorString, *args):
+        self.handler._handle_error(reqId, errorCode, errorString)
+
+
+
+class AsyncIBExecution(ExecutionHandler):
+    """
+    Handles order execution against Trader Workstation (TWS) over a
+    non-blocking asyncio connection, replacing the one second sleep
+    that IBExecution takes after every order.
+
+    The handler uses the official TWS API (ibapi) to speak to TWS: 
+    orders are encoded by EClient.placeOrder and the replies are 
+    decoded by its Decoder into the callbacks of an EWrapper, exactly 
+    as in a threaded ibapi program. Only the socket and the reader 
+    thread of the EClient are replaced, by an asyncio stream and a 
+    reader task, so that many orders can be in flight at once without
+    any threads. Order ids are taken from a counter starting at the 
+    nextValidId sent by TWS, so they increase monotonically and are
+    never reused within a session.
+
+    place_order is a coroutine that sends an order and waits for TWS to
+    acknowledge it (with an openOrder or orderStatus message), raising
+    an IBOrderError if TWS rejects it or does not acknowledge it within
+    'ack_timeout' seconds. The fills of an order that timed out are 
+    still booked should they arrive. Each
+    increase in the filled quantity of an order reported by orderStatus
+    becomes a FillEvent (at the average price of that increase), which
+    is put onto the events queue and passed to the on_fill callback.
+
+    The handler can run inside an existing asyncio program (await
+    connect() and place_order()), or, for the synchronous Backtest
+    loop, start() runs its event loop in a background thread and
+    execute_order() schedules each order on it without waiting. The 
+    orders that fail are then counted in orders_failed and reported, 
+    since nothing waits on them. The Backtest calls start() and stop()
+    itself, and must then be given a queue.Queue as its event queue 
+    (see Backtest), since the fills are put onto it from the event 
+    loop's thread. They are handled at the next heartbeat.
+    """
+
+    def __init__(self, events, host='127.0.0.1', port=7496, client_id=10,
+                 order_routing="SMART", currency="USD", on_fill=None,
+                 ack_timeout=10.0):
+        """
+        Initializes the handler. No connection is made until connect()
+        or start() is called.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The Queue of Event objects.
+        host : 'str', optional
+            The host of TWS. The default is '127.0.0.1'.
+        port : 'int', optional
+            The port of TWS. The default is 7496.
+        client_id : 'int', optional
+            The client id of the connection. The default is 10.
+        order_routing : 'str', optional
+            The exchange orders are routed to. The default is "SMART".
+        currency : 'str', optional
+            The currency of the contracts. The default is "USD".
+        on_fill : 'callable', optional
+            Called with each FillEvent. The default is None.
+        ack_timeout : 'float', optional
+            The seconds to wait for TWS to acknowledge an order. The 
+            default is 10.0.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.events = events
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.order_routing = order_routing
+        self.currency = currency
+        self.on_fill = on_fill
+        self.ack_timeout = ack_timeout
+
+        self.client = EClient(_ExecutionWrapper(self))
+        self.loop = None
+        self._thread = None
+        self._writer = None
+        self._read_task = None
+        self._order_ids = None
+        self._next_valid_id = None
+
+        self.fill_dict = {}
+        self._acks = {}
+        self.orders_failed = 0
+
+
+    async def connect(self):
+        """
+        Connects to TWS, performs the handshake of the TWS API and 
+        waits for the first valid order id.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.loop = asyncio.get_running_loop()
+        self._next_valid_id = self.loop.create_future()
+        reader, self._writer = await asyncio.open_connection(
+            self.host, self.port
+        )
+
+        client = self.client
+        client.host = self.host
+        client.port = self.port
+        client.clientId = self.client_id
+        client.conn = _StreamConnection(self._writer)
+        client.setConnState(EClient.CONNECTING)
+
+        # Agree on the version of the protocol
+        self._writer.write(b"API\0" + comm.make_msg(
+            "v%d..%d" % (MIN_CLIENT_VER, MAX_CLIENT_VER)
+        ))
+        server_version, conn_time = await read_fields(reader)
+        client.serverVersion_ = int(server_version)
+        client.connTime = conn_time
+        client.decoder = Decoder(client.wrapper, client.serverVersion())
+        client.setConnState(EClient.CONNECTED)
+
+        self._read_task = self.loop.create_task(self._read_replies(reader))
+        client.startApi()
+        self._order_ids = itertools.count(await self._next_valid_id)
+
+
+    async def disconnect(self):
+        """
+        Closes the connection to TWS. Orders that have not been
+        acknowledged are cancelled.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self.client.disconnect()
+            await self._writer.wait_closed()
+            self._writer = None
+        for ack in self._acks.values():
+            ack.cancel()
+        self._acks.clear()
+
+
+    def start(self):
+        """
+        Runs the event loop in a background thread and connects to TWS,
+        blocking until the connection is made.
+
+        Raises
+        ------
+        ValueError
+            If the events queue is an EventBus, which must not be 
+            shared between threads.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if isinstance(self.events, EventBus):
+            raise ValueError(
+                "AsyncIBExecution puts fills from another thread, so its "
+                "events queue must be a queue.Queue"
+            )
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=loop.run_forever, name="AsyncIBExecution", daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.connect(), loop).result()
+
+
+    def stop(self):
+        """
+        Disconnects from TWS and stops the background event loop.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        loop = self.loop
+        asyncio.run_coroutine_threadsafe(self.disconnect(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+    def create_contract(self, symbol):
+        """
+        Creates the ibapi Contract of a stock.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+
+        Returns
+        -------
+        'Contract'
+            The contract.
+
+        """
+
+        contract = Contract()
+        contract.symbol = symbol
+        contract.secType = 'STK'
+        contract.exchange = self.order_routing
+        contract.primaryExchange = self.order_routing
+        contract.currency = self.currency
+        return contract
+
+
+    def create_order(self, event):
+        """
+        Creates the ibapi Order of an OrderEvent.
+
+        Parameters
+        ----------
+        event : 'OrderEvent'
+            The order.
+
+        Returns
+        -------
+        'Order'
+            The order.
+
+        """
+
+        order = Order()
+        order.action = event.direction
+        order.orderType = event.order_type
+        order.totalQuantity = event.quantity
+        if event.price is not None:
+            order.lmtPrice = event.price
+        return order
+
+
+    async def place_order(self, event):
+        """
+        Sends an order to TWS and waits for it to be acknowledged.
+
+        Parameters
+        ----------
+        event : 'OrderEvent'
+            The order.
+
+        Raises
+        ------
+        IBOrderError
+            If TWS rejects the order, or does not acknowledge it within
+            ack_timeout seconds.
+
+        Returns
+        -------
+        'int'
+            The id of the order.
+
+        """
+
+        order_id = next(self._order_ids)
+        ack = self.loop.create_future()
+        self._acks[order_id] = ack
+        self.fill_dict[order_id] = {
+            "symbol": event.symbol,
+            "exchange": self.order_routing,
+            "direction": event.direction,
+            "filled": 0,
+            "avg_fill_price": 0.0,
+        }
+        self.client.placeOrder(
+            order_id, self.create_contract(event.symbol),
+            self.create_order(event)
+        )
+        await self._writer.drain()
+        try:
+            await asyncio.wait_for(ack, self.ack_timeout)
+        except asyncio.TimeoutError:
+            self._acks.pop(order_id, None)
+            raise IBOrderError(
+                order_id, None,
+                "Not acknowledged within %s seconds" % self.ack_timeout
+            )
+        return order_id
+
+
+    def execute_order(self, event):
+        """
+        Schedules an OrderEvent on the event loop without waiting for
+        it to be acknowledged. If the order fails, it is reported by 
+        _report_failure.
+
+        Parameters
+        ----------
+        event : 'Event'
+            The Event object with order information.
+
+        Raises
+        ------
+        RuntimeError
+            If the handler is not connected.
+
+        Returns
+        -------
+        'Future'
+            Resolves to the id of the order (see place_order), or None
+            if the event is not an order.
+
+        """
+
+        if event.type != EventType.ORDER:
+            return None
+        if self.loop is None:
+            raise RuntimeError(
+                "AsyncIBExecution is not connected, call start() first"
+            )
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            future = self.loop.create_task(self.place_order(event))
+        else:
+            future = asyncio.run_coroutine_threadsafe(
+                self.place_order(event), self.loop
+            )
+        future.add_done_callback(self._report_failure)
+        return future
+
+
+    def _report_failure(self, future):
+        """
+        Counts and prints the error of an order scheduled by 
+        execute_order, if it failed.
+
+        """
+
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.orders_failed += 1
+            print("AsyncIBExecution: %s" % error)
+
+
+    async def _read_replies(self, reader):
+        """
+        Decodes the messages from TWS into the callbacks of the 
+        wrapper as they arrive.
+
+        """
+
+        decoder = self.client.decoder
+        while True:
+            try:
+                fields = await read_fields(reader)
+            except asyncio.IncompleteReadError:
+                break
+            decoder.interpret(fields)
+
+
+    def _handle_next_valid_id(self, order_id):
+        """
+        Starts the order ids at the first id TWS will accept.
+
+        """
+
+        if not self._next_valid_id.done():
+            self._next_valid_id.set_result(order_id)
+
+
+    def _acknowledge(self, order_id):
+        """
+        Acknowledges an order.
+
+        """
+
+        ack = self._acks.pop(order_id, None)
+        if ack is not None and not ack.done():
+            ack.set_result(order_id)
+
+
+    def _handle_error(self, req_id, error_code, error_string):
+        """
+        Rejects an order, or prints an error that is not about one.
+
+        """
+
+        ack = self._acks.pop(req_id, None)
+        if ack is not None and not ack.done():
+            self.fill_dict.pop(req_id, None)
+            ack.set_exception(IBOrderError(req_id, error_code, error_string))
+            return
+        print("Server Error: %s, %s, %s" % (req_id, error_code, error_string))
+
+
+    def _handle_order_status(self, order_id, status, filled, remaining,
+                             avg_price):
+        """
+        Acknowledges an order and creates a FillEvent for the quantity
+        filled since its last status, at the average price of that
+        quantity. Repeated statuses do not create additional fills.
+
+        """
+
+        self._acknowledge(order_id)
+        fd = self.fill_dict.get(order_id)
+        if fd is None:
+            return
+        filled = float(filled)
+        quantity = filled - fd['filled']
+        if quantity <= 0:
+            return
+
+        fill_cost = (
+            avg_price * filled - fd['avg_fill_price'] * fd['filled']
+        ) / quantity
+        fd['filled'] = filled
+        fd['avg_fill_price'] = avg_price
+
+        fill = FillEvent(
+            datetime.datetime.utcnow(), fd['symbol'], fd['exchange'],
+            int(quantity) if quantity.is_integer() else quantity,
+            fd['direction'], fill_cost
+        )
+        self.events.put(fill)
+        if self.on_fill is not None:
+            self.on_fill(fill)
+        if float(remaining) == 0:
+            del self.fill_dict[order_id]
+
+
+
+class MockTWSServer(object):
+    """
+    A local stand-in for Trader Workstation that speaks the wire 
+    protocol of the TWS API (length-prefixed messages of NUL-terminated
+    fields), so that ibapi clients such as AsyncIBExecution can be 
+    tested offline.
+
+    A client connecting with the "API" handshake is sent the server
+    version, the newest that both it and the mock support, and, once it
+    starts the API, a nextValidId. The fields of its messages are laid
+    out for that version, and a placeOrder that does not match the 
+    layout raises a ValueError and closes the connection. Each 
+    placeOrder
+    is acknowledged at once with an orderStatus of 'Submitted' (TWS 
+    also sends an openOrder, which the mock omits), and then filled 
+    after 'fill_delay' seconds in 'partial_fills' equal orderStatus 
+    updates, at the price of its symbol in 'prices' (or its limit 
+    price). An order whose id is not above the last id of its client is
+    rejected with error 103, as TWS does for duplicate ids.
+    """
+
+    SERVER_VERSION = MAX_CLIENT_VER
+
+    def __init__(self, host='127.0.0.1', port=0, prices=None,
+                 fill_delay=0.0, partial_fills=1, next_valid_id=1):
+        """
+        Initializes the server.
+
+        Parameters
+        ----------
+        host : 'str', optional
+            The host to listen on. The default is '127.0.0.1'.
+        port : 'int', optional
+            The port to listen on. The default is 0, i.e. any free port.
+        prices : 'dict', optional
+            The fill price of each symbol. The default is None, i.e.
+            100.0 for every symbol.
+        fill_delay : 'float', optional
+            The seconds between acknowledging and filling an order. The
+            default is 0.0.
+        partial_fills : 'int', optional
+            The number of fills each order is split into. The default
+            is 1.
+        next_valid_id : 'int', optional
+            The first order id sent to clients. The default is 1.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.host = host
+        self.port = port
+        self.prices = prices or {}
+        self.fill_delay = fill_delay
+        self.partial_fills = partial_fills
+        self.next_valid_id = next_valid_id
+
+        self.orders_received = 0
+        self._server = None
+        self._tasks = set()
+
+
+    async def start(self):
+        """
+        Starts listening, setting the port if it was 0.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+
+    async def stop(self):
+        """
+        Stops listening and cancels the fills not yet sent.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        for task in list(self._tasks):
+            task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+
+    def _send(self, writer, *fields):
+        writer.write(make_message(*fields))
+
+
+    def _send_status(self, writer, version, order_id, status, filled,
+                     remaining, price):
+        """
+        Sends an orderStatus message, as laid out at a server version.
+
+        """
+
+        fields = [
+            order_id, status, filled, remaining, price, 0, 0, price, 0, ""
+        ]
+        if version < MIN_SERVER_VER_MARKET_CAP_PRICE:
+            fields.insert(0, 6)
+        else:
+            fields.append(0.0)
+        self._send(writer, IN.ORDER_STATUS, *fields)
+
+
+    def _place_order_layout(self, version):
+        """
+        Returns the positions of the order id, symbol, security type,
+        action, quantity, order type and limit price in a placeOrder 
+        message at a server version, following EClient.placeOrder.
+
+        """
+
+        i = 1
+        if version < MIN_SERVER_VER_ORDER_CONTAINER:
+            i += 1  # The message version
+        order_id = i
+        i += 1
+        if version >= MIN_SERVER_VER_PLACE_ORDER_CONID:
+            i += 1  # The conId
+        symbol = i
+
+        # The symbol, secType, lastTradeDateOrContractMonth, strike, 
+        # right, multiplier, exchange, primaryExchange, currency and 
+        # localSymbol
+        i += 10
+        if version >= MIN_SERVER_VER_TRADING_CLASS:
+            i += 1
+        if version >= MIN_SERVER_VER_SEC_ID_TYPE:
+            i += 2
+        return order_id, symbol, symbol + 1, i, i + 1, i + 2, i + 3
+
+
+    def _read_place_order(self, fields, layout):
+        """
+        Returns the order id, symbol, quantity and limit price (or 
+        None) of a placeOrder message.
+
+        Raises
+        ------
+        ValueError
+            If the message does not match the layout.
+
+        """
+
+        order_id, symbol, sec_type, action, quantity, order_type, limit = (
+            layout
+        )
+        if (len(fields) <= limit or fields[action] not in ('BUY', 'SELL')
+                or not fields[sec_type].isalpha()
+                or not fields[order_type].isalpha()):
+            raise ValueError(
+                "placeOrder does not match the layout of its server "
+                "version: %s" % fields[:limit + 1]
+            )
+        return (
+            int(fields[order_id]), fields[symbol],
+            int(float(fields[quantity])),
+            float(fields[limit]) if fields[limit] else None
+        )
+
+
+    async def _handle_client(self, reader, writer):
+        """
+        Serves one client connection.
+
+        """
+
+        try:
+            if await reader.readexactly(4) != b"API\0":
+                writer.close()
+                return
+            # Agree on the newest version that both sides support
+            versions = (await read_message(reader)).decode()
+            low, high = versions.split()[0][1:].split("..")
+            version = min(int(high), self.SERVER_VERSION)
+            if version < int(low):
+                raise ValueError("Unsupported client versions %s" % versions)
+            self._send(writer, version, time.strftime("%Y%m%d %H:%M:%S"))
+            layout = self._place_order_layout(version)
+
+            last_id = self.next_valid_id - 1
+            while True:
+                fields = [f.decode() for f in await read_fields(reader)]
+                msg_id = int(fields[0])
+                if msg_id == OUT.START_API:
+                    self._send(writer, IN.NEXT_VALID_ID, 1, self.next_valid_id)
+                if msg_id != OUT.PLACE_ORDER:
+                    continue
+
+                self.orders_received += 1
+                order_id, symbol, quantity, limit = self._read_place_order(
+                    fields, layout
+                )
+                if order_id <= last_id:
+                    self._send(
+                        writer, IN.ERR_MSG, 2, order_id, 103, 
+                        "Duplicate order id"
+                    )
+                    continue
+                last_id = order_id
+
+                self._send_status(
+                    writer, version, order_id, 'Submitted', 0, quantity, 0.0
+                )
+                task = asyncio.ensure_future(self._fill(
+                    writer, version, order_id, symbol, quantity, limit
+                ))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def _fill(self, writer, version, order_id, symbol, quantity,
+                    limit):
+        """
+        Sends the orderStatus updates that fill an order.
+
+        """
+
+        if self.fill_delay:
+            await asyncio.sleep(self.fill_delay)
+        price = limit if limit is not None else self.prices.get(symbol, 100.0)
+        parts = max(1, min(self.partial_fills, quantity))
+        for k in range(1, parts + 1):
+            filled = quantity * k // parts
+            self._send_status(
+                writer, version, order_id,
+                'Filled' if filled == quantity else 'PartiallyFilled',
+                filled, quantity - filled, price
+            )
+            await writer.drain()
+
+
+
+async def _throughput_demo(num_orders=10000, partial_fills=2):
+    """
+    Sends a burst of orders to a MockTWSServer and reports the rate at
+    which they are acknowledged and filled.
+
+    """
+
+    from event import OrderEvent
+    try:
+        import Queue as queue
+    except ImportError:
+        import queue
+
+    server = MockTWSServer(partial_fills=partial_fills)
+    await server.start()
+
+    events = queue.Queue()
+    done = asyncio.Event()
+    filled = [0]
+
+    def on_fill(fill):
+        filled[0] += fill.quantity
+        if filled[0] == num_orders * 100:
+            done.set()
+
+    handler = AsyncIBExecution(events, port=server.port, on_fill=on_fill)
+    await handler.connect()
+
+    orders = [
+        OrderEvent('AAPL', 'MKT', 100, 'BUY' if i % 2 else 'SELL')
+        for i in range(num_orders)
+    ]
+    start = time.perf_counter()
+    acks = await asyncio.gather(*[handler.place_order(o) for o in orders])
+    acked = time.perf_counter() - start
+    await done.wait()
+    elapsed = time.perf_counter() - start
+
+    print("Orders: %s, first id %s, last id %s" % (
+        num_orders, acks[0], acks[-1]
+    ))
+    print("Acknowledged: %.0f orders/sec" % (num_orders / acked))
+    print("Filled: %.0f orders/sec (%s fill events)" % (
+        num_orders / elapsed, events.qsize()
+    ))
+
+    await handler.disconnect()
+    await server.stop()
+
+
+
+if __name__ == "__main__":
+    asyncio.run(_throughput_demo())
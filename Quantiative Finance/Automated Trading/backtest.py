@@ -9,12 +9,15 @@ Created on Mon May  4 16:03:47 2020
 
 import datetime
 import pprint
+import time
+
 try:
     import Queue as queue
 except ImportError:
     import queue
-    
-import time
+
+from event import EventType
+from event_bus import EventBus
 
 class Backtest(object):
     """
@@ -41,12 +44,34 @@ class Backtest(object):
     the correct component depending upon the event. Thus, the 
     Event Queue is continaully being populated and depopulated with
     events.
+    
+    Since a backtest is single-threaded, the Event Queue is a 
+    lock-free EventBus and each event is routed to its handler via 
+    a dispatch table indexed by the event type, rather than a chain 
+    of string comparisons. A component that puts events from another
+    thread (e.g. the fills of AsyncIBExecution) needs a thread-safe
+    queue.Queue instead, which can be given as 'events'; events put 
+    onto it from outside the loop are handled at the next heartbeat.
+    
+    Any of the Strategy, Portfolio and ExecutionHandler may define an
+    end_of_bar() method, which is called once all of the events of a
+    heartbeat have been handled. Components use it to act on 
+    everything that happened within the bar at once (e.g. netting the
+    orders of several strategies); any events it generates are handled
+    within the same heartbeat. They may also define start() and stop()
+    methods, which are called before the first heartbeat and once the
+    backtest has ended, e.g. to connect to and disconnect from a 
+    broker, or to report work left undone. An ExecutionHandler with a
+    set_portfolio() method is passed the Portfolio once both are built.
     """
     
     def __init__(
             self, csv_dir, symbol_list, initial_capital, 
             heartbeat, start_date, data_handler, 
-            execution_handler, portfolio, strategy
+            execution_handler, portfolio, strategy,
+            strategy_params_dict=None, progress_every=None,
+            stopping_rules=None, execution_params_dict=None,
+            portfolio_params_dict=None, events=None
             ):
         """
         
@@ -71,6 +96,23 @@ class Backtest(object):
             Keeps track of portfolio current and prior positions.
         strategy : 'Strategy'
             Generates signals based on market data.
+        strategy_params_dict : 'dict', optional
+            Keyword arguments passed to the Strategy. The default is None.
+        progress_every : 'int', optional
+            Print the heartbeat count every progress_every heartbeats.
+            The default is None, i.e. no progress reporting.
+        stopping_rules : 'list', optional
+            StoppingRule objects checked every heartbeat, any of which
+            can end the backtest early. The default is None.
+        execution_params_dict : 'dict', optional
+            Keyword arguments passed to the ExecutionHandler, e.g. its
+            slippage model. The default is None.
+        portfolio_params_dict : 'dict', optional
+            Keyword arguments passed to the Portfolio, e.g. its position
+            sizer and risk gate. The default is None.
+        events : 'Queue', optional
+            The Event Queue. The default is None, i.e. an EventBus, 
+            which must not be shared between threads.
 
         Returns
         -------
@@ -83,25 +125,58 @@ class Backtest(object):
         self.initial_capital = initial_capital
         self.heartbeat = heartbeat
         self.start_date = start_date
+        self.progress_every = progress_every
+        self.stopping_rules = list(stopping_rules or [])
         
         self.data_handler_cls = data_handler
         self.execution_handler_cls = execution_handler
         self.portfolio_cls = portfolio
         self.strategy_cls = strategy
         
-        self.events = queue.Queue()
+        self.events = EventBus() if events is None else events
         
         self.signals = 0
         self.orders = 0
         self.fills = 0
         self.num_strates = 1
+        self.heartbeats = 0
+        self.stop_reason = None
         
-        self._generate_trading_instances()
+        self._generate_trading_instances(
+            strategy_params_dict, execution_params_dict,
+            portfolio_params_dict
+        )
+        self._dispatch = self._create_dispatch_table()
+        if isinstance(self.events, EventBus):
+            self._drain_events = self._drain_event_bus
+        else:
+            self._drain_events = self._drain_event_queue
+        components = (self.strategy, self.portfolio, self.execution_handler)
+        self._end_of_bar = [
+            c.end_of_bar for c in components if hasattr(c, 'end_of_bar')
+        ]
+        self._start = [c.start for c in components if hasattr(c, 'start')]
+        self._stop = [c.stop for c in components if hasattr(c, 'stop')]
         
         
-    def _generate_trading_instances(self, strategy_params_dict):
+    def _generate_trading_instances(self, strategy_params_dict=None,
+                                    execution_params_dict=None,
+                                    portfolio_params_dict=None):
         """
         Generates the trading instance objects from their class types.
+        An ExecutionHandler that sets uses_bars is also passed the 
+        DataHandler.
+
+        Parameters
+        ----------
+        strategy_params_dict : 'dict', optional
+            Keyword arguments passed to the Strategy. The default is None.
+        execution_params_dict : 'dict', optional
+            Keyword arguments passed to the ExecutionHandler. The 
+            default is None.
+        portfolio_params_dict : 'dict', optional
+            Keyword arguments passed to the Portfolio. The default is 
+            None.
 
         Returns
         -------
@@ -115,11 +190,115 @@ class Backtest(object):
         
         self.data_handler = self.data_handler_cls(self.events, self.csv_dir, 
                                                   self.symbol_list)
-        self.strategy = self.strategy_cls(self.data_handler, self.events, **strategy_params_dict)
+        self.strategy = self.strategy_cls(self.data_handler, self.events, 
+                                          **(strategy_params_dict or {}))
         self.portfolio = self.portfolio_cls(self.data_handler, self.events,
                                             self.start_date, 
-                                            self.initial_capital)
-        self.execution_handler = self.execution_handler_cls(self.events)
+                                            self.initial_capital,
+                                            **(portfolio_params_dict or {}))
+        execution_params = execution_params_dict or {}
+        if getattr(self.execution_handler_cls, 'uses_bars', False):
+            self.execution_handler = self.execution_handler_cls(
+                self.events, self.data_handler, **execution_params
+            )
+        else:
+            self.execution_handler = self.execution_handler_cls(
+                self.events, **execution_params
+            )
+        if hasattr(self.execution_handler, 'set_portfolio'):
+            self.execution_handler.set_portfolio(self.portfolio)
+        
+        
+    def _create_dispatch_table(self):
+        """
+        Maps each event type onto the method that handles it.
+
+        Returns
+        -------
+        'list'
+            The handler methods, indexed by EventType.
+
+        """
+        
+        table = [None] * len(EventType)
+        table[EventType.MARKET] = self._handle_market_event
+        table[EventType.SIGNAL] = self._handle_signal_event
+        table[EventType.ORDER] = self._handle_order_event
+        table[EventType.FILL] = self._handle_fill_event
+        return table
+    
+    
+    def _handle_market_event(self, event):
+        """
+        The ExecutionHandler updates its market, then the Strategy 
+        recalculates its signals and the Portfolio reindexes its time.
+
+        """
+        
+        self.execution_handler.update_market(event)
+        self.strategy.calculate_signals(event)
+        self.portfolio.update_timeindex(event)
+        
+        
+    def _handle_signal_event(self, event):
+        """
+        The Portfolio converts the signal into a set of orders.
+
+        """
+        
+        self.signals += 1
+        self.portfolio.update_signal(event)
+        
+        
+    def _handle_order_event(self, event):
+        """
+        The ExecutionHandler transmits the order to the broker.
+
+        """
+        
+        self.orders += 1
+        self.execution_handler.execute_order(event)
+        
+        
+    def _handle_fill_event(self, event):
+        """
+        The Portfolio updates its positions and holdings.
+
+        """
+        
+        self.fills += 1
+        self.portfolio.update_fill(event)
+        
+        
+    def _drain_event_bus(self):
+        """
+        Handles the events on an EventBus until it is empty.
+
+        """
+        
+        events = self.events
+        dispatch = self._dispatch
+        while events:
+            event = events.popleft()
+            if event is not None:
+                dispatch[event.type](event)
+                
+                
+    def _drain_event_queue(self):
+        """
+        Handles the events on a thread-safe Queue until it is empty.
+
+        """
+        
+        get_event = self.events.get
+        dispatch = self._dispatch
+        while True:
+            try:
+                event = get_event(False)
+            except queue.Empty:
+                break
+            if event is not None:
+                dispatch[event.type](event)
         
         
     def _run_backtest(self):
@@ -136,6 +315,16 @@ class Backtest(object):
         Finally, if a FillEvent is received, the Portfolio will update itself
         to be aware of the new positions.
         
+        All of the events generated by a heartbeat are drained from the
+        Event Queue before the next heartbeat, after which the end_of_bar
+        hooks are called (and any events they generate drained). The 
+        stopping rules are then checked, and the first one to fire ends
+        the backtest, with its reason recorded in stop_reason.
+        
+        The start hooks of the components are called before the first
+        heartbeat, and their stop hooks once the backtest has ended, 
+        however it ended.
+        
 
         Returns
         -------
@@ -143,43 +332,78 @@ class Backtest(object):
 
         """
         
+        for hook in self._start:
+            hook()
+        try:
+            self._heartbeat_loop()
+        finally:
+            for hook in self._stop:
+                hook()
+                
+                
+    def _heartbeat_loop(self):
+        """
+        Runs the heartbeats of the backtest (see _run_backtest) until
+        the data runs out or a stopping rule fires.
+
+        """
+        
+        events = self.events
+        drain_events = self._drain_events
+        data_handler = self.data_handler
+        progress_every = self.progress_every
+        stopping_rules = self.stopping_rules
+        end_of_bar = self._end_of_bar
+        
         i = 0
         while True:
             i += 1
-            print(i)
+            if progress_every and i % progress_every == 0:
+                print("Heartbeat: %s" % i)
+                
             # Update the market bars
-            if self.data_handler.continue_backtest == True:
-                self.data_handler.update_bars()
+            if data_handler.continue_backtest == True:
+                data_handler.update_bars()
             else:
                 break
             
-            # Handle the events
+            # Handle the events, then those generated at the end of 
+            # the bar, until there are none left
             while True:
-                try: 
-                    event = self.events.get(False)
-                except queue.Empty:
+                drain_events()
+                for hook in end_of_bar:
+                    hook()
+                if events.empty():
                     break
-                else:
-                    if event is not None:
-                        if event.type == 'MARKET':
-                            self.strategy.calculate_signals(event)
-                            self.portfolio.update_timeindex(event)
-                            
-                        elif event.type == 'SIGNAL':
-                            self.signals += 1
-                            self.portfolio.update_signal(event)
-                            
-                        elif event.type == 'ORDER':
-                            self.orders += 1
-                            self.execution_handler.execute_order(event)
-                            
-                        elif event.type == 'FILL':
-                            self.fills ++ 1
-                            self.portfolio.update_fill(event)
-                            
-            time.sleep(self.heartbeat)
+                    
+            self.heartbeats = i
+            if stopping_rules and self._check_stopping_rules():
+                break
+                
+            if self.heartbeat:
+                time.sleep(self.heartbeat)
             
             
+    def _check_stopping_rules(self):
+        """
+        Checks each stopping rule in turn, recording the reason given
+        by the first one to fire.
+
+        Returns
+        -------
+        'bool'
+            True if the backtest should stop.
+
+        """
+        
+        for rule in self.stopping_rules:
+            reason = rule.check(self)
+            if reason is not None:
+                self.stop_reason = reason
+                return True
+        return False
+    
+    
     def _output_performance(self):
         """
         Outputs the strategy performance from the backtest.
@@ -202,6 +426,8 @@ class Backtest(object):
         print("Signals: %s" % self.signals)
         print("Orders: %s" % self.orders)
         print("Fills: %s" % self.fills)
+        if self.stop_reason is not None:
+            print("Stopped early: %s" % self.stop_reason)
     
         
     def simulate_trading(self):
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A memory-mapped columnar cache of the CSV files in csv_dir.
+"""
+
+
+import hashlib
+import json
+import os, os.path
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data import CSV_FIELDS, HistoricCSVArrayDataHandler
+
+
+# Version of the on-disk layout, bumped whenever it changes
+CACHE_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Calculates the SHA-1 digest of the contents of a file.
+
+    Parameters
+    ----------
+    path : 'str'
+        The path of the file.
+    chunk_size : 'int', optional
+        The number of bytes hashed at a time. The default is 1MB.
+
+    Returns
+    -------
+    'str'
+        The hexadecimal digest.
+
+    """
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _read_meta(symbol_dir):
+    """
+    Returns the metadata of a cached symbol, or None if the symbol has
+    not been cached (or was only partially written).
+
+    """
+
+    try:
+        with open(os.path.join(symbol_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_meta(symbol_dir, meta):
+    """
+    Atomically writes the metadata of a cached symbol. The metadata is
+    written last, so its presence marks the column files as complete.
+
+    """
+
+    path = os.path.join(symbol_dir, 'meta.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def write_symbol_cache(csv_path, symbol_dir, digest=None):
+    """
+    Parses a symbol's CSV file and writes each of its columns, sorted
+    by date, to its own .npy file. The datetime column is stored as
+    int64 nanoseconds since the epoch and all others as float64.
+
+    Parameters
+    ----------
+    csv_path : 'str'
+        The path of the CSV file.
+    symbol_dir : 'str'
+        The directory the column files are written to.
+    digest : 'str', optional
+        The SHA-1 digest of the CSV file, if already known.
+
+    Returns
+    -------
+    'dict'
+        The metadata written alongside the column files.
+
+    """
+
+    df = pd.read_csv(
+        csv_path, header=0, index_col=0, parse_dates=True,
+        names=('datetime',) + CSV_FIELDS
+    )
+    df.sort_index(inplace=True)
+
+    if not os.path.isdir(symbol_dir):
+        os.makedirs(symbol_dir)
+
+    np.save(
+        os.path.join(symbol_dir, 'datetime.npy'),
+        df.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    )
+    for f in CSV_FIELDS:
+        np.save(
+            os.path.join(symbol_dir, '%s.npy' % f),
+            df[f].to_numpy(dtype=np.float64)
+        )
+
+    stat = os.stat(csv_path)
+    meta = {
+        'version': CACHE_VERSION,
+        'sha1': digest or file_digest(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'num_bars': len(df),
+    }
+    _write_meta(symbol_dir, meta)
+    return meta
+
+
+def ensure_symbol_cache(csv_path, symbol_dir):
+    """
+    Makes sure the cache of a symbol matches the contents of its CSV
+    file, (re)writing it if necessary.
+
+    A cache whose recorded size and modification time match the CSV
+    file is trusted without reading the file. Otherwise the file is
+    hashed, and the columns are only rewritten if its contents have
+    actually changed.
+
+    Parameters
+    ----------
+    csv_path : 'str'
+        The path of the CSV file.
+    symbol_dir : 'str'
+        The directory holding the symbol's column files.
+
+    Returns
+    -------
+    'dict'
+        The metadata of the up-to-date cache.
+
+    """
+
+    meta = _read_meta(symbol_dir)
+    stat = os.stat(csv_path)
+
+    if meta is not None and meta.get('version') == CACHE_VERSION:
+        if (meta['size'] == stat.st_size and
+                meta['mtime_ns'] == stat.st_mtime_ns):
+            return meta
+
+        digest = file_digest(csv_path)
+        if meta['sha1'] == digest:
+            meta['size'] = stat.st_size
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _write_meta(symbol_dir, meta)
+            return meta
+        return write_symbol_cache(csv_path, symbol_dir, digest)
+
+    return write_symbol_cache(csv_path, symbol_dir)
+
+
+def load_symbol_cache(symbol_dir):
+    """
+    Memory-maps the column files of a cached symbol.
+
+    Parameters
+    ----------
+    symbol_dir : 'str'
+        The directory holding the symbol's column files.
+
+    Returns
+    -------
+    'np.ndarray'
+        The int64 timestamps of the symbol's bars.
+    'dict'
+        Read-only, memory-mapped float64 column arrays keyed by field.
+
+    """
+
+    timestamps = np.load(
+        os.path.join(symbol_dir, 'datetime.npy'), mmap_mode='r'
+    )
+    columns = dict(
+        (f, np.load(os.path.join(symbol_dir, '%s.npy' % f), mmap_mode='r'))
+        for f in CSV_FIELDS
+    )
+    return timestamps, columns
+
+
+def build_bar_cache(csv_dir, symbol_list, cache_dir=None):
+    """
+    Converts the CSV files of a list of symbols to the columnar cache,
+    skipping any symbol whose cache is already up to date.
+
+    Parameters
+    ----------
+    csv_dir : 'str'
+        Absolute directory path to the CSV files.
+    symbol_list : 'list'
+        A list of symbol strings.
+    cache_dir : 'str', optional
+        The cache directory. The default is csv_dir/.bar_cache.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    cache_dir = cache_dir or os.path.join(csv_dir, '.bar_cache')
+    for s in symbol_list:
+        ensure_symbol_cache(
+            os.path.join(csv_dir, '%s.csv' % s), os.path.join(cache_dir, s)
+        )
+
+
+
+class HistoricCachedDataHandler(HistoricCSVArrayDataHandler):
+    """
+    HistoricCachedDataHandler is a HistoricCSVArrayDataHandler that
+    reads each symbol from a columnar binary cache of its CSV file
+    rather than parsing the text on every run.
+
+    The first time a symbol is loaded (or whenever its CSV file has
+    changed) its columns are written to one .npy file each. Later runs
+    memory-map those files instead of parsing the CSV files.
+
+    When every symbol has the same timeline, the memory maps are used
+    as the column arrays without copying them (see zero_copy), so that
+    startup costs a stat() per symbol plus the calculation of the 
+    returns, and only the pages touched by the backtest are read. 
+    Otherwise the symbols have to be padded onto the union of their 
+    timelines, and are copied into the in-memory panel of 
+    HistoricCSVArrayDataHandler: every page is then read at startup 
+    and the whole panel is held in RAM, and the cache only saves the 
+    parsing of the CSV files.
+    """
+
+    zero_copy = True
+
+    def __init__(self, events, csv_dir, symbol_list, cache_dir=None):
+        """
+        Initializes the cached historic data handler.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The event queue.
+        csv_dir : 'str'
+            Absolute directory path to the CSV files.
+        symbol_list : 'list'
+            A list of symbol strings.
+        cache_dir : 'str', optional
+            The cache directory. The default is csv_dir/.bar_cache.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.cache_dir = cache_dir or os.path.join(csv_dir, '.bar_cache')
+        super(HistoricCachedDataHandler, self).__init__(
+            events, csv_dir, symbol_list
+        )
+
+
+    def _read_symbol_arrays(self, symbol):
+        """
+        Returns the memory-mapped timestamps and column arrays of a
+        symbol, bringing its cache up to date first.
+
+        """
+
+        symbol_dir = os.path.join(self.cache_dir, symbol)
+        ensure_symbol_cache(
+            os.path.join(self.csv_dir, '%s.csv' % symbol), symbol_dir
+        )
+        return load_symbol_cache(symbol_dir)
+
+
+
+if __name__ == "__main__":
+    # Usage: python bar_cache.py csv_dir [cache_dir]
+    csv_dir = sys.argv[1]
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    symbol_list = sorted(
+        f[:-len('.csv')] for f in os.listdir(csv_dir) if f.endswith('.csv')
+    )
+    build_bar_cache(csv_dir, symbol_list, cache_dir)
+    print("Cached %s symbols" % len(symbol_list))
@@ -8,13 +8,28 @@ Created on Thu Apr 23 15:09:53 2020
 
 
 from abc import ABCMeta, abstractmethod
+from collections import namedtuple
 import datetime
+import heapq
 import os, os.path
 
 import numpy as np
 import pandas as pd
 
-from event import MarketEvent
+from event import MARKET_EVENT
+from ring_buffer import RingBuffer
+
+
+# Field order of the columns read from each CSV file, and of the columns
+# held for each symbol by the handlers. The "returns" column is derived
+# from adj_close when the files are loaded.
+CSV_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'adj_close')
+BAR_FIELDS = CSV_FIELDS + ('returns',)
+
+# Lightweight record for a single bar, so that getattr(bar[1], val_type)
+# works as it did on the Pandas Series yielded by iterrows.
+Bar = namedtuple('Bar', BAR_FIELDS)
+
 
 
 class DataHandler(object):
@@ -79,6 +94,20 @@ class DataHandler(object):
         
         raise NotImplementedError("Should implement get_latest_bars_values()")
         
+    def get_latest_values(self, val_type):
+        """
+        Returns one of the values of the last bar of every symbol, as
+        an array in the order of symbol_list. 
+        
+        This default looks up each symbol in turn. Array-backed data 
+        handlers override it with a single slice of their data.
+
+        """
+        
+        return np.array([
+            self.get_latest_bar_value(s, val_type) for s in self.symbol_list
+        ], dtype=np.float64)
+        
     @abstractmethod
     def update_bars(self):
         """
@@ -104,13 +133,17 @@ class HistoricCSVDataHandler(DataHandler):
     accessed by other methods.
     """
     
-    def __init__(self, events, csv_dir, symbol_list):
+    def __init__(self, events, csv_dir, symbol_list, max_lookback=1000):
         """
         Initializes the historic data handler by requesting the location
         of the CSV files and a list of symbols.
         
         It will be assumed that all files are of the form 'symbol.csv' where
         symbol is a string in symbol_list/
+        
+        Only the last max_lookback bars of each symbol are retained. They
+        are held in a preallocated ring buffer per symbol and per field, so
+        memory use does not grow with the length of the backtest.
 
         Parameters
         ----------
@@ -120,6 +153,9 @@ class HistoricCSVDataHandler(DataHandler):
             Absolute directory path to the CSB files.
         symbol_list : 'list'
             A list of symbol strings.
+        max_lookback : 'int', optional
+            The largest N that can be requested from get_latest_bars.
+            The default is 1000.
 
         Returns
         -------
@@ -130,9 +166,11 @@ class HistoricCSVDataHandler(DataHandler):
         self.events = events # Queue objects for events queue
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
+        self.max_lookback = max_lookback
         
         self.symbol_data = {}
         self.latest_symbol_data = {}
+        self.latest_symbol_datetimes = {}
         self.continue_backtest = True
         
         self._open_convert_csv_files()
@@ -153,7 +191,7 @@ class HistoricCSVDataHandler(DataHandler):
             # Load the CSV file with no header information, indexed on date
             self.symbol_data[s] = pd.read_csv(
                                     os.path.join(self.csv_dir, '%s.csv' % s),
-                                    header=0, index_col=0, 
+                                    header=0, index_col=0, parse_dates=True,
                                     names=['datetime', 'open', 'high', 'low',
                                            'close', 'volume', 'adj_close']
                                     )
@@ -163,10 +201,15 @@ class HistoricCSVDataHandler(DataHandler):
             if comb_index is None:
                 comb_index = self.symbol_data[s].index
             else:
-                comb_index.union(self.symbol_data[s].index)
+                comb_index = comb_index.union(self.symbol_data[s].index)
                 
-            # Set the latest symbol_data to None
-            self.latest_symbol_data[s] = []
+            # Preallocate the ring buffers for the latest symbol data
+            self.latest_symbol_data[s] = dict(
+                (f, RingBuffer(self.max_lookback)) for f in BAR_FIELDS
+            )
+            self.latest_symbol_datetimes[s] = RingBuffer(
+                self.max_lookback, dtype=object
+            )
             
     
         for s in self.symbol_list:
@@ -190,33 +233,33 @@ class HistoricCSVDataHandler(DataHandler):
             
     def get_latest_bar(self, symbol):
         """
-        Returns the last bara from the latest_symbol_list.
+        Returns the last bar from the latest_symbol_data as a 
+        (datetime, Bar) tuple.
 
         """
         
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1]
+        return self.get_latest_bars(symbol, N=1)[-1]
         
         
     def get_latest_bars(self, symbol, N=1):
         """
-        Returns the last N bars from the latest_symbol list or 
-        N-k if less available.
+        Returns the last N bars from the latest_symbol_data as 
+        (datetime, Bar) tuples, or N-k if less available.
 
         """
         
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            fields = self.latest_symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-N:]
+            datetimes = self.latest_symbol_datetimes[symbol].latest(N)
+            columns = [fields[f].latest(N) for f in BAR_FIELDS]
+            return [
+                (dt, Bar(*values)) 
+                for dt, values in zip(datetimes, zip(*columns))
+            ]
         
     def get_latest_bar_datetime(self, symbol):
         """
@@ -225,43 +268,46 @@ class HistoricCSVDataHandler(DataHandler):
         """
         
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            datetimes = self.latest_symbol_datetimes[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-1][0]
+            return datetimes.last()
         
     
     def get_latest_bar_value(self, symbol, val_type):
         """
         Returns one of the Open, High, Low, Close, Volume, or OI values
-        from the Pandas Bar series object.
+        from the last bar.
 
         """
         
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            fields = self.latest_symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
-        return getattr(bars_list[-1][1], val_type)
+        return fields[val_type].last()
     
     
     def get_latest_bars_values(self, symbol, val_type, N=1):
         """ 
-        Returns the last N bar values from the latest_symbol list, or
-        N-k if less available.
+        Returns the last N bar values from the latest_symbol_data, or
+        N-k if less available. 
+        
+        The values are a read-only, zero-copy view onto the ring buffer,
+        so the cost does not depend on N.
         
         """
         
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            fields = self.latest_symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            return fields[val_type].latest(N)
         
     
     def update_bars(self):
@@ -282,10 +328,559 @@ class HistoricCSVDataHandler(DataHandler):
                 self.continue_backtest = False
             else:
                 if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
+                    fields = self.latest_symbol_data[s]
+                    for f in BAR_FIELDS:
+                        fields[f].append(bar[1][f])
+                    self.latest_symbol_datetimes[s].append(bar[0])
+                    
+        self.events.put(MARKET_EVENT)
+        
+        
+        
+        
+class HistoricCSVArrayDataHandler(DataHandler):
+    """
+    HistoricCSVArrayDataHandler reads the same 'symbol.csv' files as
+    HistoricCSVDataHandler but holds each symbol in contiguous NumPy
+    arrays rather than a Pandas iterrows generator.
+    
+    All symbols are aligned to the union of their timelines and held 
+    in a single float64 panel of shape (bars x symbols x fields), with
+    the timestamps stored once as an int64 array of nanoseconds. Each
+    symbol's field is a (strided) column view onto the panel. Instead
+    of yielding a new Pandas Series for every bar, update_bars simply
+    advances a cursor. The "latest" bars are therefore the first 
+    'cursor' rows of each column and any window of them can be 
+    returned as a zero-copy slice.
+    
+    Building the panel copies every column. A subclass whose columns 
+    are already held elsewhere (e.g. memory-mapped from a cache) can 
+    set zero_copy, in which case symbols that all share the same 
+    timeline are used as they are and no panel is built. The values of
+    the latest bar of every symbol are then gathered from the columns 
+    rather than sliced from the panel.
+    
+    The interface is identical to HistoricCSVDataHandler so it can be
+    passed to the Backtest in its place.
+    """
+    
+    # Whether to use the columns as read when no padding is needed
+    zero_copy = False
+    
+    def __init__(self, events, csv_dir, symbol_list):
+        """
+        Initializes the array-backed historic data handler by requesting
+        the location of the CSV files and a list of symbols.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The event queue.
+        csv_dir : 'str'
+            Absolute directory path to the CSV files.
+        symbol_list : 'list'
+            A list of symbol strings.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.events = events
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        
+        self.symbol_data = {}
+        self.panel = None
+        self.timestamps = None
+        self.continue_backtest = True
+        
+        self._cursor = 0
+        self._open_convert_csv_files()
+        self._index = pd.DatetimeIndex(self.timestamps)
+        self._num_bars = len(self.timestamps)
+        
+        
+    def _read_symbol_arrays(self, symbol):
+        """
+        Reads the CSV file of a symbol, sorted by date, as an int64 
+        array of nanosecond timestamps and a dictionary of float64 
+        column arrays keyed by field name.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The symbol to read.
+
+        Returns
+        -------
+        'np.ndarray'
+            The timestamps of the symbol's bars.
+        'dict'
+            The symbol's column arrays.
+
+        """
+        
+        df = pd.read_csv(
+            os.path.join(self.csv_dir, '%s.csv' % symbol),
+            header=0, index_col=0, parse_dates=True,
+            names=('datetime',) + CSV_FIELDS
+        )
+        df.sort_index(inplace=True)
+        
+        timestamps = df.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        columns = dict(
+            (f, df[f].to_numpy(dtype=np.float64)) for f in CSV_FIELDS
+        )
+        return timestamps, columns
+    
+    
+    def _open_convert_csv_files(self):
+        """
+        Reads every symbol with _read_symbol_arrays and aligns them all
+        to the union of their timelines in a (bars x symbols x fields)
+        panel. A symbol with no bar at a given time has its last known
+        bar padded forward, and is NaN before its first bar. 
+        
+        The padding of every symbol and field is done in a single 
+        vectorized gather, rather than by reindexing one frame per 
+        symbol. The timeline is stored once as an int64 array of 
+        nanoseconds since the epoch.
+        
+        With zero_copy set, symbols that all have the same timeline are
+        not copied into a panel: their column arrays are used as they 
+        are, and only the returns are calculated.
+
+        """
+        
+        raw = [self._read_symbol_arrays(s) for s in self.symbol_list]
+        comb_index = np.unique(np.concatenate([r[0] for r in raw]))
+        self.timestamps = comb_index
+        
+        aligned = all(np.array_equal(r[0], comb_index) for r in raw)
+        if self.zero_copy and aligned:
+            for s, (_, columns) in zip(self.symbol_list, raw):
+                columns = dict(columns)
+                adj_close = columns['adj_close']
+                returns = np.empty(len(adj_close))
+                returns[:1] = np.nan
+                returns[1:] = adj_close[1:] / adj_close[:-1] - 1.0
+                columns['returns'] = returns
+                self.symbol_data[s] = columns
+            return
+        
+        num_bars = len(comb_index)
+        num_symbols = len(self.symbol_list)
+        panel = np.full((num_bars, num_symbols, len(BAR_FIELDS)), np.nan)
+        present = np.zeros((num_bars, num_symbols), dtype=bool)
+        
+        # Scatter each symbol's bars onto the combined timeline
+        for i, (timestamps, columns) in enumerate(raw):
+            rows = np.searchsorted(comb_index, timestamps)
+            present[rows, i] = True
+            for j, f in enumerate(CSV_FIELDS):
+                panel[rows, i, j] = columns[f]
+                
+        # Index of the last bar at or before each row, for every symbol
+        last = np.where(present, np.arange(num_bars)[:, np.newaxis], -1)
+        np.maximum.accumulate(last, axis=0, out=last)
+        panel = panel[last, np.arange(num_symbols)]
+        panel[last < 0] = np.nan
+        
+        adj_close = panel[:, :, BAR_FIELDS.index('adj_close')]
+        returns = panel[:, :, BAR_FIELDS.index('returns')]
+        returns[0] = np.nan
+        returns[1:] = adj_close[1:] / adj_close[:-1] - 1.0
+        
+        self.panel = panel
+        for i, s in enumerate(self.symbol_list):
+            self.symbol_data[s] = dict(
+                (f, panel[:, i, j]) for j, f in enumerate(BAR_FIELDS)
+            )
+        
+        
+    def _get_symbol_data(self, symbol):
+        """
+        Returns the column arrays for a symbol, reporting unknown 
+        symbols in the same manner as HistoricCSVDataHandler.
+
+        """
+        
+        try:
+            return self.symbol_data[symbol]
+        except KeyError:
+            print("That symbol is not available in the historical data set.")
+            raise
+            
+            
+    def _latest_index(self):
+        """
+        Returns the row of the last bar, raising an IndexError before
+        the first bar, as HistoricCSVDataHandler does.
+
+        """
+        
+        if self._cursor == 0:
+            raise IndexError("No bars have been released yet")
+        return self._cursor - 1
+            
+            
+    def get_latest_bar(self, symbol):
+        """
+        Returns the last bar as a (datetime, Bar) tuple.
+
+        """
+        
+        columns = self._get_symbol_data(symbol)
+        i = self._latest_index()
+        return (
+            self._index[i], Bar(*[columns[f][i] for f in BAR_FIELDS])
+        )
+    
+    
+    def get_latest_bars(self, symbol, N=1):
+        """
+        Returns the last N bars as (datetime, Bar) tuples, or N-k if
+        less available.
+
+        """
+        
+        columns = self._get_symbol_data(symbol)
+        start = max(self._cursor - N, 0)
+        return [
+            (self._index[i], Bar(*[columns[f][i] for f in BAR_FIELDS]))
+            for i in range(start, self._cursor)
+        ]
+    
+    
+    def get_latest_bar_datetime(self, symbol):
+        """
+        Returns a Python datetime object for the last bar.
+
+        """
+        
+        self._get_symbol_data(symbol)
+        return self._index[self._latest_index()]
+    
+    
+    def get_latest_bar_value(self, symbol, val_type):
+        """
+        Returns one of the Open, High, Low, Close, Volume, or OI values
+        for the last bar.
+
+        """
+        
+        column = self._get_symbol_data(symbol)[val_type]
+        return column[self._latest_index()]
+    
+    
+    def get_latest_bars_values(self, symbol, val_type, N=1):
+        """
+        Returns the last N bar values as a read-only view onto the 
+        underlying column array, or N-k if less available.
+
+        """
+        
+        column = self._get_symbol_data(symbol)[val_type]
+        window = column[max(self._cursor - N, 0):self._cursor]
+        window.flags.writeable = False
+        return window
+    
+    
+    def reset(self, events):
+        """
+        Rewinds the cursor to the first bar and attaches a new event
+        queue, so that the loaded arrays can be reused for another 
+        backtest without reading the CSV files again.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The event queue of the next backtest.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.events = events
+        self._cursor = 0
+        self.continue_backtest = True
+        
+        
+    def get_latest_values(self, val_type):
+        """
+        Returns one of the values of the last bar of every symbol as a
+        view onto the panel, in the order of symbol_list (or as a new 
+        array, if there is no panel).
+
+        """
+        
+        i = self._latest_index()
+        if self.panel is None:
+            return np.array([
+                self.symbol_data[s][val_type][i] for s in self.symbol_list
+            ])
+        return self.panel[i, :, BAR_FIELDS.index(val_type)]
+    
+    
+    def get_datetime_index(self):
+        """
+        Returns the full (aligned) bar timeline as a DatetimeIndex.
+
+        """
+        
+        return self._index
+    
+    
+    def get_price_matrix(self, val_type="adj_close"):
+        """
+        Returns the full history of one field for every symbol as a 
+        (bars x symbols) view onto the panel (or stacked copy, if there 
+        is no panel), with columns in the order of symbol_list. This is
+        used by the VectorizedBacktest, which consumes the whole history
+        at once rather than bar by bar.
+
+        """
+        
+        if self.panel is None:
+            return np.column_stack([
+                self.symbol_data[s][val_type] for s in self.symbol_list
+            ])
+        return self.panel[:, :, BAR_FIELDS.index(val_type)]
+    
+    
+    def update_bars(self):
+        """
+        Advances the cursor by one bar for all symbols in the symbol 
+        list and generates a MarketEvent that gets added to the queue.
+
+        """
+        
+        if self._cursor < self._num_bars:
+            self._cursor += 1
+        else:
+            self.continue_backtest = False
+            
+        self.events.put(MARKET_EVENT)
+        
+        
+        
+        
+class HistoricCSVStreamingDataHandler(DataHandler):
+    """
+    HistoricCSVStreamingDataHandler reads the same 'symbol.csv' files
+    as HistoricCSVDataHandler, but streams them from disk in fixed-size
+    chunks instead of loading each file fully into memory.
+    
+    Each symbol's file is read lazily by its own chunked reader. The 
+    readers are merged by timestamp with a heap, and every call to 
+    update_bars consumes all of the bars sharing the next timestamp. 
+    A symbol with no bar at that timestamp has its last bar padded 
+    forward, so the symbols stay aligned to the union of their 
+    timelines exactly as they are in HistoricCSVArrayDataHandler.
+    
+    Peak memory is therefore bounded by chunk_size times the number of
+    symbols, plus the ring buffers holding the last max_lookback bars,
+    rather than by the length of the history.
+    
+    NOTE:
+        Since the files are never held in memory as a whole, they 
+        cannot be sorted and must already be in ascending date order.
+    """
+    
+    def __init__(self, events, csv_dir, symbol_list, chunk_size=100000,
+                 max_lookback=1000):
+        """
+        Initializes the streaming historic data handler.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The event queue.
+        csv_dir : 'str'
+            Absolute directory path to the CSV files.
+        symbol_list : 'list'
+            A list of symbol strings.
+        chunk_size : 'int', optional
+            The number of rows read from a file at a time. The default
+            is 100000.
+        max_lookback : 'int', optional
+            The largest N that can be requested from get_latest_bars.
+            The default is 1000.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.events = events
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.chunk_size = chunk_size
+        self.max_lookback = max_lookback
+        
+        self.latest_symbol_data = dict(
+            (s, dict((f, RingBuffer(max_lookback)) for f in BAR_FIELDS))
+            for s in symbol_list
+        )
+        self.latest_datetimes = RingBuffer(max_lookback, dtype=np.int64)
+        self.continue_backtest = True
+        
+        # The last bar read for each symbol, padded forward until the 
+        # symbol's next bar
+        self._latest_rows = [
+            [np.nan] * len(CSV_FIELDS) for s in symbol_list
+        ]
+        self._bars = heapq.merge(
+            *[self._read_symbol_bars(i, s) for i, s in enumerate(symbol_list)]
+        )
+        self._next_bar = next(self._bars, None)
+        
+        
+    def _read_symbol_bars(self, i, symbol):
+        """
+        Generates the bars of a symbol as (timestamp, symbol index, 
+        values) tuples, reading its file one chunk at a time.
+
+        Parameters
+        ----------
+        i : 'int'
+            The index of the symbol in symbol_list.
+        symbol : 'str'
+            The symbol to read.
+
+        Raises
+        ------
+        ValueError
+            If the file is not in ascending date order.
+
+        """
+        
+        reader = pd.read_csv(
+            os.path.join(self.csv_dir, '%s.csv' % symbol),
+            header=0, index_col=0, parse_dates=True,
+            names=('datetime',) + CSV_FIELDS, chunksize=self.chunk_size
+        )
+        
+        last = None
+        with reader:
+            for chunk in reader:
+                timestamps = chunk.index.to_numpy(
+                    dtype='datetime64[ns]').view(np.int64)
+                if len(timestamps) == 0:
+                    continue
+                if ((last is not None and timestamps[0] < last) or 
+                        np.any(np.diff(timestamps) < 0)):
+                    raise ValueError(
+                        "%s.csv is not in ascending date order" % symbol
+                    )
+                last = timestamps[-1]
+                
+                values = chunk.to_numpy(dtype=np.float64).tolist()
+                for t, row in zip(timestamps.tolist(), values):
+                    yield t, i, row
                     
-        self.events.put(MarketEvent())
+                    
+    def _get_symbol_data(self, symbol):
+        """
+        Returns the ring buffers of a symbol, reporting unknown symbols
+        in the same manner as HistoricCSVDataHandler.
+
+        """
+        
+        try:
+            return self.latest_symbol_data[symbol]
+        except KeyError:
+            print("That symbol is not available in the historical data set.")
+            raise
+            
+            
+    def get_latest_bar(self, symbol):
+        """
+        Returns the last bar as a (datetime, Bar) tuple.
+
+        """
+        
+        return self.get_latest_bars(symbol, N=1)[-1]
+    
+    
+    def get_latest_bars(self, symbol, N=1):
+        """
+        Returns the last N bars as (datetime, Bar) tuples, or N-k if
+        less available.
+
+        """
         
+        fields = self._get_symbol_data(symbol)
+        datetimes = pd.DatetimeIndex(self.latest_datetimes.latest(N))
+        columns = [fields[f].latest(N) for f in BAR_FIELDS]
+        return [
+            (dt, Bar(*values)) 
+            for dt, values in zip(datetimes, zip(*columns))
+        ]
+    
+    
+    def get_latest_bar_datetime(self, symbol):
+        """
+        Returns a Python datetime object for the last bar.
+
+        """
         
+        self._get_symbol_data(symbol)
+        return pd.Timestamp(self.latest_datetimes.last())
+    
+    
+    def get_latest_bar_value(self, symbol, val_type):
+        """
+        Returns one of the Open, High, Low, Close, Volume, or OI values
+        for the last bar.
+
+        """
         
-    
\ No newline at end of file
+        return self._get_symbol_data(symbol)[val_type].last()
+    
+    
+    def get_latest_bars_values(self, symbol, val_type, N=1):
+        """
+        Returns the last N bar values as a read-only view onto the ring
+        buffer, or N-k if less available.
+
+        """
+        
+        return self._get_symbol_data(symbol)[val_type].latest(N)
+    
+    
+    def update_bars(self):
+        """
+        Consumes every bar with the next timestamp from the merged 
+        readers, pushes the latest bar of every symbol onto the ring
+        buffers and generates a MarketEvent that gets added to the 
+        queue.
+
+        """
+        
+        bar = self._next_bar
+        if bar is None:
+            self.continue_backtest = False
+        else:
+            timestamp = bar[0]
+            while bar is not None and bar[0] == timestamp:
+                self._latest_rows[bar[1]] = bar[2]
+                bar = next(self._bars, None)
+            self._next_bar = bar
+            
+            adj_close = CSV_FIELDS.index('adj_close')
+            for s, row in zip(self.symbol_list, self._latest_rows):
+                fields = self.latest_symbol_data[s]
+                prev = fields['adj_close'].last() if len(
+                    fields['adj_close']) else np.nan
+                for f, value in zip(CSV_FIELDS, row):
+                    fields[f].append(value)
+                fields['returns'].append(row[adj_close] / prev - 1.0)
+            self.latest_datetimes.append(timestamp)
+            
+        self.events.put(MARKET_EVENT)
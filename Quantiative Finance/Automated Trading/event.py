@@ -7,15 +7,39 @@ Created on Thu Apr 23 10:15:49 2020
 """
 
 
+from enum import IntEnum
+
+import numpy as np
+
+
+class EventType(IntEnum):
+    """
+    Integer tags identifying the type of an Event. The values are 
+    contiguous from zero so that they can index a dispatch table.
+    
+    """
+    
+    MARKET = 0
+    SIGNAL = 1
+    ORDER = 2
+    FILL = 3
+
+
+
+
 class Event(object):
     """
     Event is base class providing an interface for all subsequent
     (inherited) events, that will trigger events in the trading 
     infrastructure
     
+    Events declare __slots__ so that they carry no per-instance 
+    dictionary, and hold their EventType as a class attribute rather
+    than storing it on every instance.
+    
     """
     
-    pass
+    __slots__ = ()
 
 
 
@@ -25,18 +49,33 @@ class MarketEvent(Event):
     Handles the event of recieving a new market update with 
     corresponding bars
     
+    A MarketEvent carries no payload, so a single instance is shared
+    by every market update. Calling MarketEvent() returns that 
+    instance, which is also available as MARKET_EVENT.
+    
     """
     
-    def __init__(self):
+    __slots__ = ()
+    type = EventType.MARKET
+    _instance = None
+    
+    def __new__(cls):
         """
-        Initializes the MarketEvent
+        Returns the shared MarketEvent, creating it on first use.
 
         Returns
         -------
-        None.
+        'MarketEvent'
+            The shared MarketEvent instance.
 
         """
-        self.type = 'MARKET'
+        
+        if cls._instance is None:
+            cls._instance = super(MarketEvent, cls).__new__(cls)
+        return cls._instance
+
+
+MARKET_EVENT = MarketEvent()
 
 
 
@@ -48,6 +87,11 @@ class SignalEvent(Event):
     
     """
     
+    __slots__ = (
+        'stategy_id', 'symbol', 'datetime', 'signal_type', 'strength'
+    )
+    type = EventType.SIGNAL
+    
     def __init__(self, strategy_id, symbol, datetime, signal_type, strength):
         """
         Initializes the SignalEvent.
@@ -73,7 +117,6 @@ class SignalEvent(Event):
 
         """
         
-        self.type = 'SIGNAL'
         self.stategy_id = strategy_id
         self.symbol = symbol
         self.datetime = datetime
@@ -81,17 +124,31 @@ class SignalEvent(Event):
         self.strength = strength
         
         
+    @property
+    def strategy_id(self):
+        """
+        The unique identifier for the strategy that generated the 
+        signal (stored as 'stategy_id' for compatibility).
+
+        """
+        
+        return self.stategy_id
+        
+        
         
     
 class OrderEvent(Event):
     """
     Handles the event of sending an Order to an execution system. The
     order contains a symbol (e.g. GOOG), a type (market or limit), 
-    quantitiy, and a direction.
+    quantitiy, a direction and, for a limit order, a limit price.
     
     """
     
-    def __init__(self, symbol, order_type, quantity, direction):
+    __slots__ = ('symbol', 'order_type', 'quantity', 'direction', 'price')
+    type = EventType.ORDER
+    
+    def __init__(self, symbol, order_type, quantity, direction, price=None):
         """
         Inititalizes the order type, setting whether it is a Market
         order ('MKT') or Limit order ('LMT'), has a quantity (integral)
@@ -107,6 +164,8 @@ class OrderEvent(Event):
             Non-negative integer for quantity.
         direction : 'str'
             'BUY' or 'SELL' for long or short.
+        price : 'float', optional
+            The limit price of a Limit order. The default is None.
 
         Returns
         -------
@@ -114,11 +173,11 @@ class OrderEvent(Event):
 
         """
         
-        self.type = 'ORDER'
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = self._check_set_quantity_positive(quantity)
         self.direction = direction
+        self.price = price
     
     def _check_set_quantity_positive(self, quantity):
         """
@@ -142,8 +201,11 @@ class OrderEvent(Event):
         """
         
         print(
-            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s" %
-            (self.symbol, self.order_type, self.quantity, self.direction)
+            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s, "
+            "Price=%s" % (
+                self.symbol, self.order_type, self.quantity, self.direction,
+                self.price
+            )
         )
         
         
@@ -155,6 +217,12 @@ class FillEvent(Event):
     In additon, stores the commission of the trade brokerage.
     """
     
+    __slots__ = (
+        'timeindex', 'symbol', 'exchange', 'quantity', 'direction',
+        'fill_cost', 'commission'
+    )
+    type = EventType.FILL
+    
     def __init__(self, timeindex, symbol, exchange, quantity, direction, 
                  fill_cost, commission=None):
         """
@@ -176,8 +244,10 @@ class FillEvent(Event):
             The filled quantity.
         direction : 'str'
             The direciton of the fill ('BUY' or 'SELL).
-        fill_cose : 'float'
-            The holdings value in dollars.
+        fill_cost : 'float'
+            The price per unit at which the order was filled, or None
+            if not known (the Portfolio then books the fill at the 
+            latest bar price).
         commission : 'float', optional
             An optional commission sent from IB. The default is None.
 
@@ -187,7 +257,6 @@ class FillEvent(Event):
 
         """
         
-        self.type = 'FILL'
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
@@ -225,5 +294,31 @@ class FillEvent(Event):
         else: # Greater than 500
             full_cost = max(1.3, 0.008 * self.quantity)
         return full_cost
+
+        
+
+
+def calculate_ib_commissions(quantities):
+    """
+    Vectorized counterpart of FillEvent.calculate_ib_commission, which
+    calculates the Interactive Brokers commission for an array of fill
+    quantities at once. Zero quantities (no trade) incur no commission.
+
+    Parameters
+    ----------
+    quantities : 'np.ndarray'
+        The filled quantities (the sign is ignored).
+
+    Returns
+    -------
+    'np.ndarray'
+        The commission cost of each fill.
+
+    """
     
-    
\ No newline at end of file
+    quantities = np.abs(quantities)
+    full_cost = np.where(
+        quantities <= 500, 0.013 * quantities, 0.008 * quantities
+    )
+    full_cost = np.maximum(1.3, full_cost)
+    return np.where(quantities == 0, 0.0, full_cost)
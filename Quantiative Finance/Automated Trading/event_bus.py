@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A lock-free Event Queue for single-threaded backtests.
+"""
+
+
+from collections import deque
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class EventBus(deque):
+    """
+    A lock-free, first-in-first-out event queue for single-threaded
+    backtests.
+
+    The standard library queue.Queue acquires a lock and notifies a
+    condition variable on every put and get, which is wasted work when
+    a single thread both produces and consumes all of the events. The
+    EventBus is a plain deque that exposes the subset of the Queue
+    interface used by the trading components (put, get, empty and
+    qsize), so it can be handed to a DataHandler, Strategy, Portfolio
+    or ExecutionHandler in place of a Queue.
+
+    The Backtest drains it directly by testing its truthiness and
+    calling popleft, which avoids raising queue.Empty once per
+    heartbeat.
+
+    NOTE:
+        The EventBus must not be shared between threads. Live trading
+        components that receive events from another thread (such as
+        IBExecution) should continue to use queue.Queue.
+    """
+
+    put = deque.append
+    put_nowait = deque.append
+
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns the oldest event on the bus.
+
+        The block and timeout arguments are accepted for compatibility
+        with queue.Queue but are ignored, since no other thread can
+        add an event while this one waits.
+
+        Raises
+        ------
+        queue.Empty
+            If there are no events on the bus.
+
+        """
+
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty
+
+
+    def get_nowait(self):
+        """
+        Removes and returns the oldest event on the bus without
+        blocking.
+
+        """
+
+        return self.get(False)
+
+
+    def empty(self):
+        """
+        Returns True if there are no events on the bus.
+
+        """
+
+        return not self
+
+
+    def qsize(self):
+        """
+        Returns the number of events on the bus.
+
+        """
+
+        return len(self)
@@ -9,12 +9,20 @@ Created on Tue Apr 28 14:27:15 2020
 
 from abc import ABCMeta, abstractmethod
 import datetime
+import heapq
+import itertools
+import math
+import numbers
 try:
     import Queue as queue
 except ImportError:
     import queue
     
-from event import FillEvent, OrderEvent
+import numpy as np
+
+from event import EventType, FillEvent, OrderEvent
+from order_book import OrderBook, RestingOrder
+from position_sizing import RollingVolatility
 
 
 class ExecutionHandler(object):
@@ -56,20 +64,62 @@ class ExecutionHandler(object):
         raise NotImplementedError("Should implement execute_order()")
         
         
+    def update_market(self, event):
+        """
+        Called on every MarketEvent, before the Strategy and Portfolio,
+        so that a simulated market can match its resting orders against
+        the new bars. Does nothing by default.
+
+        Parameters
+        ----------
+        event : 'MarketEvent'
+            The MarketEvent of the new bars.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        pass
+        
+        
 
 class SimulatedExecutionHandler(ExecutionHandler):
     """
     The simulated execution handler simply converts all order
     objects into their equivalnt fill objects automatically without
-    latency, slippage, or fill-ratio issues. 
+    fill-ratio issues. 
     
     This allows a straightforward "first go" test of any strategy, 
     before implementation with a more sophisticated execution handler.
     
-    This handler will simply fill all orders at markt price.
+    By default orders are filled as soon as they are sent. With a 
+    latency, each order is instead held in flight, in a heap ordered by
+    the time it reaches the market, until the simulated clock (the 
+    datetime of the latest bar) passes that time. It is then filled at
+    the prices of that bar. Fills are timestamped with the bar's 
+    datetime rather than the wall clock, so the same backtest always 
+    produces the same fills. Orders still in flight when the backtest
+    stops are never filled; they are counted in orders_unfilled and 
+    reported.
+    
+    Without a slippage model, this handler will simply fill all orders 
+    at markt price, leaving the Portfolio to book them at the latest 
+    bar's price. With a SlippageModel, the orders of a bar are held 
+    until the end of the bar and then priced all at once: the model is
+    passed the latest adjusted close, bar volume and rolling return 
+    volatility (see RollingVolatility) of every order's symbol as 
+    arrays, and each fill carries its price. A Limit order is only 
+    filled once it is marketable, i.e. once the adjusted close has 
+    reached its price, and never beyond its price; until then it is 
+    held and checked again at the end of every bar.
     """
     
-    def __init__(self, events):
+    uses_bars = True
+    
+    def __init__(self, events, bars=None, slippage_model=None, 
+                 volatility_window=20, latency=None):
         """
         Initializes the handler, setting the event queues up
         internally.
@@ -78,6 +128,19 @@ class SimulatedExecutionHandler(ExecutionHandler):
         ----------
         events : 'Queue'
             The Queue of Event objects.
+        bars : 'DataHandler', optional
+            The DataHandler object with current market data, which is
+            required by a slippage model. The default is None.
+        slippage_model : 'SlippageModel', optional
+            Prices the fills. The default is None, i.e. no slippage.
+        volatility_window : 'int', optional
+            The number of bars used to estimate the volatility passed 
+            to the slippage model. The default is 20.
+        latency : 'timedelta', optional
+            The delay between sending an order and it reaching the 
+            market, as a timedelta, a number of seconds, or a callable
+            returning either for each order (e.g. a seeded random 
+            draw). The default is None, i.e. no latency.
 
         Returns
         -------
@@ -86,12 +149,78 @@ class SimulatedExecutionHandler(ExecutionHandler):
         """
         
         self.events = events
+        self.bars = bars
+        self.slippage_model = slippage_model
+        self.latency = latency
+        
+        self._pending = []
+        self._in_flight = []
+        self._sequence = itertools.count()
+        self.orders_unfilled = 0
+        if latency is not None and bars is None:
+            raise ValueError("A latency requires the bars")
+        if slippage_model is not None:
+            if bars is None:
+                raise ValueError("A slippage model requires the bars")
+            self._symbol_index = dict(
+                (s, i) for i, s in enumerate(bars.symbol_list)
+            )
+            self.volatility = RollingVolatility(
+                len(bars.symbol_list), volatility_window
+            )
+            
+            
+    def _now(self):
+        """
+        Returns the simulated time, i.e. the datetime of the latest 
+        bar (or the wall clock without bars).
+
+        """
+        
+        if self.bars is None:
+            return datetime.datetime.utcnow()
+        return self.bars.get_latest_bar_datetime(self.bars.symbol_list[0])
+    
+    
+    def _order_latency(self):
+        """
+        Returns the latency of a new order as a timedelta.
+
+        """
+        
+        latency = self.latency
+        if callable(latency):
+            latency = latency()
+        if isinstance(latency, numbers.Real):
+            latency = datetime.timedelta(seconds=latency)
+        return latency
+            
+            
+    def update_market(self, event):
+        """
+        Updates the volatility estimates used by the slippage model
+        with the latest prices, then releases the orders that have
+        reached the market by the time of the new bar.
+
+        """
+        
+        if self.slippage_model is not None:
+            self.volatility.update(self.bars.get_latest_values("adj_close"))
+            
+        in_flight = self._in_flight
+        if in_flight:
+            now = self._now()
+            while in_flight and in_flight[0][0] <= now:
+                _, _, order_id, order = heapq.heappop(in_flight)
+                self._arrive(order, order_id)
         
     
     def execute_order(self, event):
         """
         Simply converts Order objects into Fill objects naively, 
-        i.e. without any latency, slippage, or fill ratio problems.
+        i.e. without any fill ratio problems. With a latency the order 
+        is first held in flight, and with a slippage model it is filled
+        at the end of the bar.
 
         Parameters
         ----------
@@ -104,9 +233,461 @@ class SimulatedExecutionHandler(ExecutionHandler):
 
         """
         
-        if event.type == 'ORDER':
-            fill_event = FillEvent(
-                datetime.datetime.utcnow(), event.symbol, 
-                'ARCA', event.quantity, event.direction, None
+        if event.type == EventType.ORDER:
+            self._send(event, None)
+            
+            
+    def _send(self, order, order_id):
+        """
+        Sends an order to the market, holding it in flight if there
+        is a latency.
+
+        """
+        
+        if not self.latency:
+            self._arrive(order, order_id)
+            return
+        due = self._now() + self._order_latency()
+        heapq.heappush(
+            self._in_flight, (due, next(self._sequence), order_id, order)
+        )
+        
+        
+    def _arrive(self, order, order_id):
+        """
+        Fills an order that has reached the market, at once or, with a
+        slippage model, at the end of the bar.
+
+        """
+        
+        if self.slippage_model is not None:
+            self._pending.append(order)
+            return
+        fill_event = FillEvent(
+            self._now(), order.symbol, 
+            'ARCA', order.quantity, order.direction, None
+        )
+        self.events.put(fill_event)
+            
+            
+    def _num_unfilled(self):
+        """
+        Returns the number of orders sent that have not been filled.
+
+        """
+        
+        return len(self._in_flight) + len(self._pending)
+    
+    
+    def stop(self):
+        """
+        Reports the orders that were never filled, i.e. those still in
+        flight (or, with a slippage model, Limit orders still waiting 
+        for the close to reach their price) when the backtest stopped.
+
+        """
+        
+        self.orders_unfilled = self._num_unfilled()
+        if self.orders_unfilled:
+            print(
+                "%s: %s orders were not filled" % 
+                (type(self).__name__, self.orders_unfilled)
+            )
+            
+            
+    def end_of_bar(self):
+        """
+        Fills the orders of the bar at the prices of the slippage 
+        model, which are calculated in a single pass over all of them.
+        Limit orders that are not marketable at the latest adjusted 
+        close are held until a later bar.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if not self._pending:
+            return
+        orders = self._pending
+        
+        symbols = np.array(
+            [self._symbol_index[o.symbol] for o in orders], dtype=np.intp
+        )
+        directions = np.array(
+            [1.0 if o.direction == 'BUY' else -1.0 for o in orders]
+        )
+        quantities = np.array([o.quantity for o in orders], dtype=np.float64)
+        limits = np.array([
+            o.price if o.order_type == 'LMT' and o.price is not None 
+            else np.nan for o in orders
+        ], dtype=np.float64)
+        prices = self.bars.get_latest_values("adj_close")[symbols]
+        
+        # A Limit order is held until the close reaches its price
+        with np.errstate(invalid='ignore'):
+            marketable = np.isnan(limits) | np.where(
+                directions > 0, limits >= prices, limits <= prices
             )
-            self.events.put(fill_event)
\ No newline at end of file
+        if not marketable.all():
+            self._pending = [
+                o for o, m in zip(orders, marketable.tolist()) if not m
+            ]
+            if not marketable.any():
+                return
+            orders = [o for o, m in zip(orders, marketable.tolist()) if m]
+            symbols = symbols[marketable]
+            directions = directions[marketable]
+            quantities = quantities[marketable]
+            limits = limits[marketable]
+            prices = prices[marketable]
+        else:
+            self._pending = []
+        
+        # Each order is charged for all that is traded in its symbol
+        traded = np.bincount(
+            symbols, quantities, minlength=len(self._symbol_index)
+        )
+        volumes = self.bars.get_latest_values("volume")
+        fill_prices = self.slippage_model.fill_prices(
+            directions, traded[symbols], prices, volumes[symbols],
+            self.volatility.volatility[symbols]
+        )
+        
+        # A Limit order is never filled beyond its price
+        capped = np.where(
+            directions > 0, np.fmin(fill_prices, limits), 
+            np.fmax(fill_prices, limits)
+        )
+        
+        now = self._now()
+        for order, price in zip(orders, capped.tolist()):
+            self.events.put(FillEvent(
+                now, order.symbol, 'ARCA', order.quantity, order.direction,
+                price
+            ))
+            
+            
+            
+class SimulatedExchangeExecutionHandler(SimulatedExecutionHandler):
+    """
+    The simulated exchange execution handler keeps the Limit orders
+    of each symbol in a price-time priority OrderBook and matches them
+    against the bars (or trade ticks) of the market, emitting a
+    FillEvent for every partial and full fill at the price it took
+    place.
+    
+    Market orders, and Limit orders that are marketable at the latest
+    close, are filled as by the SimulatedExecutionHandler, i.e. at the
+    close or at the price of its slippage model. Any other Limit order
+    rests in the book from the next bar, and is reported as unfilled 
+    if it is still resting when the backtest stops. With a latency, 
+    orders reach the market (and are checked against its close) only
+    once in flight, and can be cancelled until they are filled. On 
+    each new bar a resting buy order fills if the low trades down to 
+    its price and a resting sell order if the high trades up to it, 
+    at the limit price or the open if the bar gapped through it. Each
+    side of a symbol's book can take at most max_participation of the
+    bar's volume, the orders at the best prices and then the oldest 
+    orders at each price filling first, so large or crowded orders 
+    fill partially over several bars.
+    
+    Prices are in the adjusted terms of the Portfolio, the bars' open,
+    high and low being scaled by adj_close / close. Only the symbols
+    with resting orders are matched on each bar, and adding,
+    cancelling and matching an order costs O(log n) in the number of
+    price levels of its book, so tens of thousands of orders can rest
+    at once.
+    
+    The Backtest passes its DataHandler to the handler, since
+    uses_bars is set.
+    """
+    
+    uses_bars = True
+    
+    def __init__(self, events, bars, max_participation=1.0, 
+                 exchange='ARCA', slippage_model=None, 
+                 volatility_window=20, latency=None):
+        """
+        Initializes the handler with empty order books.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The Queue of Event objects.
+        bars : 'DataHandler'
+            The DataHandler object with current market data.
+        max_participation : 'float', optional
+            The largest fraction of a bar's volume that the resting 
+            orders on each side of a book can take. The default is 1.0.
+        exchange : 'str', optional
+            The exchange reported on the fills. The default is 'ARCA'.
+        slippage_model : 'SlippageModel', optional
+            Prices the fills of marketable orders. The default is None.
+        volatility_window : 'int', optional
+            The number of bars used to estimate the volatility passed 
+            to the slippage model. The default is 20.
+        latency : 'timedelta', optional
+            The delay between sending an order and it reaching the 
+            market (see SimulatedExecutionHandler). The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        super(SimulatedExchangeExecutionHandler, self).__init__(
+            events, bars, slippage_model, volatility_window, latency
+        )
+        self.max_participation = max_participation
+        self.exchange = exchange
+        
+        self.books = {}
+        self._order_ids = itertools.count()
+        self._order_symbols = {}
+        self._unarrived = {}
+        
+        
+    def _adjustment(self, symbol):
+        """
+        Returns the ratio of the latest adjusted close to the close.
+
+        """
+        
+        close = self.bars.get_latest_bar_value(symbol, "close")
+        ratio = self.bars.get_latest_bar_value(symbol, "adj_close") / close
+        return ratio if math.isfinite(ratio) else 1.0
+    
+    
+    def _fill(self, symbol, direction, quantity, price, timeindex):
+        """
+        Puts a FillEvent onto the Events queue.
+
+        """
+        
+        self.events.put(FillEvent(
+            timeindex, symbol, self.exchange, quantity, direction, price
+        ))
+        
+        
+    def execute_order(self, event):
+        """
+        Sends an order to the market. Once it arrives, a Market order, 
+        or a marketable Limit order, is filled as the 
+        SimulatedExecutionHandler does and any other Limit order is 
+        added to its symbol's book.
+
+        Parameters
+        ----------
+        event : 'Event'
+            Contains an Event object with order information.
+
+        Returns
+        -------
+        'int'
+            The id of the order, which can be passed to cancel_order.
+
+        """
+        
+        if event.type != EventType.ORDER:
+            return None
+        
+        order_id = next(self._order_ids)
+        if event.order_type == 'LMT':
+            if event.price is None:
+                raise ValueError("Limit order has no price")
+            self._unarrived[order_id] = RestingOrder(
+                order_id, event.symbol, event.direction, event.price,
+                event.quantity
+            )
+            self._order_symbols[order_id] = event.symbol
+        self._send(event, order_id)
+        return order_id
+    
+    
+    def _arrive(self, order, order_id):
+        """
+        Adds a Limit order that has reached the market to its book, 
+        unless it is marketable or was cancelled in flight.
+
+        """
+        
+        if order.order_type == 'LMT':
+            resting = self._unarrived.pop(order_id, None)
+            if resting is None:
+                return
+            symbol = order.symbol
+            close = self.bars.get_latest_bar_value(symbol, "adj_close")
+            marketable = (
+                order.price >= close if order.direction == 'BUY'
+                else order.price <= close
+            )
+            if not marketable:
+                book = self.books.get(symbol)
+                if book is None:
+                    book = self.books[symbol] = OrderBook(symbol)
+                book.add(resting)
+                return
+            del self._order_symbols[order_id]
+            
+        super(SimulatedExchangeExecutionHandler, self)._arrive(
+            order, order_id
+        )
+    
+    
+    def _num_unfilled(self):
+        """
+        Returns the number of orders sent that have not been filled, 
+        including the Limit orders resting in the books.
+
+        """
+        
+        in_flight = sum(
+            1 for _, _, _, order in self._in_flight 
+            if order.order_type != 'LMT'
+        )
+        return (
+            in_flight + len(self._unarrived) + len(self._pending) +
+            sum(len(book) for book in self.books.values())
+        )
+    
+    
+    def cancel_order(self, order_id):
+        """
+        Cancels the unfilled part of a resting (or in flight) Limit 
+        order.
+
+        Parameters
+        ----------
+        order_id : 'int'
+            The id returned by execute_order.
+
+        Returns
+        -------
+        'RestingOrder'
+            The cancelled order, or None if it is no longer resting.
+
+        """
+        
+        symbol = self._order_symbols.pop(order_id, None)
+        if symbol is None:
+            return None
+        order = self._unarrived.pop(order_id, None)
+        if order is not None:
+            return order
+        return self.books[symbol].cancel(order_id)
+    
+    
+    def _match(self, symbol, direction, limit, quantity, timeindex, 
+               open_price=None):
+        """
+        Matches an incoming trade against a book and emits the fills,
+        improved to the open price if the market gapped through them.
+
+        """
+        
+        book = self.books[symbol]
+        for order, filled in book.match(direction, limit, quantity):
+            price = order.price
+            if open_price is not None:
+                if order.direction == 'BUY':
+                    price = min(price, open_price)
+                else:
+                    price = max(price, open_price)
+            self._fill(symbol, order.direction, filled, price, timeindex)
+            if order.remaining == 0:
+                del self._order_symbols[order.order_id]
+                
+                
+    def _liquidity(self, volume):
+        """
+        Returns the quantity that each side of a book can take from a
+        trade of the given volume.
+
+        """
+        
+        if volume is None or not math.isfinite(volume):
+            return float('inf')
+        return int(volume * self.max_participation)
+                
+                
+    def update_market(self, event):
+        """
+        Matches the resting orders of every symbol against its latest
+        bar, then lets in the orders that have reached the market, 
+        which rest from the next bar.
+
+        Parameters
+        ----------
+        event : 'MarketEvent'
+            The MarketEvent of the new bars.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        bars = self.bars
+        for symbol, book in self.books.items():
+            if not book:
+                continue
+            ratio = self._adjustment(symbol)
+            open_price = bars.get_latest_bar_value(symbol, "open") * ratio
+            low = bars.get_latest_bar_value(symbol, "low") * ratio
+            high = bars.get_latest_bar_value(symbol, "high") * ratio
+            liquidity = self._liquidity(
+                bars.get_latest_bar_value(symbol, "volume")
+            )
+            timeindex = bars.get_latest_bar_datetime(symbol)
+            
+            # The low fills the bids and the high the asks
+            if book.best_bid is not None and book.best_bid >= low:
+                self._match(
+                    symbol, 'SELL', low, liquidity, timeindex, open_price
+                )
+            if book.best_ask is not None and book.best_ask <= high:
+                self._match(
+                    symbol, 'BUY', high, liquidity, timeindex, open_price
+                )
+                
+        super(SimulatedExchangeExecutionHandler, self).update_market(event)
+                
+                
+    def update_tick(self, symbol, price, size, timeindex=None):
+        """
+        Matches the resting orders of a symbol against a trade tick: 
+        the bids at or above its price and the asks at or below it 
+        fill, at their limit prices, up to max_participation of its
+        size.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+        price : 'float'
+            The price of the trade.
+        size : 'float'
+            The size of the trade, or None if not known.
+        timeindex : 'datetime', optional
+            The time of the trade. The default is None, i.e. that of
+            the symbol's latest bar.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        book = self.books.get(symbol)
+        if not book:
+            return
+        if timeindex is None:
+            timeindex = self.bars.get_latest_bar_datetime(symbol)
+        liquidity = self._liquidity(size)
+        if book.best_bid is not None and book.best_bid >= price:
+            self._match(symbol, 'SELL', price, liquidity, timeindex)
+        if book.best_ask is not None and book.best_ask <= price:
+            self._match(symbol, 'BUY', price, liquidity, timeindex)
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An append-only on-disk journal of the positions and holdings of a
+portfolio.
+"""
+
+
+import json
+import os, os.path
+
+import numpy as np
+
+from event import EventType
+from portfolio import ArrayPortfolio, datetime_ns
+
+
+# Version of the on-disk layout, bumped whenever it changes
+JOURNAL_VERSION = 1
+
+
+def bar_record_dtype(num_symbols):
+    """
+    Returns the fixed-width record of one bar of the journal: its int64
+    nanosecond datetime, the position in each symbol and the holdings
+    row (the market value of each symbol, cash, commission and total).
+
+    """
+
+    return np.dtype([
+        ('datetime', '<i8'),
+        ('positions', '<f8', (num_symbols,)),
+        ('holdings', '<f8', (num_symbols + 3,)),
+    ])
+
+
+# The fixed-width record of one fill. 'bar' is the number of bars that
+# had been journaled when the fill took place and 'direction' is +1 for
+# a buy and -1 for a sell.
+FILL_RECORD_DTYPE = np.dtype([
+    ('datetime', '<i8'),
+    ('bar', '<i8'),
+    ('symbol', '<i4'),
+    ('direction', '<i4'),
+    ('quantity', '<f8'),
+    ('price', '<f8'),
+    ('commission', '<f8'),
+])
+
+
+
+class HoldingsJournal(object):
+    """
+    HoldingsJournal is an append-only, on-disk journal of the positions
+    and holdings of a portfolio at every bar, and of every fill.
+
+    The journal is a directory holding a meta.json file, which records
+    the symbols and so the record layout, and two binary files of
+    fixed-width records, bars.dat and fills.dat. As the records have a
+    fixed width, the files can be memory-mapped as NumPy structured
+    arrays without being parsed, and a record torn by a crash is simply
+    a partial record at the end of a file, which is dropped when the
+    journal is reopened.
+
+    Records are written through to the operating system as they are
+    appended, and the files are fsync'ed every 'fsync_every' records,
+    which bounds how much of the history a power failure can lose.
+    """
+
+    def __init__(self, journal_dir, symbol_list, fsync_every=100):
+        """
+        Opens the journal, creating it if it does not exist.
+
+        Parameters
+        ----------
+        journal_dir : 'str'
+            The directory of the journal.
+        symbol_list : 'list'
+            A list of symbol strings, which must match those of an
+            existing journal.
+        fsync_every : 'int', optional
+            The number of records appended between fsyncs. The default
+            is 100.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.journal_dir = journal_dir
+        self.symbol_list = list(symbol_list)
+        self.fsync_every = fsync_every
+        self._symbol_index = dict(
+            (s, i) for i, s in enumerate(self.symbol_list)
+        )
+
+        self.bar_dtype = bar_record_dtype(len(self.symbol_list))
+        self.fill_dtype = FILL_RECORD_DTYPE
+        self._bar_path = os.path.join(journal_dir, 'bars.dat')
+        self._fill_path = os.path.join(journal_dir, 'fills.dat')
+
+        self._open_meta()
+        self.num_bars = self._truncate_partial(self._bar_path, self.bar_dtype)
+        self.num_fills = self._truncate_partial(
+            self._fill_path, self.fill_dtype
+        )
+
+        self._bar_file = open(self._bar_path, 'ab', buffering=0)
+        self._fill_file = open(self._fill_path, 'ab', buffering=0)
+        self._bar_record = np.zeros(1, dtype=self.bar_dtype)
+        self._fill_record = np.zeros(1, dtype=self.fill_dtype)
+        self._unsynced = 0
+
+
+    def _open_meta(self):
+        """
+        Writes the metadata of a new journal, or checks that of an
+        existing journal against the symbols.
+
+        """
+
+        path = os.path.join(self.journal_dir, 'meta.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                meta = json.load(f)
+            if meta.get('version') != JOURNAL_VERSION:
+                raise ValueError(
+                    "Journal %s has an unsupported version" % self.journal_dir
+                )
+            if meta['symbol_list'] != self.symbol_list:
+                raise ValueError(
+                    "Journal %s was written for the symbols %s" % (
+                        self.journal_dir, meta['symbol_list']
+                    )
+                )
+            return
+
+        if not os.path.isdir(self.journal_dir):
+            os.makedirs(self.journal_dir)
+        meta = {'version': JOURNAL_VERSION, 'symbol_list': self.symbol_list}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+
+    def _truncate_partial(self, path, dtype):
+        """
+        Drops a partial record left at the end of a file by a crash and
+        returns the number of complete records.
+
+        """
+
+        if not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        count = size // dtype.itemsize
+        if count * dtype.itemsize != size:
+            with open(path, 'r+b') as f:
+                f.truncate(count * dtype.itemsize)
+        return count
+
+
+    def _wrote_record(self):
+        """
+        Counts an appended record, fsync'ing the files when due.
+
+        """
+
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+
+    def append_bar(self, timestamp, positions, holdings):
+        """
+        Appends the record of a bar.
+
+        Parameters
+        ----------
+        timestamp : 'int'
+            The datetime of the bar as int64 nanoseconds.
+        positions : 'np.ndarray'
+            The position held in each symbol.
+        holdings : 'np.ndarray'
+            The market value of each symbol, followed by the cash,
+            commission and total.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        record = self._bar_record
+        record['datetime'] = timestamp
+        record['positions'] = positions
+        record['holdings'] = holdings
+        self._bar_file.write(record.tobytes())
+        self.num_bars += 1
+        self._wrote_record()
+
+
+    def append_fill(self, timestamp, symbol, direction, quantity, price,
+                    commission):
+        """
+        Appends the record of a fill.
+
+        Parameters
+        ----------
+        timestamp : 'int'
+            The datetime of the fill as int64 nanoseconds.
+        symbol : 'str'
+            The ticker symbol.
+        direction : 'int'
+            +1 for a buy and -1 for a sell.
+        quantity : 'int'
+            The filled quantity.
+        price : 'float'
+            The price the fill was booked at.
+        commission : 'float'
+            The commission of the fill.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        record = self._fill_record
+        record['datetime'] = timestamp
+        record['bar'] = self.num_bars
+        record['symbol'] = self._symbol_index[symbol]
+        record['direction'] = direction
+        record['quantity'] = quantity
+        record['price'] = price
+        record['commission'] = commission
+        self._fill_file.write(record.tobytes())
+        self.num_fills += 1
+        self._wrote_record()
+
+
+    def sync(self):
+        """
+        Forces the appended records onto the disk.
+
+        """
+
+        os.fsync(self._bar_file.fileno())
+        os.fsync(self._fill_file.fileno())
+        self._unsynced = 0
+
+
+    def _map(self, path, dtype, count):
+        """
+        Memory-maps the first 'count' records of a file.
+
+        """
+
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+    def read_bars(self):
+        """
+        Returns the bar records as a read-only, memory-mapped structured
+        array with the fields 'datetime', 'positions' and 'holdings'.
+
+        """
+
+        return self._map(self._bar_path, self.bar_dtype, self.num_bars)
+
+
+    def read_fills(self):
+        """
+        Returns the fill records as a read-only, memory-mapped
+        structured array (see FILL_RECORD_DTYPE).
+
+        """
+
+        return self._map(self._fill_path, self.fill_dtype, self.num_fills)
+
+
+    def close(self):
+        """
+        Syncs and closes the journal files.
+
+        """
+
+        if not self._bar_file.closed:
+            self.sync()
+            self._bar_file.close()
+            self._fill_file.close()
+
+
+
+class JournaledPortfolio(ArrayPortfolio):
+    """
+    JournaledPortfolio is an ArrayPortfolio whose positions, holdings
+    and fills are appended to a HoldingsJournal on disk instead of
+    being held in memory. Its memory footprint therefore stays flat
+    however long the session runs, while the history remains available
+    through memory maps of the journal (e.g. for the equity curve).
+
+    With resume=True an existing journal is continued rather than
+    started afresh: the current positions and holdings are restored
+    from the last bar record, along with any fills journaled after it,
+    and the online statistics are replayed over the journaled totals.
+    The data feed should then be restarted after resumed_datetime.
+
+    NOTE:
+        Resting exit triggers and the state of a position sizer are
+        not journaled, so they are not restored on resume.
+    """
+
+    def __init__(self, bars, events, start_date, initial_capital=100000.0,
+                 journal_dir='journal', resume=False, fsync_every=100,
+                 **kwargs):
+        """
+        Initializes the portfolio, opening (or resuming) its journal.
+
+        Parameters
+        ----------
+        bars : 'DataHandler'
+            The DataHandler object with current market data.
+        events : 'Queue'
+            The Event Queue object.
+        start_date : 'datetime'
+            the start date (bar) of the portfolio.
+        initial_capital : 'float', optional
+            The starting capital in USD. The default is 100000.0.
+        journal_dir : 'str', optional
+            The directory of the journal. The default is 'journal'.
+        resume : 'bool', optional
+            Whether to continue an existing journal. The default is
+            False, in which case the journal must not already exist.
+        fsync_every : 'int', optional
+            The number of records appended between fsyncs. The default
+            is 100.
+        **kwargs :
+            Any other keyword arguments of ArrayPortfolio.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if not resume and os.path.exists(
+                os.path.join(journal_dir, 'meta.json')):
+            raise ValueError(
+                "Journal %s already exists, pass resume=True to "
+                "continue it" % journal_dir
+            )
+        self.journal = HoldingsJournal(
+            journal_dir, bars.symbol_list, fsync_every
+        )
+        self.resumed_datetime = None
+        super(JournaledPortfolio, self).__init__(
+            bars, events, start_date, initial_capital, **kwargs
+        )
+
+
+    def _allocate_history(self, initial_bars):
+        """
+        Uses the journal in place of the history arrays.
+
+        """
+
+        self._num_bars = self.journal.num_bars
+        self._resuming = self._num_bars > 0
+
+
+    def _history(self):
+        """
+        Returns memory maps of the journaled datetimes, positions and
+        holdings.
+
+        """
+
+        bars = self.journal.read_bars()
+        return bars['datetime'], bars['positions'], bars['holdings']
+
+
+    def _append_bar(self, latest_datetime, positions, market_values):
+        """
+        Appends the record of a bar to the journal. When resuming an
+        existing journal, the initial bar is replaced by restoring the
+        state of the portfolio from the journal.
+
+        """
+
+        if self._resuming:
+            self._resuming = False
+            self._resume()
+            return
+
+        cash = self.current_holdings['cash']
+        total = cash + market_values.sum()
+        holdings = np.concatenate([
+            market_values, (cash, self.current_holdings['commission'], total)
+        ])
+        self.journal.append_bar(
+            datetime_ns(latest_datetime), positions, holdings
+        )
+        self._num_bars += 1
+        self.online_stats.update(total)
+
+
+    def _resume(self):
+        """
+        Restores the current positions and holdings and the online
+        statistics from the journal.
+
+        """
+
+        bars = self.journal.read_bars()
+        last = bars[-1]
+        self.resumed_datetime = self._datetime_index(bars['datetime'][-1:])[0]
+
+        self._position_array[:] = last['positions']
+        for i, s in enumerate(self.symbol_list):
+            self.current_positions[s] = int(last['positions'][i])
+            self.current_holdings[s] = last['holdings'][i]
+        self.current_holdings['cash'] = last['holdings'][-3]
+        self.current_holdings['commission'] = last['holdings'][-2]
+        self.current_holdings['total'] = last['holdings'][-1]
+
+        # Apply the fills that took place after the last bar
+        fills = self.journal.read_fills()
+        for fill in fills[fills['bar'] == len(bars)]:
+            s = self.symbol_list[fill['symbol']]
+            quantity = int(fill['direction'] * fill['quantity'])
+            cost = quantity * fill['price']
+            self.current_positions[s] += quantity
+            self._position_array[fill['symbol']] += quantity
+            self.current_holdings[s] += cost
+            self.current_holdings['commission'] += fill['commission']
+            self.current_holdings['cash'] -= cost + fill['commission']
+            self.current_holdings['total'] -= cost + fill['commission']
+
+        for total in bars['holdings'][:, -1]:
+            self.online_stats.update(total)
+
+
+    def update_fill(self, event):
+        """
+        Updates the portfolio from a FillEvent, as in
+        Portfolio.update_fill, and appends the fill to the journal.
+
+        """
+
+        super(JournaledPortfolio, self).update_fill(event)
+        if event.type == EventType.FILL:
+            self.journal.append_fill(
+                datetime_ns(event.timeindex), event.symbol,
+                1 if event.direction == 'BUY' else -1, event.quantity,
+                self.fill_price(event),
+                event.commission
+            )
+
+
+    def close(self):
+        """
+        Syncs and closes the journal.
+
+        """
+
+        self.journal.close()
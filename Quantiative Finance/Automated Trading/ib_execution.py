@@ -14,7 +14,7 @@ from ib.ext.Contract import Contract
 from ib.ext.Order import Order
 from ib.opt import ibConnection, message
 
-from event import FillEvent
+from event import EventType, FillEvent
 from execution import ExecutionHandler
 
 
@@ -33,6 +33,10 @@ class IBExecution(ExecutionHandler):
         must be created to deal with a live market feed, 
         in order to replace the historical data feed handler 
         of the backtester system.
+        
+    NOTE:
+        Each order blocks for a second after it is placed. See
+        AsyncIBExecution for a non-blocking handler.
     
     """
     
@@ -93,17 +97,18 @@ class IBExecution(ExecutionHandler):
         """
         
         # Handle open order orderId processing
-        if (msg.typeName == "openOrder" and msg.orderId == self.order_id and
-            not self.fill_dict.has_key(msg.orderId)):
+        if (msg.typeName == "openOrder" and msg.orderId <= self.order_id and
+            msg.orderId not in self.fill_dict):
             
-            self.create_fill_dict_entry(msg):
+            self.create_fill_dict_entry(msg)
         
         # Handle Fills
         if msg.typeName == "orderStatus" and msg.status == "Filled" and \
+            msg.orderId in self.fill_dict and \
             self.fill_dict[msg.orderId]["filled"] == False:
                 self.create_fill(msg)
                 
-        print("Server Response: %s, %s\n" % (msg.typeName, masg))
+        print("Server Response: %s, %s\n" % (msg.typeName, msg))
         
         
     def create_tws_connection(self):
@@ -164,7 +169,7 @@ class IBExecution(ExecutionHandler):
         """
         
         # Assign the error and server reply message handling functions
-        self.tws_conn.register(self._error_handler, 'Error')
+        self.tws_conn.register(self.error_handler, 'Error')
         
         # Assign all of the server reply messages to the reply_handler
         # function defined earlier.
@@ -286,7 +291,7 @@ class IBExecution(ExecutionHandler):
         fd = self.fill_dict[msg.orderId]
         
         # Prepare the fill data
-        symbol = fd["Symbol"]
+        symbol = fd["symbol"]
         exchange = fd["exchange"]
         filled = msg.filled
         direction = fd["direction"]
@@ -303,7 +308,7 @@ class IBExecution(ExecutionHandler):
         self.fill_dict[msg.orderId]["filled"] = True
         
         # Place the fill event onto the event queue
-        self.events.put(fill_event)
+        self.events.put(fill)
         
         
     def execute_order(self, event):
@@ -338,7 +343,7 @@ class IBExecution(ExecutionHandler):
 
         """
         
-        if event.type == 'ORDER':
+        if event.type == EventType.ORDER:
             # Prepare the parameters for the asset order
             asset = event.symbol
             asset_type = "STK"
@@ -11,7 +11,7 @@ import datetime as dt
 import numpy as np
 
 from strategy import Strategy
-from event import SignalEvent
+from event import EventType, SignalEvent
 from backtest import Backtest
 from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
@@ -30,7 +30,8 @@ class MovingAverageCrossStrategy(Strategy):
     to be employed for this strategy.
     """
     
-    def __init__(self, bars, events, short_window=1, long_window=400):
+    def __init__(self, bars, events, short_window=1, long_window=400,
+                 strategy_id=1):
         """
         Initializes the Moving Average Cross Strategy.
 
@@ -44,6 +45,9 @@ class MovingAverageCrossStrategy(Strategy):
             The short moving average lookback. The default is 1.
         long_window : 'int', optional
             The long moving average lookback. The default is 400.
+        strategy_id : 'int', optional
+            The identifier attached to the strategy's signals. The 
+            default is 1.
 
         Returns
         -------
@@ -56,6 +60,7 @@ class MovingAverageCrossStrategy(Strategy):
         self.events = events
         self.short_window = short_window
         self.long_window = long_window
+        self.strategy_id = strategy_id
         
         # Set to True if a symbol is in the market
         self.bought = self._calculate_initial_bought()
@@ -99,7 +104,7 @@ class MovingAverageCrossStrategy(Strategy):
 
         """
         
-        if event.type == 'MARKET':
+        if event.type == EventType.MARKET:
             for s in self.symbol_list:
                 
                 bars = self.bars.get_latest_bars_values(
@@ -107,7 +112,7 @@ class MovingAverageCrossStrategy(Strategy):
                 )
                 bar_date = self.bars.get_latest_bar_datetime(s)
         
-                if bars is not None and bars != []:
+                if bars is not None and len(bars) > 0:
                     short_sma = np.mean(bars[-self.short_window:])
                     long_sma = np.mean(bars[-self.long_window:])
                     
@@ -119,7 +124,7 @@ class MovingAverageCrossStrategy(Strategy):
                         print("LONG: %s" % bar_date)
                         sig_dir = 'LONG'
                         signal = SignalEvent(
-                            1, symbol, cur_date, sig_dir, 1.0
+                            self.strategy_id, symbol, cur_date, sig_dir, 1.0
                         )
                         self.events.put(signal)
                         self.bought[s] = 'LONG'
@@ -127,11 +132,82 @@ class MovingAverageCrossStrategy(Strategy):
                         print("SHORT: %s" % bar_date)
                         sig_dir = 'EXIT'
                         signal = SignalEvent(
-                            1, symbol, cur_date, sig_dir, 1.0
+                            self.strategy_id, symbol, cur_date, sig_dir, 1.0
                         )
                         self.events.put(signal)
                         self.bought[s] = 'OUT'
                         
+                        
+    def _rolling_mean(self, prices, window):
+        """
+        Calculates the trailing mean of each column of prices over the
+        last 'window' bars, or over all bars when fewer are available,
+        which matches np.mean(bars[-window:]) in calculate_signals. 
+        Any NaN within the window gives a NaN mean.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            A (bars x symbols) matrix of prices.
+        window : 'int'
+            The lookback period.
+
+        Returns
+        -------
+        'np.ndarray'
+            A (bars x symbols) matrix of moving averages.
+
+        """
+        
+        nans = np.isnan(prices)
+        zero = np.zeros((1, prices.shape[1]))
+        csum = np.concatenate([zero, np.cumsum(np.where(nans, 0.0, prices), 
+                                                axis=0)])
+        cnan = np.concatenate([zero, np.cumsum(nans, axis=0)])
+        
+        end = np.arange(1, prices.shape[0] + 1)
+        start = np.maximum(end - window, 0)
+        sums = csum[end] - csum[start]
+        counts = (end - start)[:, np.newaxis]
+        means = sums / counts
+        means[(cnan[end] - cnan[start]) > 0] = np.nan
+        return means
+    
+    
+    def calculate_vectorized_signals(self, prices):
+        """
+        Generates the long/out state of every symbol at every bar from
+        the whole price history at once.
+        
+        A bar on which the short SMA is above the long SMA goes long
+        and a bar on which it is below exits. On any other bar (equal or
+        undefined averages) the previous state is carried forward, 
+        exactly as the 'bought' dictionary is in calculate_signals.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            A (bars x symbols) matrix of prices.
+
+        Returns
+        -------
+        'np.ndarray'
+            A (bars x symbols) matrix of states, 1 for LONG and 0 for OUT.
+
+        """
+        
+        short_sma = self._rolling_mean(prices, self.short_window)
+        long_sma = self._rolling_mean(prices, self.long_window)
+        
+        # +1 where a LONG is signalled, -1 where an EXIT is signalled
+        cross = np.nan_to_num(np.sign(short_sma - long_sma))
+        
+        # Carry the last non-zero crossing forward along each column
+        rows = np.arange(prices.shape[0])[:, np.newaxis]
+        last = np.maximum.accumulate(np.where(cross != 0, rows, 0), axis=0)
+        last_cross = np.take_along_axis(cross, last, axis=0)
+        return (last_cross > 0).astype(np.float64)
+                        
 
 
 
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A price-time priority limit order book for a single symbol.
+"""
+
+
+from collections import deque
+import heapq
+
+
+class RestingOrder(object):
+    """
+    A limit order resting in an OrderBook. The quantity is that of the
+    original order and 'remaining' the part of it not yet filled.
+
+    """
+
+    __slots__ = ('order_id', 'symbol', 'direction', 'price', 'quantity',
+                 'remaining')
+
+    def __init__(self, order_id, symbol, direction, price, quantity):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.direction = direction
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+
+
+    def __repr__(self):
+        return "RestingOrder(%s, %s, %s, %s, %s/%s)" % (
+            self.order_id, self.symbol, self.direction, self.price,
+            self.remaining, self.quantity
+        )
+
+
+
+class _PriceLevel(object):
+    """
+    The resting orders at one price, in the order they arrived, and
+    their total remaining quantity.
+
+    """
+
+    __slots__ = ('price', 'orders', 'quantity')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = deque()
+        self.quantity = 0
+
+
+
+class OrderBook(object):
+    """
+    OrderBook holds the resting limit orders of a single symbol with
+    price-time priority: better prices are filled first, and orders at
+    the same price are filled in the order they arrived.
+
+    Each side of the book keeps a dict from each price onto its level,
+    a FIFO queue of orders, and a heap of its prices with the best on
+    top (the bid prices are negated, so that both sides are min-heaps).
+    Prices are removed from the heaps lazily: a level that empties is
+    only dropped from the dict, and its price is popped once it reaches
+    the top of the heap. Adding an order that opens a new level pushes
+    its price, which is O(log n) for n price levels, and matching pops
+    the levels it empties from the best price, which is O(log n) per
+    level touched. Cancelling an order only removes it from the dict
+    of live orders and its level's quantity; it is dropped from the
+    queue when it reaches the front during matching, so a cancel is
+    O(1). The heaps are rebuilt from the live levels whenever the
+    stale prices outnumber them, which keeps their size O(n).
+    """
+
+    def __init__(self, symbol):
+        """
+        Initializes an empty book.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.symbol = symbol
+        self.orders = {}
+        self._heaps = {'BUY': [], 'SELL': []}
+        self._levels = {'BUY': {}, 'SELL': {}}
+
+
+    def __len__(self):
+        return len(self.orders)
+
+
+    def _best(self, side):
+        """
+        Returns the best live level of a side, or None, popping the
+        stale prices off the top of its heap.
+
+        """
+
+        heap = self._heaps[side]
+        levels = self._levels[side]
+        sign = -1 if side == 'BUY' else 1
+        while heap:
+            level = levels.get(sign * heap[0])
+            if level is not None:
+                return level
+            heapq.heappop(heap)
+        return None
+
+
+    @property
+    def best_bid(self):
+        """
+        The highest resting buy price, or None.
+
+        """
+
+        level = self._best('BUY')
+        return level.price if level is not None else None
+
+
+    @property
+    def best_ask(self):
+        """
+        The lowest resting sell price, or None.
+
+        """
+
+        level = self._best('SELL')
+        return level.price if level is not None else None
+
+
+    def depth(self, direction, price):
+        """
+        Returns the remaining quantity resting at a price.
+
+        """
+
+        level = self._levels[direction].get(price)
+        return level.quantity if level is not None else 0
+
+
+    def add(self, order):
+        """
+        Adds a limit order to the back of the queue at its price.
+
+        Parameters
+        ----------
+        order : 'RestingOrder'
+            The order, which must have a unique order_id.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if order.direction not in ('BUY', 'SELL'):
+            raise ValueError("direction must be 'BUY' or 'SELL'")
+
+        levels = self._levels[order.direction]
+        level = levels.get(order.price)
+        if level is None:
+            heap = self._heaps[order.direction]
+            level = levels[order.price] = _PriceLevel(order.price)
+            if len(heap) > 2 * len(levels):
+                # Drop the stale prices
+                heap[:] = levels
+                if order.direction == 'BUY':
+                    heap[:] = [-price for price in heap]
+                heapq.heapify(heap)
+            else:
+                heapq.heappush(
+                    heap, -order.price if order.direction == 'BUY'
+                    else order.price
+                )
+        level.orders.append(order)
+        level.quantity += order.remaining
+        self.orders[order.order_id] = order
+
+
+    def cancel(self, order_id):
+        """
+        Cancels a resting order and returns it, or None if the id is
+        not resting in the book.
+
+        Parameters
+        ----------
+        order_id : 'int'
+            The id of the order.
+
+        Returns
+        -------
+        'RestingOrder'
+            The cancelled order.
+
+        """
+
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+
+        levels = self._levels[order.direction]
+        level = levels[order.price]
+        level.quantity -= order.remaining
+        if level.quantity == 0:
+            # Its price is left in the heap until it reaches the top
+            del levels[order.price]
+        return order
+
+
+    def match(self, direction, limit, quantity):
+        """
+        Matches an incoming order against the opposite side of the
+        book, filling the resting orders that it crosses in price-time
+        priority until its quantity is used up. Fully filled orders
+        are removed from the book.
+
+        Parameters
+        ----------
+        direction : 'str'
+            The direction of the incoming order, 'BUY' to take the
+            resting sell orders and 'SELL' to take the buy orders.
+        limit : 'float'
+            The limit price of the incoming order.
+        quantity : 'float'
+            The quantity of the incoming order (float('inf') to take
+            every order it crosses).
+
+        Returns
+        -------
+        'list'
+            A (RestingOrder, filled quantity) pair per filled order.
+
+        """
+
+        side = 'SELL' if direction == 'BUY' else 'BUY'
+        heap = self._heaps[side]
+        levels = self._levels[side]
+
+        fills = []
+        while quantity > 0:
+            level = self._best(side)
+            if level is None:
+                break
+            if (level.price > limit if direction == 'BUY'
+                    else level.price < limit):
+                # The best level is not crossed, so neither is the rest
+                break
+            queue = level.orders
+            while queue and quantity > 0:
+                order = queue[0]
+                if order.order_id not in self.orders:
+                    # Cancelled while resting
+                    queue.popleft()
+                    continue
+                filled = min(order.remaining, quantity)
+                order.remaining -= filled
+                level.quantity -= filled
+                quantity -= filled
+                fills.append((order, filled))
+                if order.remaining == 0:
+                    queue.popleft()
+                    del self.orders[order.order_id]
+            if level.quantity == 0:
+                del levels[level.price]
+                heapq.heappop(heap)
+        return fills
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Behavioural checks of the OrderBook. Run as a script; an
+AssertionError means a check failed.
+"""
+
+
+import random
+
+from order_book import OrderBook, RestingOrder
+
+
+def check_partial_fills():
+    """
+    Matches an incoming order across two price levels in price-time
+    priority, leaving the last order it touches partially filled.
+
+    """
+
+    book = OrderBook('X')
+    book.add(RestingOrder(1, 'X', 'BUY', 10.0, 100))
+    book.add(RestingOrder(2, 'X', 'BUY', 10.0, 100))
+    book.add(RestingOrder(3, 'X', 'BUY', 10.5, 50))
+    book.add(RestingOrder(4, 'X', 'SELL', 11.0, 70))
+    assert book.best_bid == 10.5 and book.best_ask == 11.0
+
+    # The better price first, then the older order at 10.0
+    fills = book.match('SELL', 10.0, 180)
+    assert [(o.order_id, q) for o, q in fills] == [(3, 50), (1, 100), (2, 30)]
+    assert book.best_bid == 10.0
+    assert book.depth('BUY', 10.0) == 70
+    assert book.orders[2].remaining == 70
+    assert 1 not in book.orders and 3 not in book.orders
+
+    # A limit that does not cross the best price fills nothing
+    assert book.match('BUY', 10.9, 100) == []
+    fills = book.match('BUY', 11.0, float('inf'))
+    assert [(o.order_id, q) for o, q in fills] == [(4, 70)]
+    assert book.best_ask is None and len(book) == 1
+
+
+def check_cancel():
+    """
+    Cancels resting orders, including one at the front of a level that
+    is later matched and one whose level empties.
+
+    """
+
+    book = OrderBook('X')
+    for order_id, quantity in ((1, 10), (2, 20), (3, 30)):
+        book.add(RestingOrder(order_id, 'X', 'SELL', 20.0, quantity))
+    book.add(RestingOrder(4, 'X', 'SELL', 19.0, 5))
+
+    assert book.cancel(1).order_id == 1
+    assert book.cancel(1) is None
+    assert book.depth('SELL', 20.0) == 50
+
+    # The cancelled order is skipped when it reaches the front
+    fills = book.match('BUY', 20.0, 10)
+    assert [(o.order_id, q) for o, q in fills] == [(4, 5), (2, 5)]
+
+    # Emptying the best level leaves its price stale in the heap
+    book.cancel(2)
+    book.cancel(3)
+    assert book.best_ask is None and len(book) == 0
+    assert book.match('BUY', 100.0, 100) == []
+
+
+def check_heap_rebuild(num_orders=2000, seed=0):
+    """
+    Adds and cancels orders at random prices, checking the best prices
+    against a scan of the live orders, and that adding a level rebuilds
+    a heap whose stale prices outnumber the live levels.
+
+    """
+
+    rng = random.Random(seed)
+    book = OrderBook('X')
+    live = {}
+    rebuilds = 0
+    for order_id in range(num_orders):
+        if live and rng.random() < 0.45:
+            book.cancel(live.pop(rng.choice(list(live))).order_id)
+        else:
+            direction = rng.choice(('BUY', 'SELL'))
+            price = round(rng.uniform(90.0, 110.0), 1)
+            heap = book._heaps[direction]
+            size = len(heap)
+            new_level = price not in book._levels[direction]
+            order = RestingOrder(order_id, 'X', direction, price, 1)
+            book.add(order)
+            live[order_id] = order
+            if new_level:
+                rebuilds += len(heap) <= size
+                assert len(heap) <= 2 * len(book._levels[direction]) + 1
+
+        bids = [o.price for o in live.values() if o.direction == 'BUY']
+        asks = [o.price for o in live.values() if o.direction == 'SELL']
+        assert book.best_bid == (max(bids) if bids else None)
+        assert book.best_ask == (min(asks) if asks else None)
+    assert len(book) == len(live)
+    assert rebuilds > 0
+
+
+
+if __name__ == "__main__":
+    check_partial_fills()
+    check_cancel()
+    check_heap_rebuild()
+    print("OrderBook checks passed")
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token-bucket pacing of the orders sent to an ExecutionHandler.
+"""
+
+
+import heapq
+import itertools
+import time
+
+import pandas as pd
+
+from event import EventType, OrderEvent
+from execution import ExecutionHandler
+
+
+class TokenBucket(object):
+    """
+    A token bucket rate limiter: tokens accrue at 'rate' per second up
+    to 'burst', and each message sent takes one. Bursts of up to
+    'burst' messages can therefore be sent at once, while the long run
+    rate never exceeds 'rate'.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """
+        Initializes a full bucket.
+
+        Parameters
+        ----------
+        rate : 'float'
+            The tokens added per second.
+        burst : 'int'
+            The capacity of the bucket.
+        clock : 'callable', optional
+            Returns the current time in seconds. The default is
+            time.monotonic.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self._last = clock()
+
+
+    def _refill(self):
+        """
+        Adds the tokens accrued since the last refill.
+
+        """
+
+        now = self.clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._last) * self.rate
+        )
+        self._last = now
+
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available.
+
+        Returns
+        -------
+        'bool'
+            Whether a token was taken.
+
+        """
+
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+    def wait_time(self):
+        """
+        Returns the seconds until a token is available.
+
+        """
+
+        self._refill()
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+
+class _QueuedOrder(object):
+    """
+    An order waiting for a token. The quantity is signed, positive to
+    buy, and 'active' is cleared when the order is coalesced into a
+    later one.
+
+    """
+
+    __slots__ = ('symbol', 'quantity', 'order', 'active')
+
+    def __init__(self, symbol, quantity, order=None):
+        self.symbol = symbol
+        self.quantity = quantity
+        self.order = order
+        self.active = True
+
+
+
+class OrderThrottler(ExecutionHandler):
+    """
+    OrderThrottler paces the orders sent to another ExecutionHandler
+    (e.g. a live broker) so that they never exceed the broker's message
+    rate limit, using a TokenBucket.
+
+    Orders that cannot be sent at once wait in a priority queue, in
+    which exits (orders that reduce a position) go before entries, and
+    orders of the same priority keep their arrival order. While they
+    wait, the Market orders of each symbol are coalesced into a single
+    net order: offsetting orders cancel out without ever being sent,
+    and orders in the same direction take a single message. Limit
+    orders are queued as they are.
+
+    No time is spent sleeping: the queue is drained as far as the
+    tokens allow whenever an order arrives and on every MarketEvent and
+    end of bar. With an asyncio event loop, the throttler also sets a
+    timer for the moment the next token accrues, so that a live queue
+    drains at exactly the allowed rate. It must then be called from the
+    loop's thread.
+
+    In a backtest, the throttler is given the bars (as uses_bars is 
+    set), and its clock is the datetime of the latest bar rather than
+    the wall clock, so that the orders released in each bar do not 
+    depend on the speed of the machine. The bars are also passed on to
+    a wrapped handler class that uses them. Orders still queued when 
+    the backtest stops are never sent; they are counted in 
+    orders_unsent and reported.
+
+    The positions used to tell exits from entries are, by default, the
+    net quantities of the orders the throttler has sent. A mapping of
+    the actual positions, such as Portfolio.current_positions, can be
+    given instead, and the Backtest wires in its portfolio's positions
+    (see set_portfolio).
+    """
+
+    uses_bars = True
+
+    def __init__(self, events, bars=None, handler=None, rate=50.0,
+                 burst=50, positions=None, clock=None, loop=None,
+                 handler_params_dict=None):
+        """
+        Initializes the throttler.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The Queue of Event objects.
+        bars : 'DataHandler', optional
+            The DataHandler object with current market data, which 
+            provides the clock of a backtest. The default is None.
+        handler : 'ExecutionHandler'
+            The handler that the paced orders are sent to, or its class,
+            which is then constructed with the events queue (and the 
+            bars, if it uses them).
+        rate : 'float', optional
+            The largest number of orders sent per second. The default
+            is 50.0.
+        burst : 'int', optional
+            The largest number of orders sent at once. The default is
+            50.
+        positions : 'dict', optional
+            The current position in each symbol. The default is None,
+            i.e. the net quantities of the orders sent, or the positions
+            of the portfolio wired in by set_portfolio.
+        clock : 'callable', optional
+            Returns the current time in seconds. The default is None,
+            i.e. the time of the latest bar if there are bars, or else
+            time.monotonic.
+        loop : 'AbstractEventLoop', optional
+            An asyncio event loop on which to schedule the release of
+            the queued orders. The default is None.
+        handler_params_dict : 'dict', optional
+            Keyword arguments passed to the handler class. The default
+            is None.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if handler is None:
+            raise ValueError("OrderThrottler requires a handler")
+        self.events = events
+        self.bars = bars
+        if isinstance(handler, type):
+            handler_params = handler_params_dict or {}
+            if getattr(handler, 'uses_bars', False):
+                handler = handler(events, bars, **handler_params)
+            else:
+                handler = handler(events, **handler_params)
+        self.handler = handler
+
+        self._bar_time = 0.0
+        if clock is None:
+            clock = self._bar_clock if bars is not None else time.monotonic
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.loop = loop
+        self._tracks_positions = positions is None
+        self._positions_given = positions is not None
+        self.positions = {} if positions is None else positions
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._netted = {}
+        self._timer = None
+
+        self.orders_received = 0
+        self.orders_sent = 0
+        self.orders_coalesced = 0
+        self.orders_unsent = 0
+
+
+    def __len__(self):
+        return len(self._netted) + sum(
+            1 for _, _, q in self._queue if q.active and q.order is not None
+        )
+
+
+    def _bar_clock(self):
+        """
+        Returns the datetime of the latest bar in seconds since the
+        epoch, or 0.0 before the first bar.
+
+        """
+
+        return self._bar_time
+
+
+    def set_portfolio(self, portfolio):
+        """
+        Tells exits from entries by the positions of the portfolio,
+        unless positions were given to the throttler.
+
+        Parameters
+        ----------
+        portfolio : 'Portfolio'
+            The portfolio whose current_positions are used.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if not self._positions_given:
+            self._tracks_positions = False
+            self.positions = portfolio.current_positions
+
+
+    def _is_exit(self, symbol, quantity):
+        """
+        Returns whether a signed quantity reduces the position in a
+        symbol.
+
+        """
+
+        return self.positions.get(symbol, 0) * quantity < 0
+
+
+    def _push(self, queued):
+        """
+        Adds an order to the queue, exits first.
+
+        """
+
+        priority = 0 if self._is_exit(queued.symbol, queued.quantity) else 1
+        heapq.heappush(self._queue, (priority, next(self._sequence), queued))
+
+
+    def execute_order(self, event):
+        """
+        Queues an order, coalescing it with the queued Market orders
+        of its symbol, and sends as many queued orders as the tokens
+        allow.
+
+        Parameters
+        ----------
+        event : 'Event'
+            Contains an Event object with order information.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if event.type != EventType.ORDER:
+            return
+        self.orders_received += 1
+        symbol = event.symbol
+        quantity = event.quantity
+        if event.direction == 'SELL':
+            quantity = -quantity
+
+        if event.order_type == 'LMT':
+            self._push(_QueuedOrder(symbol, quantity, event))
+        else:
+            previous = self._netted.pop(symbol, None)
+            if previous is not None:
+                previous.active = False
+                quantity += previous.quantity
+                self.orders_coalesced += 1
+            if quantity != 0:
+                queued = _QueuedOrder(symbol, quantity)
+                self._netted[symbol] = queued
+                self._push(queued)
+        self.release()
+
+
+    def release(self):
+        """
+        Sends the queued orders, highest priority first, until the
+        queue or the tokens run out.
+
+        Returns
+        -------
+        'int'
+            The number of orders sent.
+
+        """
+
+        queue = self._queue
+        sent = 0
+        while queue:
+            queued = queue[0][2]
+            if not queued.active:
+                heapq.heappop(queue)
+                continue
+            if not self.bucket.try_acquire():
+                break
+            heapq.heappop(queue)
+            self._send(queued)
+            sent += 1
+
+        if queue and self.loop is not None and self._timer is None:
+            self._timer = self.loop.call_later(
+                self.bucket.wait_time(), self._on_timer
+            )
+        return sent
+
+
+    def _on_timer(self):
+        """
+        Releases the queue once the next token has accrued.
+
+        """
+
+        self._timer = None
+        self.release()
+
+
+    def _send(self, queued):
+        """
+        Sends a queued order to the handler.
+
+        """
+
+        order = queued.order
+        if order is None:
+            del self._netted[queued.symbol]
+            order = OrderEvent(
+                queued.symbol, 'MKT', abs(queued.quantity),
+                'BUY' if queued.quantity > 0 else 'SELL'
+            )
+        if self._tracks_positions:
+            self.positions[queued.symbol] = (
+                self.positions.get(queued.symbol, 0) + queued.quantity
+            )
+        self.orders_sent += 1
+        self.handler.execute_order(order)
+
+
+    def update_market(self, event):
+        """
+        Passes the MarketEvent on to the handler, advances the bar 
+        clock and sends the queued orders that the tokens allow.
+
+        """
+
+        if self.bars is not None:
+            self._bar_time = pd.Timestamp(self.bars.get_latest_bar_datetime(
+                self.bars.symbol_list[0]
+            )).timestamp()
+        self.handler.update_market(event)
+        self.release()
+
+
+    def end_of_bar(self):
+        """
+        Sends the queued orders that the tokens allow and calls the
+        handler's end_of_bar, if it has one.
+
+        """
+
+        self.release()
+        if hasattr(self.handler, 'end_of_bar'):
+            self.handler.end_of_bar()
+
+
+    def flush(self):
+        """
+        Sends every queued order at once, whatever the tokens, e.g. 
+        before shutting down a live session.
+
+        Returns
+        -------
+        'int'
+            The number of orders sent.
+
+        """
+
+        sent = 0
+        while self._queue:
+            _, _, queued = heapq.heappop(self._queue)
+            if queued.active:
+                self._send(queued)
+                sent += 1
+        return sent
+
+
+    def start(self):
+        """
+        Calls the handler's start, if it has one.
+
+        """
+
+        if hasattr(self.handler, 'start'):
+            self.handler.start()
+
+
+    def stop(self):
+        """
+        Reports the orders that are still queued, which will not be
+        sent, and calls the handler's stop, if it has one.
+
+        """
+
+        self.orders_unsent = len(self)
+        if self.orders_unsent:
+            print(
+                "OrderThrottler: %s queued orders were not sent" %
+                self.orders_unsent
+            )
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if hasattr(self.handler, 'stop'):
+            self.handler.stop()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs a Backtest for every set of parameters in a process pool.
+"""
+
+
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import datetime as dt
+import functools
+import itertools
+import os
+import sys
+
+import pandas as pd
+
+from backtest import Backtest
+from data import HistoricCSVArrayDataHandler
+from execution import SimulatedExecutionHandler
+from portfolio import Portfolio
+from shared_data import HistoricSharedMemoryDataHandler, SharedBarStore
+
+
+# The per-process state of a sweep worker, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(settings, quiet):
+    """
+    Initializes a sweep worker process by loading the market data once.
+
+    Every backtest run by this worker reuses the same data handler,
+    which is rewound between runs if it supports reset().
+
+    Parameters
+    ----------
+    settings : 'dict'
+        The Backtest settings shared by every run of the sweep.
+    quiet : 'bool'
+        Whether to discard the worker's console output.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+    _worker['settings'] = settings
+    _worker['data_handler'] = settings['data_handler'](
+        None, settings['csv_dir'], settings['symbol_list']
+    )
+
+
+def _worker_data_handler(events, csv_dir, symbol_list):
+    """
+    Returns the worker's preloaded data handler rewound for a new
+    backtest. It has the signature of a DataHandler class, so it can
+    be passed to the Backtest in place of one.
+
+    """
+
+    data_handler = _worker['data_handler']
+    if not hasattr(data_handler, 'reset'):
+        return _worker['settings']['data_handler'](
+            events, csv_dir, symbol_list
+        )
+    data_handler.reset(events)
+    return data_handler
+
+
+def _run_backtest(strategy_params_dict):
+    """
+    Runs a single backtest of the sweep in a worker process and
+    returns its parameters, summary statistics and trade counts. The
+    execution and portfolio parameters are copied, so that every run
+    gets fresh objects (e.g. position sizer and risk gate) and no state
+    is carried over from one run to the next.
+
+    """
+
+    settings = _worker['settings']
+    backtest = Backtest(
+        settings['csv_dir'], settings['symbol_list'],
+        settings['initial_capital'], settings['heartbeat'],
+        settings['start_date'], _worker_data_handler,
+        settings['execution_handler'], settings['portfolio'],
+        settings['strategy'], strategy_params_dict=strategy_params_dict,
+        stopping_rules=settings['stopping_rules'],
+        execution_params_dict=copy.deepcopy(
+            settings['execution_params_dict']
+        ),
+        portfolio_params_dict=copy.deepcopy(
+            settings['portfolio_params_dict']
+        )
+    )
+    backtest._run_backtest()
+    backtest.portfolio.create_equity_curve_dataframe()
+    stats = backtest.portfolio.output_summary_stats(filename=None)
+
+    result = dict(strategy_params_dict)
+    for name, value in stats:
+        result[name] = float(value.rstrip('%'))
+    result['Signals'] = backtest.signals
+    result['Orders'] = backtest.orders
+    result['Fills'] = backtest.fills
+    result['Bars'] = backtest.heartbeats
+    result['Stop Reason'] = backtest.stop_reason
+    return result
+
+
+
+class ParameterSweep(object):
+    """
+    Runs the event-driven Backtest over every combination of a grid
+    of strategy parameters, spread across a pool of worker processes.
+
+    Each worker loads the market data once when it starts and reuses
+    it for every backtest it runs, so the CSV files are parsed once per
+    worker rather than once per parameter set. The summary statistics
+    of every run are collected into a single results DataFrame.
+
+    With shared_memory=True the data is instead loaded once by the
+    parent process into a SharedBarStore, and every worker attaches a
+    HistoricSharedMemoryDataHandler to it, so only a single copy of 
+    the market data is held in RAM however many workers are used. 
+    This requires an array-backed data handler.
+
+    The worker functions are defined at module level so that they can
+    be pickled, which means the strategy, portfolio and handler classes
+    must be importable by the workers (i.e. not defined in __main__ on
+    platforms that spawn rather than fork).
+    """
+
+    def __init__(
+            self, csv_dir, symbol_list, initial_capital,
+            heartbeat, start_date, data_handler,
+            execution_handler, portfolio, strategy,
+            param_grid, max_workers=None, quiet=True,
+            shared_memory=False, stopping_rules=None,
+            execution_params_dict=None, portfolio_params_dict=None
+            ):
+        """
+        Initializes the parameter sweep.
+
+        Parameters
+        ----------
+        csv_dir : 'str'
+            The hard root to the CSV data directory.
+        symbol_list : 'list'
+            The list of symbol strings.
+        initial_capital : 'float'
+            The starting capital for the portfolio.
+        heartbeat : 'int'
+            Backtest "heartbeat" in seconds.
+        start_date : 'datetime'
+            The start datetime of the strategy.
+        data_handler : 'DataHandler'
+            Handles the market data feed.
+        execution_handler : 'ExecutionHandler'
+            Handles the orders/fills for trades.
+        portfolio : 'Portfolio'
+            Keeps track of portfolio current and prior positions.
+        strategy : 'Strategy'
+            Generates signals based on market data.
+        param_grid : 'dict'
+            Maps each strategy keyword argument onto the list of
+            values to be tried, e.g. {'short_window': [50, 100]}.
+        max_workers : 'int', optional
+            The number of worker processes. The default is None, i.e.
+            one per CPU.
+        quiet : 'bool', optional
+            Whether to discard the console output of the workers. The
+            default is True.
+        shared_memory : 'bool', optional
+            Whether the workers should share a single copy of the
+            market data. The default is False.
+        stopping_rules : 'list', optional
+            StoppingRule objects that can end each backtest early. The
+            default is None.
+        execution_params_dict : 'dict', optional
+            Keyword arguments passed to the ExecutionHandler of each
+            backtest, e.g. its slippage model. The default is None.
+        portfolio_params_dict : 'dict', optional
+            Keyword arguments passed to the Portfolio of each backtest,
+            e.g. its position sizer and risk gate. They are copied for
+            every run. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.settings = {
+            'csv_dir': csv_dir,
+            'symbol_list': symbol_list,
+            'initial_capital': initial_capital,
+            'heartbeat': heartbeat,
+            'start_date': start_date,
+            'data_handler': data_handler,
+            'execution_handler': execution_handler,
+            'portfolio': portfolio,
+            'strategy': strategy,
+            'stopping_rules': stopping_rules,
+            'execution_params_dict': execution_params_dict,
+            'portfolio_params_dict': portfolio_params_dict,
+        }
+        self.param_grid = param_grid
+        self.max_workers = max_workers or os.cpu_count()
+        self.quiet = quiet
+        self.shared_memory = shared_memory
+
+        self.results = None
+
+
+    def _generate_param_sets(self):
+        """
+        Expands the parameter grid into a list of strategy parameter
+        dictionaries, one per backtest.
+
+        Returns
+        -------
+        'list'
+            The list of strategy_params_dict.
+
+        """
+
+        names = list(self.param_grid)
+        return [
+            dict(zip(names, values)) for values in
+            itertools.product(*[self.param_grid[n] for n in names])
+        ]
+
+
+    def run(self):
+        """
+        Runs every backtest of the sweep and collects the results.
+
+        Returns
+        -------
+        'pd.DataFrame'
+            One row per parameter set, with the parameters, the summary
+            statistics (as numbers), the signal, order and fill counts,
+            the number of bars run and the reason for stopping early 
+            (if any).
+
+        """
+
+        param_sets = self._generate_param_sets()
+        chunksize = max(1, len(param_sets) // (self.max_workers * 4))
+
+        settings = dict(self.settings)
+        store = None
+        if self.shared_memory:
+            store = SharedBarStore.publish(
+                settings['csv_dir'], settings['symbol_list'],
+                data_handler=settings['data_handler']
+            )
+            settings['data_handler'] = functools.partial(
+                HistoricSharedMemoryDataHandler, store_spec=store.spec
+            )
+
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_init_worker,
+                    initargs=(settings, self.quiet)
+                    ) as executor:
+                rows = list(executor.map(
+                    _run_backtest, param_sets, chunksize=chunksize
+                ))
+        finally:
+            if store is not None:
+                store.unlink()
+
+        self.results = pd.DataFrame(rows)
+        return self.results
+
+
+
+if __name__ == "__main__":
+    from mac import MovingAverageCrossStrategy
+
+    csv_dir = '/Users/josephgross/Desktop/csv_dir'
+    symbol_list = ['AAPL']
+    initial_capital = 100000.0
+    heartbeat = 0.0
+    start_date = dt.datetime(1998, 1, 2, 0, 0, 0)
+
+    sweep = ParameterSweep(
+        csv_dir, symbol_list, initial_capital, heartbeat,
+        start_date, HistoricCSVArrayDataHandler, SimulatedExecutionHandler,
+        Portfolio, MovingAverageCrossStrategy,
+        param_grid={
+            'short_window': [10, 20, 50, 100],
+            'long_window': [200, 300, 400],
+        }
+    )
+
+    results = sweep.run()
+    print(results.sort_values('Sharpe Ratio', ascending=False))
@@ -34,6 +34,37 @@ def create_sharpe_ratio(returns, periods=252):
     return np.sqrt(periods) * (np.mean(returns) / np.std(returns))
 
 
+def _drawdowns_array(pnl):
+    """
+    Calculates the drawdowns and their durations for each column of a
+    (bars x curves) array of PnL curves, as create_drawdowns does for 
+    one curve.
+    
+    The high water mark starts at zero and ignores the first bar and 
+    any NaNs, so it is a running np.fmax. The duration of a drawdown is
+    the number of bars since the last bar with no drawdown, found by 
+    carrying the index of that bar forward with np.maximum.accumulate.
+    Both are NaN at the first bar, and the duration stays NaN until 
+    the first bar with no drawdown.
+
+    """
+    
+    num_bars = pnl.shape[0]
+    hwm = pnl.copy()
+    hwm[:1] = 0.0
+    np.fmax.accumulate(hwm, axis=0, out=hwm)
+    
+    drawdown = hwm - pnl
+    drawdown[:1] = np.nan
+    
+    rows = np.arange(num_bars, dtype=np.float64)[:, np.newaxis]
+    last_peak = np.maximum.accumulate(
+        np.where(drawdown == 0, rows, -1.0), axis=0
+    )
+    duration = np.where(last_peak >= 0, rows - last_peak, np.nan)
+    return drawdown, duration
+
+
 def create_drawdowns(pnl):
     """
     Calculate the largest peak-to_trough drawdown of the PnL curve
@@ -56,19 +87,186 @@ def create_drawdowns(pnl):
 
     """
     
-    # Calculate the cumulative returns curve
-    # and set up the High Water Mark
-    hwm = [0]
+    values = pnl.to_numpy(dtype=np.float64)[:, np.newaxis]
+    drawdown, duration = _drawdowns_array(values)
+    
+    drawdown = pd.Series(drawdown[:, 0], index=pnl.index)
+    duration = pd.Series(duration[:, 0], index=pnl.index)
+    return drawdown, drawdown.max(), duration.max()
+
+
+def create_drawdowns_matrix(pnl):
+    """
+    Calculates the drawdowns of many PnL curves at once, e.g. the 
+    equity curves of every backtest of a ParameterSweep, with the same
+    results as calling create_drawdowns on each curve in turn.
+
+    Parameters
+    ----------
+    pnl : 'pd.DataFrame'
+        One PnL curve per column, on a common index.
+
+    Returns
+    -------
+    'pd.DataFrame'
+        The drawdown of each curve at each bar.
+    'pd.Series'
+        The highest peak-to-trough drawdown of each curve.
+    'pd.Series'
+        The longest peak-to-trough duration of each curve.
+
+    """
+    
+    drawdown, duration = _drawdowns_array(
+        pnl.to_numpy(dtype=np.float64)
+    )
     
-    # Create the drawdown and duration series
-    idx = pnl.index 
-    drawdown = pd.Series(index=idx)
-    duration = pd.Series(index=idx) 
+    drawdown = pd.DataFrame(drawdown, index=pnl.index, columns=pnl.columns)
+    duration = pd.DataFrame(duration, index=pnl.index, columns=pnl.columns)
+    return drawdown, drawdown.max(), duration.max()
+
+
+
+class OnlineStatistics(object):
+    """
+    Accumulates the performance statistics of an equity curve one bar
+    at a time, in O(1) time and memory per bar, so that they can be
+    queried at any point of a live or long-running backtest without 
+    materialising the equity curve.
+    
+    The definitions match create_sharpe_ratio and create_drawdowns on
+    the equity curve built by Portfolio.create_equity_curve_dataframe:
+        - The mean and (population) variance of the period returns are
+          accumulated with Welford's algorithm.
+        - The equity curve is the cumulative product of 1 + returns, 
+          and the drawdown is measured from its high water mark.
+        - The drawdown duration is the number of bars since the equity
+          curve was last at its high water mark.
+    Bars whose return is undefined (NaN) are skipped, as they are by 
+    the Pandas methods.
+    """
     
-    # Loop over the index range
-    for t in range(1, len(idx)):
-        hwm.append(max(hwm[t-1], pnl[t]))
-        drawdown[t] = (hwm[t] - pnl[t])
-        duration[t] = (0 if drawdown[t] == 0 else duration[t-1]+1)
+    def __init__(self, periods=252):
+        """
+        Initializes the accumulator.
+
+        Parameters
+        ----------
+        periods : 'int', optional
+            Daily (252., Hourly (252*6.5), Minutley(252*6.5*60) etc. 
+            The default is 252.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.periods = periods
+        
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.last_total = None
+        
+        self.equity = 1.0
+        self.high_water_mark = 0.0
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.duration = 0
+        self.max_duration = 0
+        
+        
+    def update(self, total):
+        """
+        Adds the total account equity of the latest bar.
+
+        Parameters
+        ----------
+        total : 'float'
+            The total account equity.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        last_total = self.last_total
+        self.last_total = total
+        if last_total is None:
+            return
+        
+        ret = total / last_total - 1.0
+        if ret != ret:
+            return
+        
+        # Welford's update of the mean and sum of squared deviations
+        self.count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (ret - self.mean)
+        
+        self.equity *= 1.0 + ret
+        if self.equity > self.high_water_mark:
+            self.high_water_mark = self.equity
+        self.drawdown = self.high_water_mark - self.equity
+        if self.drawdown > self.max_drawdown:
+            self.max_drawdown = self.drawdown
+            
+        if self.drawdown == 0:
+            self.duration = 0
+        else:
+            self.duration += 1
+            if self.duration > self.max_duration:
+                self.max_duration = self.duration
+                
+                
+    @property
+    def variance(self):
+        """
+        The population variance of the period returns.
+
+        """
+        
+        return self._m2 / self.count if self.count else np.nan
+    
+    
+    @property
+    def sharpe_ratio(self):
+        """
+        The annualised Sharpe ratio of the period returns, based on a 
+        benchmark of zero.
+
+        """
+        
+        return np.sqrt(self.periods) * self.mean / np.sqrt(self.variance)
+    
+    
+    @property
+    def total_return(self):
+        """
+        The total return of the equity curve.
+
+        """
+        
+        return self.equity - 1.0
+    
+    
+    def summary(self):
+        """
+        Returns the statistics in the format of 
+        Portfolio.output_summary_stats.
+
+        Returns
+        -------
+        'list'
+            The total return, Sharpe ratio, max drawdown and drawdown 
+            duration.
+
+        """
         
-    return drawdown, drawdown.max(), duration.max()
\ No newline at end of file
+        return [("Total Return", "%0.2f%%" % (self.total_return * 100.0)),
+                ("Sharpe Ratio", "%0.2f" % self.sharpe_ratio),
+                ("Max Drawdown", "%0.2f%%" % (self.max_drawdown * 100.0)),
+                ("Drawdown Duration", "%d" % self.max_duration)]
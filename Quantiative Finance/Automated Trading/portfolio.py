@@ -7,6 +7,7 @@ Created on Fri Apr 24 10:34:01 2020
 """
 
 
+from collections import deque
 import datetime
 from math import floor
 try:
@@ -17,8 +18,26 @@ except ImportError:
 import numpy as np
 import pandas as pd
 
-from event import FillEvent, OrderEvent
-from performance import create_sharpe_ratio, create_drawdowns
+from event import EventType, FillEvent, OrderEvent
+from performance import (
+    create_sharpe_ratio, create_drawdowns, OnlineStatistics
+)
+from trigger_book import TriggerBook
+
+
+def datetime_ns(timestamp):
+    """
+    Converts a datetime or Timestamp into int64 nanoseconds since the
+    epoch.
+
+    """
+    
+    # Timestamps carry their nanoseconds, so avoid a conversion
+    try:
+        return timestamp.value
+    except AttributeError:
+        return int(np.datetime64(timestamp, 'ns').view(np.int64))
+
 
 
 class Portfolio(object):
@@ -34,11 +53,33 @@ class Portfolio(object):
     value of each symbol for a particular time-index, as well as the
     percentage change in portfolio total across bars.
     
+    The online_stats attribute accumulates the performance statistics
+    of the portfolio bar by bar (see OnlineStatistics), so that they 
+    can be queried at any point during the backtest.
+    
     The Portfolio class keeps track of all the positons within a 
     portfolio and generates orders of a fixed quantity of stock based
     on signals. More sophisticated portfolio objects include risk 
     mangaement and position sizing tools (such as the Keylly Criterion).
     
+    If a PositionSizer is given (see position_sizing.py), it is updated
+    with the latest prices and equity once per bar and orders are sized
+    from its targets and the signal strength instead.
+    
+    Each new position can also be protected by resting stop-loss, 
+    take-profit and trailing stop orders, held in a TriggerBook. These
+    are set as fractions of the entry price and are one-cancels-other.
+    Every bar, the triggers of the symbols that have any are checked 
+    against the (adjusted) low and high of the bar, and those that fire
+    send a market order to close the position through the event queue.
+    
+    Finally, a PreTradeRiskGate (see risk_gate.py) can hold back the 
+    orders generated from signals until the end of the bar, and then 
+    resize or reject them together against exposure and leverage limits.
+    The exposure includes the orders that have been sent but not yet
+    filled (e.g. still in flight to the exchange, or queued by an 
+    OrderThrottler), as if they were filled.
+    
     The portfolio is the most complex component of an event_driven 
     backtester. In additon to the positions and holdings management, 
     the portfolio must be aware of risk factors and position sizing
@@ -46,21 +87,15 @@ class Portfolio(object):
     or other forms of market access.
     
     NOTE:
-        This potfolio object generates 'dumb' orders and does not take
-        into account risk management. 
-        
-    FUTURE IMPROVEMENTS:
-        - Replace generate_naive_order with a risk management method
-          that takes into account the n% rule (normally 1%-3%).
-        - Figure out a way to incoporate stop-loss orders 
-            - Maybe add functionality to the portfolio to excecute a
-              'Sell' FillEvent Object once the price passes a certain 
-              point.
-        
+        Without a position sizer or exit triggers, this potfolio object
+        generates 'dumb' orders and does not take into account risk 
+        management. 
     
     """
     
-    def __init__(self, bars, events, start_date, initial_capital=100000.0):
+    def __init__(self, bars, events, start_date, initial_capital=100000.0,
+                 position_sizer=None, stop_loss=None, take_profit=None,
+                 trailing_stop=None, risk_gate=None):
         """
         Initializes the portfolio with bars and an event queue. Also 
         includes a starting datetime index and initial capital (which 
@@ -76,6 +111,23 @@ class Portfolio(object):
             the start date (bar) of the portfolio.
         initial_capital : 'float', optional
             The starting capital in USD. The default is 100000.0.
+        position_sizer : 'PositionSizer', optional
+            Sizes the orders generated from signals. The default is 
+            None, i.e. orders of a fixed 100 shares.
+        stop_loss : 'float', optional
+            The distance of the stop-loss of each new position from 
+            its entry price, as a fraction, e.g. 0.05. The default is
+            None, i.e. no stop-loss.
+        take_profit : 'float', optional
+            The distance of the take-profit target of each new position
+            from its entry price, as a fraction. The default is None.
+        trailing_stop : 'float', optional
+            The distance of the trailing stop of each new position from
+            the best price since entry, as a fraction. The default is 
+            None.
+        risk_gate : 'PreTradeRiskGate', optional
+            Checks the orders generated from signals against exposure
+            limits before they are sent. The default is None.
 
         Returns
         -------
@@ -89,13 +141,50 @@ class Portfolio(object):
         self.start_date = start_date
         self.initial_capital = initial_capital
         
-        self.all_positions = self.construct_all_positions()
         self.current_positions = dict( (k,v) for k, v in 
                                       [(s, 0) for s in self.symbol_list] )
+        self.current_holdings = self.construct_current_holdings()
+        self.online_stats = OnlineStatistics()
+        
+        self.position_sizer = position_sizer
+        self._symbol_index = dict(
+            (s, i) for i, s in enumerate(self.symbol_list)
+        )
+        self._position_array = np.zeros(len(self.symbol_list))
+        self._unfilled = np.zeros(len(self.symbol_list))
+        self.latest_prices = np.full(len(self.symbol_list), np.nan)
+        self._init_triggers(stop_loss, take_profit, trailing_stop)
+        self.risk_gate = risk_gate
+        self._proposed = []
+        
+        self._init_history()
+        
         
+    def _init_history(self):
+        """
+        Sets up the positions and holdings history with the initial 
+        bar.
+
+        """
+        
+        self.all_positions = self.construct_all_positions()
         self.all_holdings = self.construct_all_holdings()
-        self.current_holdings = self.construct_current_holdings()
+        self.online_stats.update(self.initial_capital)
+        
+        
+    def _init_triggers(self, stop_loss, take_profit, trailing_stop):
+        """
+        Sets up the (initially empty) trigger book of the exit orders.
+
+        """
         
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.trailing_stop = trailing_stop
+        self.trigger_book = TriggerBook()
+        self._trigger_groups = {}
+        self._exiting = set()
+    
     
     def construct_all_positions(self):
         """
@@ -212,18 +301,20 @@ class Portfolio(object):
         dh['datetime'] = latest_datetime
         dh['cash'] = self.current_holdings['cash']
         dh['commission'] = self.current_holdings['commission']
-        dh['total'] = self.current_holdings['cash']
         
-        for s in self.symbol_list:
-            # Approximation to the real value
-            market_value = self.current_positions[s] * \
-                self.bars.get_latest_bar_value(s, "adj_close")
-            dh[s] = market_value
-            dh['total'] += market_value
-            
+        # Approximation to the real value
+        prices = self.mark_to_market()
+        market_values = self._position_array * prices
+        for i, s in enumerate(self.symbol_list):
+            dh[s] = market_values[i]
+        dh['total'] = self.current_holdings['cash'] + market_values.sum()
         
         # Append the current holdings
         self.all_holdings.append(dh)
+        self.online_stats.update(dh['total'])
+        if self.position_sizer is not None:
+            self.position_sizer.update(prices, dh['total'])
+        self.check_triggers()
         
         
         
@@ -255,7 +346,64 @@ class Portfolio(object):
             fill_dir = -1
             
         # Update positions list with new quantities
+        i = self._symbol_index[fill.symbol]
         self.current_positions[fill.symbol] += fill_dir * fill.quantity
+        self._position_array[i] += fill_dir * fill.quantity
+        self._unfilled[i] -= fill_dir * fill.quantity
+        
+        
+    def send_order(self, order):
+        """
+        Adds an order to the events queue and counts its quantity as
+        unfilled until the fills for it are received.
+
+        Parameters
+        ----------
+        order : 'OrderEvent'
+            The order to send.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self._unfilled[self._symbol_index[order.symbol]] += (
+            order.quantity if order.direction == 'BUY' else -order.quantity
+        )
+        self.events.put(order)
+        
+        
+    def mark_to_market(self):
+        """
+        Takes a snapshot of the latest adjusted close of every symbol
+        from the DataHandler, in a single call per bar. The snapshot is
+        used to value the positions and to book fills that do not come
+        with a price.
+
+        Returns
+        -------
+        'np.ndarray'
+            The latest price of every symbol, in the order of 
+            symbol_list.
+
+        """
+        
+        self.latest_prices = self.bars.get_latest_values("adj_close")
+        return self.latest_prices
+    
+    
+    def fill_price(self, fill):
+        """
+        Returns the price a fill is booked at: its fill_cost if the 
+        ExecutionHandler provided one (e.g. including slippage), or 
+        else the latest price snapshot of its symbol.
+
+        """
+        
+        if fill.fill_cost is not None:
+            return fill.fill_cost
+        return self.latest_prices[self._symbol_index[fill.symbol]]
         
         
     def update_holdings_from_fill(self, fill):
@@ -264,12 +412,12 @@ class Portfolio(object):
         the holdings values.
         
         Similar to update_positions_from_fill method but updates the
-        holdings values instead. In order to simulate the cost of fill, 
-        this method does not use the associated cost from the FillEvent. 
-        Instead, the fill cost is set to the "current maket price" which 
-        is the closing price of the last bar. The holdings for a particular
-        symbol are then set to be equal to the fill cost multiplied by the 
-        transacted quantity. 
+        holdings values instead. The fill cost is the price of the 
+        FillEvent when the ExecutionHandler provides one. Otherwise, in 
+        order to simulate the cost of fill, it is set to the "current 
+        maket price", which is the closing price of the last bar. The 
+        holdings for a particular symbol are then set to be equal to the
+        fill cost multiplied by the transacted quantity. 
 
         Parameters
         ----------
@@ -290,7 +438,7 @@ class Portfolio(object):
             fill_dir = -1
             
         # Update holdings list with new quantities
-        fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")
+        fill_cost = self.fill_price(fill)
         cost = fill_dir * fill_cost * fill.quantity
         self.current_holdings[fill.symbol] += cost
         self.current_holdings['commission'] += fill.commission
@@ -318,9 +466,98 @@ class Portfolio(object):
 
         """
         
-        if event.type == 'FILL':
+        if event.type == EventType.FILL:
+            prev_quantity = self.current_positions[event.symbol]
             self.update_positions_from_fill(event)
             self.update_holdings_from_fill(event)
+            self.update_triggers_from_fill(event, prev_quantity)
+            
+            
+    def update_triggers_from_fill(self, fill, prev_quantity):
+        """
+        Places or cancels the exit triggers of a symbol after a fill.
+        
+        Whenever the position changes, the triggers of the old position
+        are cancelled and, unless the position is now flat, a new group
+        of one-cancels-other triggers is placed around the fill price.
+
+        Parameters
+        ----------
+        fill : 'Event'
+            The FillEvent object that changed the position.
+        prev_quantity : 'int'
+            The position held before the fill.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        symbol = fill.symbol
+        cur_quantity = self.current_positions[symbol]
+        if cur_quantity == prev_quantity:
+            return
+        
+        self._exiting.discard(symbol)
+        group = self._trigger_groups.pop(symbol, None)
+        if group is not None:
+            self.trigger_book.cancel_group(group)
+        if cur_quantity == 0 or (self.stop_loss is None and 
+                                 self.take_profit is None and
+                                 self.trailing_stop is None):
+            return
+        
+        price = self.fill_price(fill)
+        sign = 1 if cur_quantity > 0 else -1
+        direction = 'SELL' if cur_quantity > 0 else 'BUY'
+        quantity = abs(cur_quantity)
+        
+        book = self.trigger_book
+        group = self._trigger_groups[symbol] = book.new_group()
+        if self.stop_loss is not None:
+            book.add_stop(symbol, price * (1 - sign * self.stop_loss),
+                          direction, quantity, group)
+        if self.take_profit is not None:
+            book.add_target(symbol, price * (1 + sign * self.take_profit),
+                            direction, quantity, group)
+        if self.trailing_stop is not None:
+            book.add_trailing_stop(symbol, price, self.trailing_stop,
+                                   direction, quantity, group)
+            
+            
+    def check_triggers(self):
+        """
+        Checks the exit triggers of every symbol that has any against 
+        the latest bar and sends a market order closing the position of
+        each symbol whose trigger fired.
+        
+        The low and high are adjusted in proportion to the adjusted
+        close, so that they are comparable with the adjusted fill 
+        prices the triggers were placed around. Signals for a symbol 
+        are ignored from the moment its trigger fires until the exit 
+        order has been filled.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        for symbol in list(self.trigger_book.symbols):
+            adj_close = self.latest_prices[self._symbol_index[symbol]]
+            ratio = adj_close / self.bars.get_latest_bar_value(symbol, "close")
+            low = self.bars.get_latest_bar_value(symbol, "low") * ratio
+            high = self.bars.get_latest_bar_value(symbol, "high") * ratio
+            
+            for trigger in self.trigger_book.update(symbol, low, high):
+                self._trigger_groups.pop(symbol, None)
+                cur_quantity = self.current_positions[symbol]
+                if cur_quantity != 0:
+                    self._exiting.add(symbol)
+                    self.send_order(OrderEvent(
+                        symbol, 'MKT', abs(cur_quantity), trigger.direction
+                    ))
             
             
             
@@ -377,13 +614,58 @@ class Portfolio(object):
         return order
     
     
+    def generate_sized_order(self, signal):
+        """
+        Files an Order object sized by the position sizer. 
+        
+        The quantity of a new long or short position is the target 
+        quantity of the symbol at the last bar, as calculated by the 
+        position sizer, scaled by the strength of the signal. Exits
+        close the whole position, as in generate_naive_order. No order 
+        is generated if the target quantity is zero, e.g. before the
+        sizer has enough bars to estimate the volatility, or if a 
+        directional sizer forecasts the other side.
+
+        Parameters
+        ----------
+        signal : 'tuple'
+            The tuple containing Signal information.
+
+        Returns
+        -------
+        'Event'
+            Returns an OrderEvent to be filled
+
+        """
+        
+        symbol = signal.symbol
+        direction = signal.signal_type
+        cur_quantity = self.current_positions[symbol]
+        
+        if direction in ('LONG', 'SHORT') and cur_quantity == 0:
+            mkt_quantity = self.position_sizer.target_quantity(
+                self._symbol_index[symbol], signal.strength, direction
+            )
+            if mkt_quantity > 0:
+                return OrderEvent(
+                    symbol, 'MKT', mkt_quantity,
+                    'BUY' if direction == 'LONG' else 'SELL'
+                )
+            return None
+        
+        return self.generate_naive_order(signal)
+    
+    
     def update_signal(self, event):
         """
         Acts on SignalEvent to generate new orders based on the portfolio 
         logic.
         
-        This method simply calls the 'generate_naive_order' method and 
-        adds the generated order to the events queue.
+        This method calls the 'generate_naive_order' method (or 
+        'generate_sized_order' if the portfolio has a position sizer) 
+        and adds the generated order to the events queue. If the 
+        portfolio has a risk gate, the order is instead held until the
+        end of the bar, when the orders of the bar are checked together.
 
         Parameters
         ----------
@@ -396,9 +678,54 @@ class Portfolio(object):
 
         """
         
-        if event.type == 'SIGNAL':
-            order_event = self.generate_naive_order(event)
-            self.events.put(order_event)
+        if event.type == EventType.SIGNAL:
+            if event.symbol in self._exiting:
+                return
+            if self.position_sizer is None:
+                order_event = self.generate_naive_order(event)
+            else:
+                order_event = self.generate_sized_order(event)
+            if order_event is None:
+                return
+            if self.risk_gate is None:
+                self.send_order(order_event)
+            else:
+                self._proposed.append(order_event)
+                
+                
+    def end_of_bar(self):
+        """
+        Passes the orders held back during the bar through the risk 
+        gate in a single batch, and sends those it approves (resized if
+        necessary) to the events queue.
+        
+        The positions that the orders are checked against include the
+        quantities of the orders sent earlier and not yet filled, so 
+        that orders in flight (or queued for sending) cannot be used to
+        exceed the limits.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if not self._proposed:
+            return
+        
+        orders = self._proposed
+        self._proposed = []
+        approved = self.risk_gate.check(
+            [self._symbol_index[o.symbol] for o in orders],
+            [o.quantity if o.direction == 'BUY' else -o.quantity 
+             for o in orders],
+            self._position_array + self._unfilled, self.latest_prices, 
+            self.online_stats.last_total
+        )
+        for order, quantity in zip(orders, approved):
+            if quantity != 0:
+                order.quantity = int(abs(quantity))
+                self.send_order(order)
             
             
             
@@ -419,7 +746,7 @@ class Portfolio(object):
         self.equity_curve = curve
         
         
-    def output_summary_stats(self):
+    def output_summary_stats(self, filename='equity.csv'):
         """
         Creates a list of summary statistics for the portfolio
         
@@ -435,6 +762,12 @@ class Portfolio(object):
             number of "bars" that teh drawdown carried on for, as 
             opposed to a particular timeframe.
 
+        Parameters
+        ----------
+        filename : 'str', optional
+            The file the equity curve is written to, or None to skip
+            writing it. The default is 'equity.csv'.
+
         Returns
         -------
         'list'
@@ -442,7 +775,7 @@ class Portfolio(object):
 
         """
         
-        total_return = self.equity_curve['equity_curve'][-1]
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
         returns = self.equity_curve['returns']
         pnl = self.equity_curve['equity_curve']
         
@@ -455,5 +788,584 @@ class Portfolio(object):
                    ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
                    ("Drawdown Duration", "%d" % dd_duration)]
         
-        self.equity_curve.to_csv('equity.csv')
-        return stats
\ No newline at end of file
+        if filename is not None:
+            self.equity_curve.to_csv(filename)
+        return stats
+    
+    
+    
+class ArrayPortfolio(Portfolio):
+    """
+    ArrayPortfolio is a Portfolio that records its positions and 
+    holdings history in preallocated NumPy arrays rather than in lists
+    of dictionaries.
+    
+    Each bar appends one row to a (bars x symbols) positions array and
+    one row to a (bars x (symbols + 3)) holdings array, whose last 
+    three columns are the cash, commission and total. The arrays double
+    in size whenever they are full, so appending is amortized O(1). 
+    The datetime of each row is held as int64 nanoseconds.
+    
+    Each bar therefore costs 8 bytes per symbol for each of the two
+    arrays (plus 32 bytes for the datetime, cash, commission and total)
+    rather than two dictionaries, and create_equity_curve_dataframe 
+    wraps the holdings array without building a DataFrame row by row.
+    
+    The all_positions and all_holdings lists of dictionaries are still
+    available for compatibility, but are built on demand.
+    """
+    
+    def __init__(self, bars, events, start_date, initial_capital=100000.0,
+                 position_sizer=None, stop_loss=None, take_profit=None,
+                 trailing_stop=None, risk_gate=None, initial_bars=1024):
+        """
+        Initializes the portfolio with bars and an event queue. Also 
+        includes a starting datetime index and initial capital (which 
+        USD unless stated otherwise).
+
+        Parameters
+        ----------
+        bars : 'DataHandler'
+            The DataHandler object with current market data.
+        events : 'Queue'
+            The Event Queue object.
+        start_date : 'datetime'
+            the start date (bar) of the portfolio.
+        initial_capital : 'float', optional
+            The starting capital in USD. The default is 100000.0.
+        position_sizer : 'PositionSizer', optional
+            Sizes the orders generated from signals. The default is 
+            None, i.e. orders of a fixed 100 shares.
+        stop_loss : 'float', optional
+            The distance of the stop-loss of each new position from 
+            its entry price, as a fraction. The default is None.
+        take_profit : 'float', optional
+            The distance of the take-profit target of each new position
+            from its entry price, as a fraction. The default is None.
+        trailing_stop : 'float', optional
+            The distance of the trailing stop of each new position from
+            the best price since entry, as a fraction. The default is 
+            None.
+        risk_gate : 'PreTradeRiskGate', optional
+            Checks the orders generated from signals against exposure
+            limits before they are sent. The default is None.
+        initial_bars : 'int', optional
+            The number of bars the history arrays are first allocated
+            for. The default is 1024.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.initial_bars = initial_bars
+        super(ArrayPortfolio, self).__init__(
+            bars, events, start_date, initial_capital, position_sizer,
+            stop_loss, take_profit, trailing_stop, risk_gate
+        )
+        
+        
+    def _init_history(self):
+        """
+        Allocates the history arrays and appends the initial bar to 
+        them.
+
+        """
+        
+        num_symbols = len(self.symbol_list)
+        self._allocate_history(self.initial_bars)
+        self._append_bar(
+            self.start_date, np.zeros(num_symbols), np.zeros(num_symbols)
+        )
+        
+        
+    def _allocate_history(self, initial_bars):
+        """
+        Allocates the empty positions and holdings history arrays.
+
+        """
+        
+        num_symbols = len(self.symbol_list)
+        self._num_bars = 0
+        self._datetimes = np.empty(initial_bars, dtype=np.int64)
+        self._positions = np.empty((initial_bars, num_symbols))
+        self._holdings = np.empty((initial_bars, num_symbols + 3))
+        
+        
+    def _history(self):
+        """
+        Returns the datetimes, positions and holdings of the filled 
+        rows of the history.
+
+        """
+        
+        n = self._num_bars
+        return self._datetimes[:n], self._positions[:n], self._holdings[:n]
+        
+        
+    def _append_bar(self, latest_datetime, positions, market_values):
+        """
+        Appends a row to the positions and holdings history, growing
+        the arrays geometrically when they are full.
+
+        Parameters
+        ----------
+        latest_datetime : 'datetime'
+            The datetime of the bar.
+        positions : 'np.ndarray'
+            The position held in each symbol.
+        market_values : 'np.ndarray'
+            The market value of each position.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        i = self._num_bars
+        if i == len(self._datetimes):
+            capacity = 2 * i
+            self._datetimes = np.resize(self._datetimes, capacity)
+            self._positions = np.resize(
+                self._positions, (capacity, self._positions.shape[1])
+            )
+            self._holdings = np.resize(
+                self._holdings, (capacity, self._holdings.shape[1])
+            )
+            
+        self._datetimes[i] = datetime_ns(latest_datetime)
+            
+        cash = self.current_holdings['cash']
+        self._positions[i] = positions
+        row = self._holdings[i]
+        row[:-3] = market_values
+        row[-3:] = (cash, self.current_holdings['commission'],
+                    cash + market_values.sum())
+        self._num_bars = i + 1
+        self.online_stats.update(row[-1])
+        
+        
+    @property
+    def all_positions(self):
+        """
+        The positions history as a list of dictionaries, in the format
+        of Portfolio.all_positions.
+
+        """
+        
+        frame = self.create_positions_dataframe().reset_index()
+        return frame.to_dict('records')
+    
+    
+    @property
+    def all_holdings(self):
+        """
+        The holdings history as a list of dictionaries, in the format
+        of Portfolio.all_holdings.
+
+        """
+        
+        frame = self._holdings_dataframe().reset_index()
+        return frame.to_dict('records')
+    
+    
+    def update_timeindex(self, event):
+        """
+        Appends a new row to the positions and holdings arrays for the
+        current market data bar. This reflects the PREVIOUS bar, i.e. 
+        all current market data at this stage is known (OHLCV).
+
+        Parameters
+        ----------
+        event : Event
+            The event to be handled (i.e. MarketEvent)
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        latest_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        
+        positions = self._position_array
+        prices = self.mark_to_market()
+        
+        # Approximation to the real value
+        self._append_bar(latest_datetime, positions, positions * prices)
+        if self.position_sizer is not None:
+            self.position_sizer.update(prices, self.online_stats.last_total)
+        self.check_triggers()
+        
+        
+    def _datetime_index(self, datetimes):
+        """
+        Returns int64 nanosecond datetimes as a DatetimeIndex.
+
+        """
+        
+        return pd.DatetimeIndex(
+            np.asarray(datetimes).view('datetime64[ns]'), name='datetime'
+        )
+    
+    
+    def _holdings_dataframe(self):
+        """
+        Wraps the filled rows of the holdings array in a DataFrame
+        without copying them.
+
+        """
+        
+        datetimes, _, holdings = self._history()
+        return pd.DataFrame(
+            holdings, 
+            index=self._datetime_index(datetimes),
+            columns=list(self.symbol_list) + ['cash', 'commission', 'total'],
+            copy=False
+        )
+    
+    
+    def create_positions_dataframe(self):
+        """
+        Wraps the filled rows of the positions array in a DataFrame
+        without copying them.
+
+        Returns
+        -------
+        'pd.DataFrame'
+            The positions held in each symbol at each bar.
+
+        """
+        
+        datetimes, positions, _ = self._history()
+        return pd.DataFrame(
+            positions,
+            index=self._datetime_index(datetimes),
+            columns=list(self.symbol_list), copy=False
+        )
+    
+    
+    def create_equity_curve_dataframe(self):
+        """
+        Creates the equity curve DataFrame directly from the holdings
+        array, adding the returns stream and the normalised equity 
+        curve as in Portfolio.create_equity_curve_dataframe.
+
+        """
+        
+        curve = self._holdings_dataframe()
+        curve['returns'] = curve['total'].pct_change()
+        curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+        self.equity_curve = curve
+
+        
+        
+        
+class MultiStrategyPortfolio(Portfolio):
+    """
+    MultiStrategyPortfolio trades the signals of several strategies
+    (see MultiStrategy) from a single account, while keeping a separate
+    sub-book of positions and cash for each strategy_id.
+    
+    Signals do not generate orders straight away. Instead, each signal
+    is converted into a change in the position of its strategy's 
+    sub-book, and at the end of the bar the changes of every strategy
+    are netted per symbol, so that only a single order for the net 
+    quantity is sent to the market. Opposing orders are crossed 
+    internally, saving their commission and market impact.
+    
+    Every change is booked to its sub-book at the latest adjusted 
+    close. When the net order is filled, the difference between the 
+    fill price and that price, and the commission, are allocated to 
+    the strategies on the side of the net order in proportion to their
+    quantities. A fill that covers the net orders of several bars 
+    (e.g. coalesced by an OrderThrottler) is split across them, oldest
+    first, in proportion to the quantity it fills of each. The PnL of 
+    each sub-book is recorded every bar, so the performance of the 
+    account can be attributed to its strategies.
+    
+    With a risk gate, the net orders of the bar are checked together 
+    before they are sent. When a net order is resized, the changes of
+    the strategies on its side are scaled down in proportion to their
+    quantities (the changes crossed against them are kept), so that 
+    the sub-books still add up to the account.
+    
+    NOTE:
+        Exit triggers would act on the aggregate positions, which 
+        cannot be attributed to a single strategy, so they are not 
+        supported. A position sizer sizes each strategy's positions 
+        independently.
+    """
+    
+    def __init__(self, bars, events, start_date, initial_capital=100000.0,
+                 position_sizer=None, stop_loss=None, take_profit=None,
+                 trailing_stop=None, risk_gate=None):
+        """
+        Initializes the portfolio with bars and an event queue. Also 
+        includes a starting datetime index and initial capital (which 
+        USD unless stated otherwise).
+
+        Parameters
+        ----------
+        bars : 'DataHandler'
+            The DataHandler object with current market data.
+        events : 'Queue'
+            The Event Queue object.
+        start_date : 'datetime'
+            the start date (bar) of the portfolio.
+        initial_capital : 'float', optional
+            The starting capital in USD. The default is 100000.0.
+        position_sizer : 'PositionSizer', optional
+            Sizes the orders generated from signals. The default is 
+            None, i.e. orders of a fixed 100 shares.
+        stop_loss, take_profit, trailing_stop : 'float', optional
+            Not supported, and must be None.
+        risk_gate : 'PreTradeRiskGate', optional
+            Checks the net orders of each bar against exposure limits
+            before they are sent. The default is None.
+
+        Raises
+        ------
+        ValueError
+            If an exit trigger is given.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if (stop_loss is not None or take_profit is not None or 
+                trailing_stop is not None):
+            raise ValueError(
+                "MultiStrategyPortfolio does not support exit triggers"
+            )
+        super(MultiStrategyPortfolio, self).__init__(
+            bars, events, start_date, initial_capital, position_sizer,
+            risk_gate=risk_gate
+        )
+        
+        self.strategy_positions = {}
+        self.strategy_cash = {}
+        self.all_strategy_pnl = []
+        self.crossed_quantity = 0
+        
+        self._pending = {}
+        self._allocations = dict((s, deque()) for s in self.symbol_list)
+        
+        
+    def _sub_book(self, strategy_id):
+        """
+        Returns the positions of a strategy's sub-book, creating an 
+        empty sub-book the first time the strategy is seen.
+
+        """
+        
+        positions = self.strategy_positions.get(strategy_id)
+        if positions is None:
+            positions = self.strategy_positions[strategy_id] = dict(
+                (s, 0) for s in self.symbol_list
+            )
+            self.strategy_cash[strategy_id] = 0.0
+        return positions
+    
+    
+    def update_timeindex(self, event):
+        """
+        Records the holdings of the account, as in 
+        Portfolio.update_timeindex, and the PnL of every sub-book.
+
+        """
+        
+        super(MultiStrategyPortfolio, self).update_timeindex(event)
+        
+        prices = self.latest_prices
+        pnl = {'datetime': self.all_holdings[-1]['datetime']}
+        for strategy_id, positions in self.strategy_positions.items():
+            pnl[strategy_id] = self.strategy_cash[strategy_id] + sum(
+                q * prices[self._symbol_index[s]] 
+                for s, q in positions.items() if q != 0
+            )
+        self.all_strategy_pnl.append(pnl)
+        
+        
+    def generate_strategy_quantity(self, signal):
+        """
+        Converts a signal into the change in the position of its 
+        strategy's sub-book, following the rules of 
+        generate_naive_order (or generate_sized_order) but applied to
+        the sub-book rather than the whole account.
+
+        Parameters
+        ----------
+        signal : 'tuple'
+            The tuple containing Signal information.
+
+        Returns
+        -------
+        'int'
+            The signed change in position, positive to buy.
+
+        """
+        
+        symbol = signal.symbol
+        direction = signal.signal_type
+        cur_quantity = self._sub_book(signal.strategy_id)[symbol]
+        
+        if direction in ('LONG', 'SHORT') and cur_quantity == 0:
+            if self.position_sizer is None:
+                mkt_quantity = 100
+            else:
+                mkt_quantity = self.position_sizer.target_quantity(
+                    self._symbol_index[symbol], signal.strength, direction
+                )
+            return mkt_quantity if direction == 'LONG' else -mkt_quantity
+        if direction == 'EXIT':
+            return -cur_quantity
+        return 0
+    
+    
+    def update_signal(self, event):
+        """
+        Queues the change in position asked for by a SignalEvent until
+        the end of the bar.
+
+        """
+        
+        if event.type == EventType.SIGNAL:
+            quantity = self.generate_strategy_quantity(event)
+            if quantity != 0:
+                self._pending.setdefault(event.symbol, []).append(
+                    (event.strategy_id, quantity)
+                )
+                
+                
+    def _scale_changes(self, changes, net, approved):
+        """
+        Scales down the changes on the side of a net order so that the
+        changes of a symbol net to the quantity approved by the risk 
+        gate, keeping those crossed against them.
+
+        """
+        
+        same_side = sum(q for _, q in changes if q * net > 0)
+        target = approved - (net - same_side)
+        scaled = [
+            (strategy_id, int(q * target / same_side) if q * net > 0 else q)
+            for strategy_id, q in changes
+        ]
+        
+        # Give the shares lost to rounding to the largest change
+        shortfall = target - sum(q for _, q in scaled if q * net > 0)
+        if shortfall:
+            k = max(
+                (k for k in range(len(changes)) if changes[k][1] * net > 0),
+                key=lambda k: abs(changes[k][1])
+            )
+            scaled[k] = (scaled[k][0], scaled[k][1] + shortfall)
+        return scaled
+        
+        
+    def end_of_bar(self):
+        """
+        Books the queued changes of the bar to their sub-books and
+        sends one order per symbol for the net change of all of the
+        strategies, resized by the risk gate if there is one.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if not self._pending:
+            return
+        
+        if self.risk_gate is not None:
+            symbols = list(self._pending)
+            nets = [sum(q for _, q in self._pending[s]) for s in symbols]
+            approved = self.risk_gate.check(
+                [self._symbol_index[s] for s in symbols], nets,
+                self._position_array + self._unfilled, self.latest_prices,
+                self.online_stats.last_total
+            )
+            for symbol, net, quantity in zip(symbols, nets, approved):
+                if quantity != net:
+                    self._pending[symbol] = self._scale_changes(
+                        self._pending[symbol], net, int(quantity)
+                    )
+        
+        for symbol, changes in self._pending.items():
+            price = self.latest_prices[self._symbol_index[symbol]]
+            net = 0
+            for strategy_id, quantity in changes:
+                self._sub_book(strategy_id)[symbol] += quantity
+                self.strategy_cash[strategy_id] -= quantity * price
+                net += quantity
+                
+            same_side = [(strategy_id, quantity) for strategy_id, quantity 
+                         in changes if quantity * net > 0]
+            gross = sum(abs(quantity) for _, quantity in changes)
+            self.crossed_quantity += (gross - abs(net)) // 2
+            if net == 0:
+                continue
+            
+            weights = [(strategy_id, float(quantity) / net) 
+                       for strategy_id, quantity in same_side]
+            self._allocations[symbol].append([abs(net), price, weights])
+            self.send_order(OrderEvent(
+                symbol, 'MKT', abs(net), 'BUY' if net > 0 else 'SELL'
+            ))
+        self._pending = {}
+        
+        
+    def update_fill(self, event):
+        """
+        Updates the account from a FillEvent, as in 
+        Portfolio.update_fill, and allocates the fill's commission and
+        its price difference from the booked price to the strategies
+        whose net order it filled.
+
+        """
+        
+        super(MultiStrategyPortfolio, self).update_fill(event)
+        if event.type != EventType.FILL:
+            return
+        
+        allocations = self._allocations[event.symbol]
+        fill_dir = 1 if event.direction == 'BUY' else -1
+        fill_price = self.fill_price(event)
+        quantity = event.quantity
+        while quantity > 0 and allocations:
+            allocation = allocations[0]
+            remaining, booked_price, weights = allocation
+            filled = min(quantity, remaining)
+            cost = fill_dir * filled * (fill_price - booked_price) + \
+                event.commission * filled / event.quantity
+            for strategy_id, weight in weights:
+                self.strategy_cash[strategy_id] -= weight * cost
+                
+            allocation[0] = remaining - filled
+            quantity -= filled
+            if allocation[0] <= 0:
+                allocations.popleft()
+            
+            
+    def create_strategy_pnl_dataframe(self):
+        """
+        Creates a Pandas DataFrame of the PnL of each strategy's 
+        sub-book at every bar, in USD. The PnL of the strategies sums
+        to the change in the total account equity.
+
+        Returns
+        -------
+        'pd.DataFrame'
+            One column per strategy_id.
+
+        """
+        
+        pnl = pd.DataFrame(self.all_strategy_pnl)
+        pnl.set_index('datetime', inplace=True)
+        return pnl.fillna(0.0)
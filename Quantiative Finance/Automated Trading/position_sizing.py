@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized risk-based position sizing.
+"""
+
+
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+
+class RollingVolatility(object):
+    """
+    Maintains rolling estimates of the mean and standard deviation of
+    the period returns of every symbol over a fixed window of bars.
+
+    The last 'window' returns are held in a preallocated (window x
+    symbols) array alongside running sums and sums of squares, so
+    each update is a handful of vectorized operations over the symbols,
+    regardless of the window length (the sums are recomputed from the
+    window once every 'window' updates). Missing (NaN) prices or returns
+    are excluded from a symbol's estimates.
+    """
+
+    def __init__(self, num_symbols, window=20):
+        """
+        Initializes the estimator.
+
+        Parameters
+        ----------
+        num_symbols : 'int'
+            The number of symbols.
+        window : 'int', optional
+            The number of returns in the rolling window. The default
+            is 20.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.window = window
+        self._returns = np.zeros((window, num_symbols))
+        self._valid = np.zeros((window, num_symbols), dtype=bool)
+        self._sum = np.zeros(num_symbols)
+        self._sum_sq = np.zeros(num_symbols)
+        self._count = np.zeros(num_symbols)
+        self._head = 0
+        self._last_prices = None
+
+
+    def update(self, prices):
+        """
+        Adds the returns from the previous prices to the latest prices.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            The latest price of every symbol.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        last_prices = self._last_prices
+        self._last_prices = np.array(prices, dtype=np.float64)
+        if last_prices is None:
+            return
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices / last_prices - 1.0
+        valid = np.isfinite(returns)
+        returns = np.where(valid, returns, 0.0)
+
+        # Remove the oldest returns in the window and add the latest
+        head = self._head
+        old = self._returns[head]
+        old_valid = self._valid[head]
+        self._sum += returns - old
+        self._sum_sq += returns * returns - old * old
+        self._count += valid.astype(np.float64) - old_valid
+
+        self._returns[head] = returns
+        self._valid[head] = valid
+        self._head = (head + 1) % self.window
+
+        # Resum the window once per cycle, so that rounding errors in
+        # the running sums do not accumulate (e.g. leaving a spurious
+        # volatility once a symbol's price stops changing)
+        if self._head == 0:
+            self._sum = self._returns.sum(axis=0)
+            self._sum_sq = (self._returns * self._returns).sum(axis=0)
+            self._count = self._valid.sum(axis=0).astype(np.float64)
+
+
+    @property
+    def mean(self):
+        """
+        The mean period return of every symbol (NaN until available).
+
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self._count > 0, self._sum / self._count, np.nan)
+
+
+    @property
+    def volatility(self):
+        """
+        The standard deviation of the period returns of every symbol
+        (NaN until at least two returns are available).
+
+        """
+
+        count = self._count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (self._sum_sq - self._sum * self._sum / count) / (count - 1)
+        return np.where(count > 1, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+
+
+class PositionSizer(object):
+    """
+    PositionSizer is an abstract base class providing an interface for
+    all subsequent (inherited) position sizing objects.
+
+    A PositionSizer replaces the fixed 100 shares of
+    Portfolio.generate_naive_order. Once per bar the Portfolio passes
+    it the latest prices and total equity, and it computes the target
+    quantity of every symbol in a single vectorized pass, from rolling
+    estimates of the return volatility of every symbol. Each signal is
+    then sized with an O(1) lookup of its symbol's target quantity,
+    scaled by the signal strength.
+
+    A directional sizer (e.g. the Kelly criterion) also forecasts the
+    side of each position through the sign of its target notional, and
+    gives no size to the signals of the other side.
+    """
+
+    __metaclass__ = ABCMeta
+
+    # Whether the sign of the target notional is the side to trade
+    directional = False
+
+    def __init__(self, num_symbols, window=20):
+        """
+        Initializes the sizer.
+
+        Parameters
+        ----------
+        num_symbols : 'int'
+            The number of symbols.
+        window : 'int', optional
+            The number of bars used to estimate the volatility. The
+            default is 20.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.estimator = RollingVolatility(num_symbols, window)
+        self.targets = np.zeros(num_symbols, dtype=np.int64)
+        self.sides = np.zeros(num_symbols, dtype=np.int64)
+
+
+    def update(self, prices, equity):
+        """
+        Updates the volatility estimates with the latest prices and
+        recomputes the target quantity of every symbol.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            The latest price of every symbol.
+        equity : 'float'
+            The total account equity.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.estimator.update(prices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            notional = self.target_notional(prices, equity)
+            quantities = np.floor(np.abs(notional) / prices)
+        valid = np.isfinite(quantities)
+        self.targets = np.where(valid, quantities, 0).astype(np.int64)
+        self.sides = np.where(valid, np.sign(notional), 0).astype(np.int64)
+
+
+    def target_quantity(self, i, strength=1.0, direction=None):
+        """
+        Returns the number of shares to trade in the i-th symbol for a
+        signal of the given strength.
+
+        Parameters
+        ----------
+        i : 'int'
+            The index of the symbol.
+        strength : 'float', optional
+            The strength of the signal. The default is 1.0.
+        direction : 'str', optional
+            'LONG' or 'SHORT'. A directional sizer returns zero for a
+            direction that disagrees with its forecast. The default is
+            None, i.e. either direction.
+
+        Returns
+        -------
+        'int'
+            The (unsigned) number of shares.
+
+        """
+
+        if self.directional and direction is not None:
+            side = 1 if direction == 'LONG' else -1
+            if self.sides[i] != side:
+                return 0
+        return int(self.targets[i] * abs(strength))
+
+
+    @abstractmethod
+    def target_notional(self, prices, equity):
+        """
+        Calculates the target dollar value of a position in every
+        symbol.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            The latest price of every symbol.
+        equity : 'float'
+            The total account equity.
+
+        Returns
+        -------
+        'np.ndarray'
+            The target position value of every symbol, negative for a
+            short position if the sizer is directional.
+
+        """
+
+        raise NotImplementedError("Should implement target_notional()")
+
+
+
+class FixedFractionalSizer(PositionSizer):
+    """
+    Sizes positions with the n% rule: each position risks a fixed
+    fraction of the account equity (normally 1%-3%).
+
+    The risk per share is taken to be 'stop_multiple' standard
+    deviations of the price move over a bar, i.e. the distance to a
+    notional volatility-based stop-loss.
+    """
+
+    def __init__(self, num_symbols, fraction=0.01, stop_multiple=2.0,
+                 window=20):
+        """
+        Initializes the sizer.
+
+        Parameters
+        ----------
+        num_symbols : 'int'
+            The number of symbols.
+        fraction : 'float', optional
+            The fraction of equity risked per position. The default is
+            0.01.
+        stop_multiple : 'float', optional
+            The number of standard deviations to the notional stop. The
+            default is 2.0.
+        window : 'int', optional
+            The number of bars used to estimate the volatility. The
+            default is 20.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        super(FixedFractionalSizer, self).__init__(num_symbols, window)
+        self.fraction = fraction
+        self.stop_multiple = stop_multiple
+
+
+    def target_notional(self, prices, equity):
+        """
+        Returns the position values that lose 'fraction' of the equity
+        if the stop is hit.
+
+        """
+
+        risk_per_dollar = self.stop_multiple * self.estimator.volatility
+        return self.fraction * equity / risk_per_dollar
+
+
+
+class VolatilityTargetSizer(PositionSizer):
+    """
+    Sizes positions so that each contributes an equal share of a target
+    annualised portfolio volatility, i.e. positions are inversely
+    proportional to the volatility of their symbol.
+    """
+
+    def __init__(self, num_symbols, target_volatility=0.1, periods=252,
+                 window=20):
+        """
+        Initializes the sizer.
+
+        Parameters
+        ----------
+        num_symbols : 'int'
+            The number of symbols.
+        target_volatility : 'float', optional
+            The annualised volatility targeted by the portfolio. The
+            default is 0.1.
+        periods : 'int', optional
+            Daily (252., Hourly (252*6.5), Minutley(252*6.5*60) etc.
+            The default is 252.
+        window : 'int', optional
+            The number of bars used to estimate the volatility. The
+            default is 20.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        super(VolatilityTargetSizer, self).__init__(num_symbols, window)
+        self.target_volatility = target_volatility
+        self.periods = periods
+        self.num_symbols = num_symbols
+
+
+    def target_notional(self, prices, equity):
+        """
+        Returns the position values whose annualised volatility is
+        target_volatility / num_symbols of the equity.
+
+        """
+
+        annual_vol = self.estimator.volatility * np.sqrt(self.periods)
+        budget = equity * self.target_volatility / self.num_symbols
+        return budget / annual_vol
+
+
+
+class FractionalKellySizer(PositionSizer):
+    """
+    Sizes positions with a fraction of the Kelly criterion, using the
+    rolling mean and variance of each symbol's returns. The leverage of
+    each position, mean / variance, is treated independently (ignoring
+    correlations), scaled down by 'fraction' and capped at
+    'max_leverage' either way. The sign of the leverage is the side
+    that the returns favour, so symbols with a positive expected return
+    are sized only for long signals and those with a negative expected
+    return only for short signals.
+    """
+
+    directional = True
+
+    def __init__(self, num_symbols, fraction=0.5, max_leverage=1.0,
+                 window=60):
+        """
+        Initializes the sizer.
+
+        Parameters
+        ----------
+        num_symbols : 'int'
+            The number of symbols.
+        fraction : 'float', optional
+            The fraction of the full Kelly leverage used. The default
+            is 0.5 ("half Kelly").
+        max_leverage : 'float', optional
+            The largest position value allowed per symbol, as a
+            multiple of equity. The default is 1.0.
+        window : 'int', optional
+            The number of bars used to estimate the mean and variance.
+            The default is 60.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        super(FractionalKellySizer, self).__init__(num_symbols, window)
+        self.fraction = fraction
+        self.max_leverage = max_leverage
+
+
+    def target_notional(self, prices, equity):
+        """
+        Returns the fractional Kelly position values, negative for
+        short positions.
+
+        """
+
+        kelly = self.estimator.mean / self.estimator.volatility ** 2
+        leverage = np.clip(
+            self.fraction * kelly, -self.max_leverage, self.max_leverage
+        )
+        return equity * leverage
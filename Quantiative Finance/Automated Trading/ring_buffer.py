@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fixed-capacity ring buffers of the latest bars of each symbol.
+"""
+
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    A fixed capacity, preallocated circular buffer of scalar values
+    that can always return the most recent N values as a contiguous,
+    zero-copy NumPy view.
+
+    Every value is written twice, once into each half of an array
+    of twice the capacity. The latest N values are therefore always
+    stored next to each other in the second half of the array (or
+    straddling the middle), so no wrap-around copy is ever needed
+    when a window is requested.
+
+    Appending and windowed access are both O(1) and the memory used
+    is fixed at construction, regardless of how many values are
+    pushed through the buffer.
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        """
+        Initializes the buffer.
+
+        Parameters
+        ----------
+        capacity : 'int'
+            The maximum number of values retained.
+        dtype : 'np.dtype', optional
+            The dtype of the stored values. The default is np.float64.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        if capacity <= 0:
+            raise ValueError("RingBuffer capacity must be positive")
+
+        self.capacity = capacity
+        self._data = np.empty(2 * capacity, dtype=dtype)
+        self._head = 0
+        self._count = 0
+
+
+    def __len__(self):
+        return self._count
+
+
+    def append(self, value):
+        """
+        Adds a value to the buffer, overwriting the oldest value
+        once the buffer is full.
+
+        """
+
+        head = self._head
+        self._data[head] = value
+        self._data[head + self.capacity] = value
+
+        head += 1
+        self._head = 0 if head == self.capacity else head
+        if self._count < self.capacity:
+            self._count += 1
+
+
+    def last(self):
+        """
+        Returns the most recently appended value.
+
+        """
+
+        if self._count == 0:
+            raise IndexError("RingBuffer is empty")
+        return self._data[self._head - 1]
+
+
+    def latest(self, N=1):
+        """
+        Returns a read-only view of the last N values, in the order
+        in which they were appended, or N-k if less available.
+
+        """
+
+        if N > self.capacity:
+            raise ValueError(
+                "Requested %s values from a RingBuffer of capacity %s" %
+                (N, self.capacity)
+            )
+
+        end = self._head + self.capacity
+        window = self._data[end - min(N, self._count):end]
+        window.flags.writeable = False
+        return window
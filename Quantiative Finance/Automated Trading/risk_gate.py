@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A vectorized pre-trade check of orders against exposure limits.
+"""
+
+
+import numpy as np
+
+
+class PreTradeRiskGate(object):
+    """
+    PreTradeRiskGate checks a batch of proposed orders against the
+    exposure limits of a portfolio before they are sent to the market,
+    resizing (or rejecting) the orders that would breach a limit.
+
+    All limits are fractions of the total account equity and are
+    optional:
+        - max_position_weight caps the absolute value of the position
+          in any one symbol.
+        - max_sector_exposure caps the gross (long plus short) value of
+          the positions in each sector.
+        - max_gross_leverage caps the gross value of all positions,
+          i.e. the margin used (e.g. 2.0 under Reg T).
+        - max_net_leverage caps the absolute value of the net (long
+          minus short) exposure.
+
+    Every position is split into the part that an order leaves in place
+    and the extra exposure it adds. Orders that only reduce a position
+    have no extra exposure and are always accepted, so exits are never
+    blocked. Each limit in turn scales down the extra exposure of the
+    orders that add to it, all symbols at once, using the positions and
+    prices held by the portfolio as arrays. Quantities are rounded
+    towards zero, so the approved orders never breach a position,
+    sector or gross limit that the current positions are within (the
+    net limit can be exceeded by the rounding of the orders on its
+    other side, i.e. by less than one share per symbol).
+    """
+
+    def __init__(self, symbol_list, max_position_weight=None,
+                 max_sector_exposure=None, max_gross_leverage=None,
+                 max_net_leverage=None, sectors=None):
+        """
+        Initializes the risk gate.
+
+        Parameters
+        ----------
+        symbol_list : 'list'
+            A list of symbol strings, in the order of the portfolio's
+            position and price arrays.
+        max_position_weight : 'float', optional
+            The largest position value in a single symbol. The default
+            is None, i.e. no limit.
+        max_sector_exposure : 'float', optional
+            The largest gross position value in a single sector. The
+            default is None.
+        max_gross_leverage : 'float', optional
+            The largest gross position value. The default is None.
+        max_net_leverage : 'float', optional
+            The largest absolute net position value. The default is
+            None.
+        sectors : 'dict', optional
+            Maps each symbol onto its sector. Symbols without a sector
+            are not subject to the sector limit. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.symbol_list = list(symbol_list)
+        self.max_position_weight = max_position_weight
+        self.max_sector_exposure = max_sector_exposure
+        self.max_gross_leverage = max_gross_leverage
+        self.max_net_leverage = max_net_leverage
+
+        sectors = sectors or {}
+        names = sorted(set(sectors.values()))
+        self.sector_names = names
+        self._sector_ids = np.array([
+            names.index(sectors[s]) if s in sectors else len(names)
+            for s in self.symbol_list
+        ], dtype=np.intp)
+
+        self.orders_checked = 0
+        self.orders_resized = 0
+        self.orders_rejected = 0
+
+
+    def _scale(self, extra_value, budget, scale, mask=None):
+        """
+        Scales down the extra exposures (of the masked symbols) so that
+        their total fits in the budget.
+
+        """
+
+        if mask is None:
+            mask = slice(None)
+        total = np.abs(extra_value[mask] * scale[mask]).sum()
+        if total > budget:
+            scale[mask] *= max(budget, 0.0) / total
+
+
+    def check(self, symbols, quantities, positions, prices, equity):
+        """
+        Checks a batch of orders against the limits.
+
+        Parameters
+        ----------
+        symbols : 'np.ndarray'
+            The index of the symbol of each order.
+        quantities : 'np.ndarray'
+            The signed quantity of each order, positive to buy.
+        positions : 'np.ndarray'
+            The current position in every symbol.
+        prices : 'np.ndarray'
+            The latest price of every symbol.
+        equity : 'float'
+            The total account equity.
+
+        Returns
+        -------
+        'np.ndarray'
+            The approved signed quantity of each order, zero for
+            rejected orders.
+
+        """
+
+        symbols = np.asarray(symbols, dtype=np.intp)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        num_symbols = len(positions)
+        prices = np.where(np.isfinite(prices), prices, 0.0)
+
+        # The net quantity proposed for each symbol
+        delta = np.bincount(symbols, quantities, minlength=num_symbols)
+        post = positions + delta
+
+        # The part of each position left in place and the extra added
+        same_side = np.sign(post) == np.sign(positions)
+        base = np.where(
+            same_side & (np.abs(post) >= np.abs(positions)), positions,
+            np.where(same_side, post, 0.0)
+        )
+        extra = post - base
+
+        if self.max_position_weight is not None:
+            cap = self.max_position_weight * equity
+            with np.errstate(divide='ignore', invalid='ignore'):
+                room = np.maximum(cap / prices - np.abs(base), 0.0)
+            extra = np.sign(extra) * np.minimum(np.abs(extra), room)
+
+        scale = np.ones(num_symbols)
+        extra_value = extra * prices
+        base_value = base * prices
+
+        if self.max_sector_exposure is not None:
+            num_sectors = len(self.sector_names) + 1
+            cap = self.max_sector_exposure * equity
+            ids = self._sector_ids
+            base_gross = np.bincount(ids, np.abs(base_value), num_sectors)
+            extra_gross = np.bincount(ids, np.abs(extra_value), num_sectors)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sector_scale = np.where(
+                    extra_gross > cap - base_gross,
+                    np.maximum(cap - base_gross, 0.0) / extra_gross, 1.0
+                )
+            sector_scale[-1] = 1.0
+            scale *= sector_scale[ids]
+
+        if self.max_gross_leverage is not None:
+            self._scale(
+                extra_value,
+                self.max_gross_leverage * equity - np.abs(base_value).sum(),
+                scale
+            )
+
+        if self.max_net_leverage is not None:
+            cap = self.max_net_leverage * equity
+            net = base_value.sum() + (extra_value * scale).sum()
+            if abs(net) > cap:
+                # Only scale the extras on the side of the breach
+                side = np.sign(net)
+                adding = np.sign(extra_value) == side
+                other = base_value.sum() + (extra_value * scale)[~adding].sum()
+                self._scale(
+                    extra_value, side * (side * cap - other), scale, adding
+                )
+
+        approved = base + np.trunc(extra * scale) - positions
+
+        # Share the approved quantity of each symbol among its orders
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(delta != 0, approved / delta, 0.0)
+        result = np.trunc(quantities * np.clip(ratio[symbols], 0.0, 1.0))
+
+        self.orders_checked += len(quantities)
+        self.orders_rejected += int(((result == 0) & (quantities != 0)).sum())
+        self.orders_resized += int(
+            ((result != 0) & (result != quantities)).sum()
+        )
+        return result
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Behavioural checks of the PreTradeRiskGate. Run as a script; an
+AssertionError means a check failed.
+"""
+
+
+import numpy as np
+
+from risk_gate import PreTradeRiskGate
+
+
+SYMBOLS = ['A', 'B', 'C']
+PRICES = np.array([10.0, 20.0, 50.0])
+EQUITY = 10000.0
+
+
+def check_position_limit():
+    """
+    Resizes the orders that would take a position beyond 10% of the
+    equity, sharing the room left in a symbol among its orders.
+
+    """
+
+    gate = PreTradeRiskGate(SYMBOLS, max_position_weight=0.1)
+    positions = np.array([50.0, 0.0, 0.0])
+
+    # A has room for 50 more shares, B for a short of 50
+    approved = gate.check(
+        [0, 1, 2], [100, -100, 10], positions, PRICES, EQUITY
+    )
+    assert list(approved) == [50, -50, 10]
+    assert gate.orders_checked == 3
+    assert gate.orders_resized == 2 and gate.orders_rejected == 0
+
+    # Two orders in A share its room in proportion to their size
+    approved = gate.check([0, 0], [60, 40], positions, PRICES, EQUITY)
+    assert list(approved) == [30, 20]
+
+
+def check_exits_never_blocked():
+    """
+    Accepts the orders that reduce a position already beyond the limit,
+    and rejects those that add to it.
+
+    """
+
+    gate = PreTradeRiskGate(SYMBOLS, max_position_weight=0.1)
+    positions = np.array([200.0, 0.0, 0.0])
+
+    assert list(gate.check([0], [-50], positions, PRICES, EQUITY)) == [-50]
+    assert list(gate.check([0], [10], positions, PRICES, EQUITY)) == [0]
+    assert gate.orders_rejected == 1
+
+    # Flipping the position keeps the exit and caps the new short
+    assert list(gate.check([0], [-300], positions, PRICES, EQUITY)) == [-300]
+    assert list(gate.check([0], [-350], positions, PRICES, EQUITY)) == [-300]
+
+
+def check_sector_limit():
+    """
+    Scales down the orders that add to the gross exposure of a sector
+    beyond 30% of the equity, leaving symbols without a sector alone.
+
+    """
+
+    gate = PreTradeRiskGate(
+        SYMBOLS, max_sector_exposure=0.3, sectors={'A': 'tech', 'B': 'tech'}
+    )
+    positions = np.array([100.0, 0.0, 0.0])
+
+    # The sector holds 1000 and the orders add 3000 against a room of
+    # 2000, so both are scaled by 2/3
+    approved = gate.check(
+        [0, 1, 2], [100, -100, 100], positions, PRICES, EQUITY
+    )
+    assert list(approved) == [66, -66, 100]
+    gross = np.abs((positions + np.bincount([0, 1, 2], approved)) * PRICES)
+    assert gross[:2].sum() <= 0.3 * EQUITY
+
+
+def check_gross_limit():
+    """
+    Scales down all the orders that add to the gross exposure once it
+    would exceed the equity.
+
+    """
+
+    gate = PreTradeRiskGate(SYMBOLS, max_gross_leverage=1.0)
+    positions = np.array([0.0, 0.0, 100.0])
+
+    approved = gate.check([0, 1], [500, 250], positions, PRICES, EQUITY)
+    assert list(approved) == [250, 125]
+    post = positions + np.bincount([0, 1], approved, minlength=3)
+    assert np.abs(post * PRICES).sum() <= EQUITY
+
+
+def check_net_limit():
+    """
+    Scales down only the orders on the side of a breach of the net
+    limit, counting the orders on the other side against it.
+
+    """
+
+    gate = PreTradeRiskGate(SYMBOLS, max_net_leverage=0.2)
+    positions = np.zeros(3)
+
+    # A net of 2500 against a limit of 2000: the buy is cut to 2500
+    # so that the short of 500 brings the net back to the limit
+    approved = gate.check([0, 1], [300, -25], positions, PRICES, EQUITY)
+    assert list(approved) == [250, -25]
+    post = positions + np.bincount([0, 1], approved, minlength=3)
+    assert abs((post * PRICES).sum()) <= 0.2 * EQUITY
+    assert gate.orders_resized == 1 and gate.orders_rejected == 0
+
+
+
+if __name__ == "__main__":
+    check_position_limit()
+    check_exits_never_blocked()
+    check_sector_limit()
+    check_gross_limit()
+    check_net_limit()
+    print("PreTradeRiskGate checks passed")
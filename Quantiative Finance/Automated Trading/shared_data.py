@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shares one copy of the market data between the workers of a
+ParameterSweep.
+"""
+
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from data import BAR_FIELDS, HistoricCSVArrayDataHandler
+
+
+class SharedBarStore(object):
+    """
+    SharedBarStore holds the aligned bar arrays of a set of symbols in
+    a single block of shared memory, so that many backtest processes
+    on the same machine can read one copy of the market data.
+
+    The block starts with the int64 timestamps of the aligned timeline,
+    followed by the (bars x symbols x fields) float64 panel of the
+    HistoricCSVArrayDataHandler, laid out exactly as it is in memory.
+
+    The publishing process loads the CSV files once and creates the
+    store with publish(). Its spec is a small, picklable dictionary
+    that worker processes pass to attach() in order to map the same
+    block into their own address space without copying it.
+
+    NOTE:
+        The publisher owns the shared memory and must call unlink()
+        once every worker has finished. Workers should be child
+        processes of the publisher (such as those of a ParameterSweep)
+        so that they share its resource tracker.
+    """
+
+    def __init__(self, shm, spec, owner):
+        """
+        Initializes the store around an existing shared memory block.
+        Use publish() or attach() rather than calling this directly.
+
+        Parameters
+        ----------
+        shm : 'SharedMemory'
+            The shared memory block.
+        spec : 'dict'
+            The name, symbols, fields and number of bars of the store.
+        owner : 'bool'
+            Whether this process created the block.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.shm = shm
+        self.spec = spec
+        self.owner = owner
+
+        num_bars = spec['num_bars']
+        shape = (num_bars, len(spec['symbol_list']), len(spec['fields']))
+
+        self.timestamps = np.ndarray(
+            (num_bars,), dtype=np.int64, buffer=shm.buf
+        )
+        self.panel = np.ndarray(
+            shape, dtype=np.float64, buffer=shm.buf,
+            offset=self.timestamps.nbytes
+        )
+
+
+    @classmethod
+    def publish(cls, csv_dir, symbol_list,
+                data_handler=HistoricCSVArrayDataHandler):
+        """
+        Loads the CSV files once and copies the aligned arrays into a
+        new block of shared memory.
+
+        Parameters
+        ----------
+        csv_dir : 'str'
+            Absolute directory path to the CSV files.
+        symbol_list : 'list'
+            A list of symbol strings.
+        data_handler : 'DataHandler', optional
+            The array-backed data handler class used to load the files.
+            The default is HistoricCSVArrayDataHandler.
+
+        Returns
+        -------
+        'SharedBarStore'
+            The store, owned by this process.
+
+        """
+
+        bars = data_handler(None, csv_dir, symbol_list)
+        num_bars = len(bars.timestamps)
+        nbytes = 8 * num_bars * (1 + len(symbol_list) * len(BAR_FIELDS))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        spec = {
+            'name': shm.name,
+            'symbol_list': list(symbol_list),
+            'fields': BAR_FIELDS,
+            'num_bars': num_bars,
+        }
+        store = cls(shm, spec, owner=True)
+
+        store.timestamps[:] = bars.timestamps
+        if bars.panel is not None:
+            store.panel[:] = bars.panel
+        else:
+            for i, s in enumerate(symbol_list):
+                for j, f in enumerate(BAR_FIELDS):
+                    store.panel[:, i, j] = bars.symbol_data[s][f]
+        return store
+
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Maps an existing store, published by another process, into
+        this process without copying it.
+
+        Parameters
+        ----------
+        spec : 'dict'
+            The spec of the published store.
+
+        Returns
+        -------
+        'SharedBarStore'
+            The attached store.
+
+        """
+
+        shm = shared_memory.SharedMemory(name=spec['name'])
+        return cls(shm, spec, owner=False)
+
+
+    def symbol_data(self):
+        """
+        Returns the column arrays of every symbol, keyed by symbol and
+        then by field, as read-only views onto the shared panel.
+
+        """
+
+        self.panel.flags.writeable = False
+        return dict(
+            (s, dict((f, self.panel[:, i, j])
+                     for j, f in enumerate(self.spec['fields'])))
+            for i, s in enumerate(self.spec['symbol_list'])
+        )
+
+
+    def close(self):
+        """
+        Releases this process's mapping of the shared block.
+
+        """
+
+        self.timestamps = None
+        self.panel = None
+        self.shm.close()
+
+
+    def unlink(self):
+        """
+        Frees the shared block. Only the publishing process should call
+        this, once all of the workers have finished with it.
+
+        """
+
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+
+class HistoricSharedMemoryDataHandler(HistoricCSVArrayDataHandler):
+    """
+    HistoricSharedMemoryDataHandler is a HistoricCSVArrayDataHandler
+    whose panel and column arrays are views onto a SharedBarStore, 
+    rather than arrays loaded from the CSV files by this process.
+
+    Any number of handlers in any number of worker processes can
+    attach to the same store, so the RAM used for the market data does
+    not grow with the number of workers.
+    """
+
+    def __init__(self, events, csv_dir, symbol_list, store_spec):
+        """
+        Initializes the handler by attaching to a published store.
+
+        Parameters
+        ----------
+        events : 'Queue'
+            The event queue.
+        csv_dir : 'str'
+            Absolute directory path to the CSV files. Kept for
+            compatibility, the files themselves are not read.
+        symbol_list : 'list'
+            A list of symbol strings, all of which must be in the store.
+        store_spec : 'dict'
+            The spec of the published SharedBarStore.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.store_spec = store_spec
+        super(HistoricSharedMemoryDataHandler, self).__init__(
+            events, csv_dir, symbol_list
+        )
+
+
+    def _open_convert_csv_files(self):
+        """
+        Attaches to the SharedBarStore and takes views of the requested
+        symbols' columns and of the timeline. 
+        
+        The panel view only covers the requested symbols (and so is a 
+        copy) when they are not all of the published symbols in order.
+
+        """
+
+        self.store = SharedBarStore.attach(self.store_spec)
+        shared = self.store.symbol_data()
+        for s in self.symbol_list:
+            self.symbol_data[s] = shared[s]
+
+        published = self.store_spec['symbol_list']
+        if list(self.symbol_list) == published:
+            self.panel = self.store.panel
+        else:
+            self.panel = self.store.panel[
+                :, [published.index(s) for s in self.symbol_list]
+            ]
+
+        self.store.timestamps.flags.writeable = False
+        self.timestamps = self.store.timestamps
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized slippage and market-impact models of the cost of fills.
+"""
+
+
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+
+class SlippageModel(object):
+    """
+    SlippageModel is an abstract base class providing an interface for
+    all subsequent (inherited) execution cost models.
+
+    A SlippageModel prices a whole batch of market orders filled in the
+    same bar at once. The ExecutionHandler passes it arrays holding the
+    quantity, reference price, bar volume and return volatility of each
+    order, and it returns the adverse price move per share of each in
+    a single vectorized pass. The quantity of each order is the total
+    traded in its symbol within the bar, so splitting an order does not
+    reduce its cost.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def slippage(self, quantities, prices, volumes, volatilities):
+        """
+        Calculates the slippage of a batch of orders.
+
+        Parameters
+        ----------
+        quantities : 'np.ndarray'
+            The (unsigned) quantity traded in each order's symbol.
+        prices : 'np.ndarray'
+            The reference (e.g. close) price of each order.
+        volumes : 'np.ndarray'
+            The bar volume of each order's symbol.
+        volatilities : 'np.ndarray'
+            The standard deviation of the period returns of each
+            order's symbol (NaN if not yet known).
+
+        Returns
+        -------
+        'np.ndarray'
+            The (non-negative) price move against each order, per share.
+
+        """
+
+        raise NotImplementedError("Should implement slippage()")
+
+
+    def fill_prices(self, directions, quantities, prices, volumes,
+                    volatilities):
+        """
+        Calculates the fill prices of a batch of orders, i.e. their
+        reference prices moved against them by the slippage. An order
+        whose slippage cannot be calculated from the data (e.g. a
+        missing volume) is filled at its reference price.
+
+        Parameters
+        ----------
+        directions : 'np.ndarray'
+            +1 for each buy order and -1 for each sell order.
+        quantities, prices, volumes, volatilities : 'np.ndarray'
+            As for slippage.
+
+        Returns
+        -------
+        'np.ndarray'
+            The fill price of each order.
+
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slip = self.slippage(quantities, prices, volumes, volatilities)
+        slip = np.where(np.isfinite(slip), slip, 0.0)
+        return prices + directions * slip
+
+
+
+class FixedBpsSlippage(SlippageModel):
+    """
+    Charges a fixed number of basis points of the price on every fill,
+    whatever its size.
+    """
+
+    def __init__(self, bps=5.0):
+        """
+        Initializes the model.
+
+        Parameters
+        ----------
+        bps : 'float', optional
+            The slippage in basis points. The default is 5.0.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.bps = bps
+
+
+    def slippage(self, quantities, prices, volumes, volatilities):
+        """
+        Returns 'bps' basis points of the price of each order.
+
+        Parameters
+        ----------
+        quantities : 'np.ndarray'
+            The (unsigned) number of shares traded in each order's
+            symbol within the bar.
+        prices : 'np.ndarray'
+            The reference price of each order, in dollars per share.
+        volumes : 'np.ndarray'
+            The bar volume of each order's symbol, in shares.
+        volatilities : 'np.ndarray'
+            The standard deviation of the period returns of each
+            order's symbol, as a fraction.
+
+        Returns
+        -------
+        'np.ndarray'
+            The slippage of each order in dollars per share. It is
+            non-negative and is moved against the order, i.e. added to
+            the price of a buy and subtracted from that of a sell.
+
+        """
+
+        return prices * (self.bps * 1e-4)
+
+
+
+class SpreadSlippage(SlippageModel):
+    """
+    Charges half of the bid-ask spread on every fill, i.e. the cost of
+    crossing from the mid price to the far side of the quote. Without
+    quote data, the spread is taken to be a fixed number of basis
+    points of the price, but no less than one tick.
+    """
+
+    def __init__(self, spread_bps=10.0, tick_size=0.01):
+        """
+        Initializes the model.
+
+        Parameters
+        ----------
+        spread_bps : 'float', optional
+            The quoted spread in basis points. The default is 10.0.
+        tick_size : 'float', optional
+            The smallest possible spread. The default is 0.01.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.spread_bps = spread_bps
+        self.tick_size = tick_size
+
+
+    def slippage(self, quantities, prices, volumes, volatilities):
+        """
+        Returns half of the estimated spread of each order's symbol.
+
+        Parameters
+        ----------
+        quantities : 'np.ndarray'
+            The (unsigned) number of shares traded in each order's
+            symbol within the bar.
+        prices : 'np.ndarray'
+            The reference price of each order, in dollars per share.
+        volumes : 'np.ndarray'
+            The bar volume of each order's symbol, in shares.
+        volatilities : 'np.ndarray'
+            The standard deviation of the period returns of each
+            order's symbol, as a fraction.
+
+        Returns
+        -------
+        'np.ndarray'
+            The slippage of each order in dollars per share. It is
+            non-negative and is moved against the order, i.e. added to
+            the price of a buy and subtracted from that of a sell.
+
+        """
+
+        spread = np.maximum(prices * (self.spread_bps * 1e-4), self.tick_size)
+        return 0.5 * spread
+
+
+
+class SquareRootImpactSlippage(SlippageModel):
+    """
+    Charges the market impact of the square-root law: an order moves
+    the price by a multiple of the symbol's return volatility times the
+    square root of its participation in the bar's volume,
+
+        impact = coefficient * volatility * sqrt(quantity / volume) * price
+
+    so that the cost per share grows with the size of the order, and
+    is highest in volatile, illiquid names. The participation is capped
+    at max_participation, beyond which the model no longer applies.
+    """
+
+    def __init__(self, coefficient=1.0, max_participation=1.0):
+        """
+        Initializes the model.
+
+        Parameters
+        ----------
+        coefficient : 'float', optional
+            The multiple of the volatility, which is of order one for
+            most equity markets. The default is 1.0.
+        max_participation : 'float', optional
+            The largest fraction of the bar volume used in the impact.
+            The default is 1.0.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.coefficient = coefficient
+        self.max_participation = max_participation
+
+
+    def slippage(self, quantities, prices, volumes, volatilities):
+        """
+        Returns the square-root market impact of each order.
+
+        Parameters
+        ----------
+        quantities : 'np.ndarray'
+            The (unsigned) number of shares traded in each order's
+            symbol within the bar.
+        prices : 'np.ndarray'
+            The reference price of each order, in dollars per share.
+        volumes : 'np.ndarray'
+            The bar volume of each order's symbol, in shares.
+        volatilities : 'np.ndarray'
+            The standard deviation of the period returns of each
+            order's symbol, as a fraction.
+
+        Returns
+        -------
+        'np.ndarray'
+            The slippage of each order in dollars per share. It is
+            non-negative and is moved against the order, i.e. added to
+            the price of a buy and subtracted from that of a sell.
+            It is NaN where the volatility or volume is not known,
+            which fill_prices treats as no slippage.
+
+        """
+
+        participation = np.minimum(
+            quantities / volumes, self.max_participation
+        )
+        impact = self.coefficient * volatilities * np.sqrt(participation)
+        return impact * prices
+
+
+
+class CompositeSlippage(SlippageModel):
+    """
+    Charges the sum of the slippage of several models, e.g. half the
+    spread plus the market impact.
+    """
+
+    def __init__(self, models):
+        """
+        Initializes the model.
+
+        Parameters
+        ----------
+        models : 'list'
+            The SlippageModel objects to sum.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.models = list(models)
+
+
+    def slippage(self, quantities, prices, volumes, volatilities):
+        """
+        Returns the sum of the slippage of the models, each of which
+        counts as zero for the orders it cannot price.
+
+        Parameters
+        ----------
+        quantities : 'np.ndarray'
+            The (unsigned) number of shares traded in each order's
+            symbol within the bar.
+        prices : 'np.ndarray'
+            The reference price of each order, in dollars per share.
+        volumes : 'np.ndarray'
+            The bar volume of each order's symbol, in shares.
+        volatilities : 'np.ndarray'
+            The standard deviation of the period returns of each
+            order's symbol, as a fraction.
+
+        Returns
+        -------
+        'np.ndarray'
+            The slippage of each order in dollars per share. It is
+            non-negative and is moved against the order, i.e. added to
+            the price of a buy and subtracted from that of a sell.
+
+        """
+
+        total = np.zeros(len(prices))
+        for model in self.models:
+            slip = model.slippage(quantities, prices, volumes, volatilities)
+            total += np.where(np.isfinite(slip), slip, 0.0)
+        return total
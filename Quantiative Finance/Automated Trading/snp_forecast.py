@@ -15,7 +15,7 @@ from sklearn.discriminant_analysis import (
 )
 
 from strategy import Strategy
-from event import SignalEvent
+from event import EventType, SignalEvent
 from backtest import Backtest
 from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
@@ -130,7 +130,7 @@ class SPYDailyForecastStrategy(Strategy):
         sym = self.symbol_list[0]
         cur_date = self.datetime_now
         
-        if event.type == 'MARKET':
+        if event.type == EventType.MARKET:
             self.bar_index += 1
             if self.bar_index > 5:
                 lags = self.bars.get_latest_bars_values(
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rules that end a backtest early.
+"""
+
+
+from abc import ABCMeta, abstractmethod
+
+
+class StoppingRule(object):
+    """
+    StoppingRule is an abstract base class providing an interface for
+    all subsequent (inherited) rules that end a backtest early.
+
+    The Backtest checks each of its stopping rules once per heartbeat,
+    after all of the events of that heartbeat have been handled. As
+    soon as one rule fires, the backtest stops and records the reason
+    given by the rule.
+
+    This allows the obviously bad runs of a large parameter sweep to
+    be abandoned long before the end of the data. The rules read the
+    portfolio's online_stats, so checking them is O(1) per heartbeat.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def check(self, backtest):
+        """
+        Decides whether the backtest should stop.
+
+        Parameters
+        ----------
+        backtest : 'Backtest'
+            The running backtest.
+
+        Returns
+        -------
+        'str'
+            The reason for stopping, or None to carry on.
+
+        """
+
+        raise NotImplementedError("Should implement check()")
+
+
+
+class MaxDrawdownRule(StoppingRule):
+    """
+    Stops the backtest once the drawdown of the equity curve exceeds
+    a limit, expressed as a fraction of the initial capital as in
+    create_drawdowns.
+    """
+
+    def __init__(self, max_drawdown):
+        """
+        Initializes the rule.
+
+        Parameters
+        ----------
+        max_drawdown : 'float'
+            The largest drawdown allowed, e.g. 0.2 for 20%.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.max_drawdown = max_drawdown
+
+
+    def check(self, backtest):
+        """
+        Fires once the current drawdown exceeds max_drawdown.
+
+        """
+
+        drawdown = backtest.portfolio.online_stats.drawdown
+        if drawdown > self.max_drawdown:
+            return "Drawdown of %0.2f%% exceeded the %0.2f%% limit" % (
+                drawdown * 100.0, self.max_drawdown * 100.0
+            )
+        return None
+
+
+
+class MinEquityRule(StoppingRule):
+    """
+    Stops the backtest once the total account equity falls below a
+    given amount.
+    """
+
+    def __init__(self, min_equity):
+        """
+        Initializes the rule.
+
+        Parameters
+        ----------
+        min_equity : 'float'
+            The smallest total account equity allowed, in USD.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.min_equity = min_equity
+
+
+    def check(self, backtest):
+        """
+        Fires once the latest total equity is below min_equity.
+
+        """
+
+        total = backtest.portfolio.online_stats.last_total
+        if total is not None and total < self.min_equity:
+            return "Equity of %0.2f fell below %0.2f" % (
+                total, self.min_equity
+            )
+        return None
+
+
+
+class NoTradesRule(StoppingRule):
+    """
+    Stops the backtest if no fills have taken place after a given
+    number of bars.
+    """
+
+    def __init__(self, bars):
+        """
+        Initializes the rule.
+
+        Parameters
+        ----------
+        bars : 'int'
+            The number of bars without a fill after which to stop.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.bars = bars
+
+
+    def check(self, backtest):
+        """
+        Fires if there have been no fills after the given bars.
+
+        """
+
+        if backtest.fills == 0 and backtest.heartbeats >= self.bars:
+            return "No trades after %s bars" % self.bars
+        return None
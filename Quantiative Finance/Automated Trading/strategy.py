@@ -48,4 +48,90 @@ class Strategy(object):
         """
         
         raise NotImplementedError("Should implement calculate_signals()")
-    
\ No newline at end of file
+        
+        
+    def calculate_vectorized_signals(self, prices):
+        """
+        Provides the signal state of every symbol at every bar for the
+        VectorizedBacktest, computed from the whole price history at 
+        once.
+        
+        The state is +1 for long, -1 for short and 0 for out of the 
+        market, after the signals generated on that bar. It must match
+        the signals that calculate_signals would generate bar by bar.
+
+        Parameters
+        ----------
+        prices : 'np.ndarray'
+            A (bars x symbols) matrix of prices.
+
+        Returns
+        -------
+        'np.ndarray'
+            A (bars x symbols) matrix of signal states.
+
+        """
+        
+        raise NotImplementedError(
+            "Should implement calculate_vectorized_signals()"
+        )
+        
+        
+        
+class MultiStrategy(Strategy):
+    """
+    MultiStrategy runs several strategies side by side on the same
+    DataHandler, so that all of them are driven by a single pass over
+    the market data.
+    
+    Each strategy must tag its signals with its own strategy_id, which
+    is used by a MultiStrategyPortfolio to keep a separate book for it.
+    """
+    
+    def __init__(self, bars, events, strategies):
+        """
+        Initializes the strategies.
+
+        Parameters
+        ----------
+        bars : 'DataHandler'
+            The DataHandler object that provides bar information.
+        events : 'Queue'
+            The Event Queue object.
+        strategies : 'list'
+            (Strategy class, keyword arguments dict) pairs. Unless the
+            keyword arguments give a strategy_id, the i-th strategy is
+            given a strategy_id of i + 1.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.bars = bars
+        self.events = events
+        self.strategies = []
+        for i, (strategy_cls, params) in enumerate(strategies):
+            params = dict(params)
+            params.setdefault('strategy_id', i + 1)
+            self.strategies.append(strategy_cls(bars, events, **params))
+            
+            
+    def calculate_signals(self, event):
+        """
+        Lets every strategy calculate its signals from the event.
+
+        Parameters
+        ----------
+        event : "Event"
+            The Event object which the strategies react to.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        for strategy in self.strategies:
+            strategy.calculate_signals(event)
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resting stop-loss, take-profit and trailing stop triggers.
+"""
+
+
+from bisect import bisect_left, bisect_right, insort
+import itertools
+
+
+class Trigger(object):
+    """
+    A resting exit order that is sent to the market once the price of
+    its symbol crosses a trigger level.
+
+    The kind is one of 'STOP', 'TARGET' or 'TRAIL' and the direction is
+    that of the exit order, i.e. 'SELL' to exit a long position and
+    'BUY' to exit a short one. Triggers in the same group are
+    one-cancels-other: once one of them fires the rest are cancelled.
+    """
+
+    __slots__ = ('trigger_id', 'symbol', 'kind', 'direction', 'quantity',
+                 'group')
+
+    def __init__(self, trigger_id, symbol, kind, direction, quantity,
+                 group):
+        self.trigger_id = trigger_id
+        self.symbol = symbol
+        self.kind = kind
+        self.direction = direction
+        self.quantity = quantity
+        self.group = group
+
+
+    def __repr__(self):
+        return "Trigger(%s, %s, %s, %s, %s)" % (
+            self.trigger_id, self.symbol, self.kind, self.direction,
+            self.quantity
+        )
+
+
+
+class _TrailingLevel(object):
+    """
+    The trailing stops of one book that share the same reference price,
+    i.e. the best price seen since they were placed.
+
+    """
+
+    __slots__ = ('ref', 'ids')
+
+    def __init__(self, ref, ids):
+        self.ref = ref
+        self.ids = ids
+
+
+
+class _TrailingBook(object):
+    """
+    The trailing stops of a symbol with the same percentage and
+    direction, held as levels sorted by reference price.
+
+    A trailing stop exiting a long position follows the highest price
+    since it was placed. Once the market trades above the reference of
+    a level, that level's reference becomes the new high, so every
+    level below the new high merges into a single level. Ratcheting
+    therefore touches only the levels that actually move (the lowest
+    ones), and merging always moves the smaller levels' ids into the
+    largest, so each id is moved O(log n) times overall. The exits of
+    short positions mirror this with the lowest price.
+    """
+
+    def __init__(self, pct, direction):
+        self.pct = pct
+        self.direction = direction
+        self.refs = []
+        self.levels = []
+
+
+    def add(self, trigger_id, ref):
+        """
+        Adds a trailing stop with the given reference price and returns
+        its level.
+
+        """
+
+        i = bisect_left(self.refs, ref)
+        if i < len(self.refs) and self.refs[i] == ref:
+            level = self.levels[i]
+            level.ids.add(trigger_id)
+        else:
+            level = _TrailingLevel(ref, set([trigger_id]))
+            self.refs.insert(i, ref)
+            self.levels.insert(i, level)
+        return level
+
+
+    def remove(self, trigger_id, level):
+        """
+        Removes a trailing stop from its level.
+
+        """
+
+        level.ids.discard(trigger_id)
+        if not level.ids:
+            i = bisect_left(self.refs, level.ref)
+            del self.refs[i]
+            del self.levels[i]
+
+
+    def pop_triggered(self, low, high):
+        """
+        Removes and returns the levels whose stop price was crossed by
+        a bar, with a single slice deletion.
+
+        """
+
+        refs = self.refs
+        if self.direction == 'SELL':
+            # Fires when low <= ref * (1 - pct)
+            i = bisect_left(refs, low / (1.0 - self.pct))
+            fired = self.levels[i:]
+            del refs[i:]
+            del self.levels[i:]
+        else:
+            # Fires when high >= ref * (1 + pct)
+            i = bisect_right(refs, high / (1.0 + self.pct))
+            fired = self.levels[:i]
+            del refs[:i]
+            del self.levels[:i]
+        return fired
+
+
+    def ratchet(self, low, high, levels):
+        """
+        Moves every level behind the latest bar up to its high (or down
+        to its low), merging them into one level. The (book, level) 
+        entries of the moved ids in 'levels' are kept up to date.
+
+        """
+
+        refs = self.refs
+        if self.direction == 'SELL':
+            i = bisect_left(refs, high)
+            if i == 0:
+                return
+            moved = self.levels[:i]
+            del refs[:i]
+            del self.levels[:i]
+            merged = self._merge(moved, high, levels)
+            refs.insert(0, high)
+            self.levels.insert(0, merged)
+        else:
+            i = bisect_right(refs, low)
+            if i == len(refs):
+                return
+            moved = self.levels[i:]
+            del refs[i:]
+            del self.levels[i:]
+            merged = self._merge(moved, low, levels)
+            refs.append(low)
+            self.levels.append(merged)
+
+
+    def _merge(self, moved, ref, levels):
+        """
+        Merges levels into the largest of them, which takes the new
+        reference price.
+
+        """
+
+        merged = max(moved, key=lambda level: len(level.ids))
+        for level in moved:
+            if level is not merged:
+                merged.ids.update(level.ids)
+                for trigger_id in level.ids:
+                    levels[trigger_id] = (self, merged)
+        merged.ref = ref
+        return merged
+
+
+
+class TriggerBook(object):
+    """
+    TriggerBook holds the resting stop-loss, take-profit and trailing
+    stop orders of a portfolio, indexed by symbol and trigger price.
+
+    The fixed triggers of each symbol are kept in two lists of
+    (price, id) sorted by price: those that fire when the bar's low
+    falls to their price (long stop-losses and short targets) and those
+    that fire when the bar's high rises to it (long targets and short
+    stop-losses). Updating a symbol with a new bar bisects each list
+    once and removes all of the triggers that fired with a single 
+    slice deletion, so a bar takes O(log n + k) comparisons for n 
+    resting triggers of which k fire, rather than a scan of every open
+    order. Trailing stops are held in a similar sorted book of levels 
+    (see _TrailingBook).
+    
+    The lists are plain Python lists, so inserting a trigger, deleting
+    a slice from the front of a list and cancelling a trigger that has
+    not fired (including the other triggers of a group that fired) 
+    each also move up to n list entries. These are single memmoves of 
+    pointers, which are cheap for the number of triggers that a symbol
+    typically has, but are O(n) rather than O(log n).
+
+    Within a bar the triggers are checked against the low and high
+    before the trailing stops are ratcheted, since the order in which
+    the high and low traded is not known. If several triggers of the
+    same one-cancels-other group fire in the same bar, the stop-losses
+    take priority over the targets.
+    """
+
+    # The order in which triggers of the same group fire within a bar
+    _PRIORITY = {'STOP': 0, 'TRAIL': 1, 'TARGET': 2}
+
+    def __init__(self):
+        """
+        Initializes an empty trigger book.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self._ids = itertools.count()
+        self._groups = itertools.count()
+
+        self.triggers = {}
+        self._prices = {}
+        self._levels = {}
+        self._group_ids = {}
+
+        self._below = {}
+        self._above = {}
+        self._trailing = {}
+        self._counts = {}
+
+
+    @property
+    def symbols(self):
+        """
+        The symbols with at least one resting trigger.
+
+        """
+
+        return self._counts.keys()
+
+
+    def new_group(self):
+        """
+        Returns a new one-cancels-other group key.
+
+        """
+
+        return next(self._groups)
+
+
+    def _add(self, symbol, kind, direction, quantity, group):
+        """
+        Registers a new trigger and returns it.
+
+        """
+
+        if direction not in ('BUY', 'SELL'):
+            raise ValueError("direction must be 'BUY' or 'SELL'")
+
+        trigger = Trigger(
+            next(self._ids), symbol, kind, direction, quantity, group
+        )
+        self.triggers[trigger.trigger_id] = trigger
+        self._counts[symbol] = self._counts.get(symbol, 0) + 1
+        if group is not None:
+            self._group_ids.setdefault(group, set()).add(trigger.trigger_id)
+        return trigger
+
+
+    def _add_fixed(self, symbol, kind, price, direction, quantity, group,
+                   below):
+        """
+        Adds a trigger at a fixed price to the low or high book of a
+        symbol.
+
+        """
+
+        trigger = self._add(symbol, kind, direction, quantity, group)
+        book = (self._below if below else self._above).setdefault(symbol, [])
+        insort(book, (price, trigger.trigger_id))
+        self._prices[trigger.trigger_id] = price
+        return trigger.trigger_id
+
+
+    def add_stop(self, symbol, price, direction, quantity, group=None):
+        """
+        Adds a stop-loss order, which fires once the market trades
+        through its price against the position.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+        price : 'float'
+            The trigger price.
+        direction : 'str'
+            The direction of the exit order, 'SELL' for a long position
+            or 'BUY' for a short position.
+        quantity : 'int'
+            The quantity of the exit order.
+        group : 'int', optional
+            The one-cancels-other group of the trigger. The default is
+            None.
+
+        Returns
+        -------
+        'int'
+            The id of the trigger.
+
+        """
+
+        return self._add_fixed(
+            symbol, 'STOP', price, direction, quantity, group,
+            below=(direction == 'SELL')
+        )
+
+
+    def add_target(self, symbol, price, direction, quantity, group=None):
+        """
+        Adds a take-profit order, which fires once the market trades
+        through its price in favour of the position. The parameters
+        are as for add_stop.
+
+        """
+
+        return self._add_fixed(
+            symbol, 'TARGET', price, direction, quantity, group,
+            below=(direction == 'BUY')
+        )
+
+
+    def add_trailing_stop(self, symbol, reference, pct, direction,
+                          quantity, group=None):
+        """
+        Adds a trailing stop-loss order, which fires once the market
+        moves 'pct' against the position from the best price seen since
+        the order was placed.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+        reference : 'float'
+            The initial reference price, e.g. the entry price.
+        pct : 'float'
+            The trailing distance as a fraction of the reference price.
+        direction : 'str'
+            The direction of the exit order, 'SELL' for a long position
+            or 'BUY' for a short position.
+        quantity : 'int'
+            The quantity of the exit order.
+        group : 'int', optional
+            The one-cancels-other group of the trigger. The default is
+            None.
+
+        Returns
+        -------
+        'int'
+            The id of the trigger.
+
+        """
+
+        trigger = self._add(symbol, 'TRAIL', direction, quantity, group)
+        books = self._trailing.setdefault(symbol, {})
+        book = books.get((pct, direction))
+        if book is None:
+            book = books[(pct, direction)] = _TrailingBook(pct, direction)
+        self._levels[trigger.trigger_id] = (
+            book, book.add(trigger.trigger_id, reference)
+        )
+        return trigger.trigger_id
+
+
+    def cancel(self, trigger_id):
+        """
+        Cancels a resting trigger. Unknown ids are ignored.
+
+        Parameters
+        ----------
+        trigger_id : 'int'
+            The id of the trigger.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        trigger = self.triggers.pop(trigger_id, None)
+        if trigger is None:
+            return
+        symbol = trigger.symbol
+
+        if trigger.kind == 'TRAIL':
+            if trigger_id in self._levels:
+                book, level = self._levels.pop(trigger_id)
+                book.remove(trigger_id, level)
+                if not book.levels:
+                    del self._trailing[symbol][(book.pct, book.direction)]
+        elif trigger_id in self._prices:
+            price = self._prices.pop(trigger_id)
+            below = (trigger.direction == 'SELL') == (trigger.kind == 'STOP')
+            book = (self._below if below else self._above)[symbol]
+            del book[bisect_left(book, (price, trigger_id))]
+
+        if trigger.group is not None:
+            ids = self._group_ids[trigger.group]
+            ids.discard(trigger_id)
+            if not ids:
+                del self._group_ids[trigger.group]
+
+        self._counts[symbol] -= 1
+        if self._counts[symbol] == 0:
+            del self._counts[symbol]
+            self._below.pop(symbol, None)
+            self._above.pop(symbol, None)
+            self._trailing.pop(symbol, None)
+
+
+    def cancel_group(self, group):
+        """
+        Cancels every resting trigger in a one-cancels-other group.
+
+        """
+
+        for trigger_id in list(self._group_ids.get(group, ())):
+            self.cancel(trigger_id)
+
+
+    def update(self, symbol, low, high):
+        """
+        Fires the triggers of a symbol crossed by a new bar and ratchets
+        its trailing stops. Fired triggers are removed from the book,
+        along with the other triggers in their groups.
+
+        Parameters
+        ----------
+        symbol : 'str'
+            The ticker symbol.
+        low : 'float'
+            The low of the bar.
+        high : 'float'
+            The high of the bar.
+
+        Returns
+        -------
+        'list'
+            The Trigger objects that fired.
+
+        """
+
+        # Slice the crossed triggers out of the books at once, so that
+        # cancelling them below does not delete them one at a time
+        candidates = []
+        below = self._below.get(symbol)
+        if below:
+            i = bisect_left(below, (low, -1))
+            candidates.extend(trigger_id for _, trigger_id in below[i:])
+            del below[i:]
+        above = self._above.get(symbol)
+        if above:
+            i = bisect_right(above, (high, float('inf')))
+            candidates.extend(trigger_id for _, trigger_id in above[:i])
+            del above[:i]
+        for trigger_id in candidates:
+            del self._prices[trigger_id]
+        books = self._trailing.get(symbol, {})
+        for key, book in list(books.items()):
+            for level in book.pop_triggered(low, high):
+                for trigger_id in level.ids:
+                    del self._levels[trigger_id]
+                candidates.extend(level.ids)
+            if not book.levels:
+                del books[key]
+
+        fired = []
+        if candidates:
+            triggers = [self.triggers[trigger_id] for trigger_id in candidates]
+            triggers.sort(key=lambda t: self._PRIORITY[t.kind])
+            for trigger in triggers:
+                if trigger.trigger_id not in self.triggers:
+                    continue
+                fired.append(trigger)
+                if trigger.group is not None:
+                    self.cancel_group(trigger.group)
+                else:
+                    self.cancel(trigger.trigger_id)
+
+        for book in self._trailing.get(symbol, {}).values():
+            book.ratchet(low, high, self._levels)
+        return fired
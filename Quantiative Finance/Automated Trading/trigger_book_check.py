@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Behavioural checks of the TriggerBook. Run as a script; an
+AssertionError means a check failed.
+"""
+
+
+import random
+
+from trigger_book import TriggerBook
+
+
+def check_trailing_ratchet():
+    """
+    Ratchets a long and a short trailing stop with the market, then
+    fires them once it moves back by their distance.
+
+    """
+
+    book = TriggerBook()
+    long_id = book.add_trailing_stop('X', 100.0, 0.1, 'SELL', 100)
+    short_id = book.add_trailing_stop('X', 100.0, 0.1, 'BUY', 50)
+
+    # The stops trail the high of 110 and the low of 95
+    assert book.update('X', 95.0, 110.0) == []
+    assert book.update('X', 99.5, 104.0) == []
+
+    # The long stop is at 99, 10% below the high, and the short stop
+    # at 104.5, 10% above the low
+    fired = book.update('X', 98.9, 104.0)
+    assert [t.trigger_id for t in fired] == [long_id]
+    fired = book.update('X', 100.0, 105.0)
+    assert [t.trigger_id for t in fired] == [short_id]
+    assert not book.triggers and not book.symbols
+
+
+def check_trailing_merge():
+    """
+    Merges trailing stops placed at different prices into one level
+    once the market trades above all of them, so that they fire
+    together.
+
+    """
+
+    book = TriggerBook()
+    ids = [
+        book.add_trailing_stop('X', ref, 0.05, 'SELL', 10)
+        for ref in (100.0, 102.0, 104.0)
+    ]
+    assert book.update('X', 101.0, 120.0) == []
+    trailing = book._trailing['X'][(0.05, 'SELL')]
+    assert trailing.refs == [120.0]
+    assert trailing.levels[0].ids == set(ids)
+
+    # The merged level sits 5% below 120
+    assert book.update('X', 114.5, 116.0) == []
+    fired = book.update('X', 114.0, 115.0)
+    assert sorted(t.trigger_id for t in fired) == ids
+    assert not book.triggers and not book.symbols
+
+
+def check_one_cancels_other():
+    """
+    Fires the stop-loss of a group whose stop and target are both
+    crossed by the same bar, cancelling the rest of the group, and
+    leaves another group untouched.
+
+    """
+
+    book = TriggerBook()
+    group = book.new_group()
+    stop = book.add_stop('X', 95.0, 'SELL', 100, group)
+    book.add_target('X', 110.0, 'SELL', 100, group)
+    book.add_trailing_stop('X', 100.0, 0.2, 'SELL', 100, group)
+    other = book.new_group()
+    other_stop = book.add_stop('X', 80.0, 'SELL', 10, other)
+
+    fired = book.update('X', 94.0, 111.0)
+    assert [t.trigger_id for t in fired] == [stop]
+    assert list(book.triggers) == [other_stop]
+
+    book.cancel_group(other)
+    book.cancel(other_stop)
+    assert not book.triggers and not book.symbols
+
+
+def check_against_scan(num_bars=2000, seed=0):
+    """
+    Checks the triggers fired by random bars against a scan of every
+    resting trigger.
+
+    """
+
+    rng = random.Random(seed)
+    book = TriggerBook()
+    resting = {}
+    for _ in range(num_bars):
+        if rng.random() < 0.3:
+            direction = rng.choice(('BUY', 'SELL'))
+            price = rng.uniform(90.0, 110.0)
+            kind = rng.choice(('STOP', 'TARGET', 'TRAIL'))
+            if kind == 'STOP':
+                trigger_id = book.add_stop('X', price, direction, 1)
+            elif kind == 'TARGET':
+                trigger_id = book.add_target('X', price, direction, 1)
+            else:
+                pct = rng.choice((0.05, 0.1))
+                trigger_id = book.add_trailing_stop(
+                    'X', price, pct, direction, 1
+                )
+            resting[trigger_id] = [kind, direction, price] + (
+                [pct] if kind == 'TRAIL' else []
+            )
+        if resting and rng.random() < 0.05:
+            trigger_id = rng.choice(list(resting))
+            del resting[trigger_id]
+            book.cancel(trigger_id)
+
+        low = rng.uniform(85.0, 105.0)
+        high = low + rng.uniform(0.0, 10.0)
+        expected = set()
+        for trigger_id, (kind, direction, price) in (
+                (i, r[:3]) for i, r in resting.items()):
+            sell = direction == 'SELL'
+            if kind == 'STOP':
+                crossed = low <= price if sell else high >= price
+            elif kind == 'TARGET':
+                crossed = high >= price if sell else low <= price
+            else:
+                pct = resting[trigger_id][3]
+                crossed = (
+                    low <= price * (1 - pct) if sell
+                    else high >= price * (1 + pct)
+                )
+            if crossed:
+                expected.add(trigger_id)
+
+        fired = set(t.trigger_id for t in book.update('X', low, high))
+        assert fired == expected
+        for trigger_id in fired:
+            del resting[trigger_id]
+        for r in resting.values():
+            if r[0] == 'TRAIL':
+                r[2] = max(r[2], high) if r[1] == 'SELL' else min(r[2], low)
+        assert len(book.triggers) == len(resting)
+
+
+
+if __name__ == "__main__":
+    check_trailing_ratchet()
+    check_trailing_merge()
+    check_one_cancels_other()
+    check_against_scan()
+    print("TriggerBook checks passed")
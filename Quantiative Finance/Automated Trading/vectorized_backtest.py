@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A vectorized backtest of signal-based strategies.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from event import calculate_ib_commissions
+from event_bus import EventBus
+from performance import create_sharpe_ratio, create_drawdowns
+
+
+class VectorizedBacktest(object):
+    """
+    Encapsulates the settings and components for carrying out a
+    vectorized backtest of a signal-based strategy.
+
+    Rather than stepping through the Event Queue one bar at a time,
+    the whole aligned price matrix is taken from the data handler and
+    passed to the strategy's calculate_vectorized_signals method. The
+    positions, fills, commission, holdings and equity curve are then
+    all computed with array operations.
+
+    The accounting replicates the event-driven Backtest with the naive
+    Portfolio and the SimulatedExecutionHandler:
+        - A signal state of +1/-1 holds 'quantity' shares long/short
+          and 0 holds no position, as generate_naive_order does.
+        - Fills take place at the price of the bar that generated the
+          signal and are charged the Interactive Brokers commission.
+        - Each bar's holdings row marks the positions held before that
+          bar's fills, since Portfolio.update_timeindex runs before the
+          signals are turned into orders and fills.
+        - A final row marks the positions after the last bar's fills,
+          which the event-driven Backtest records once the data handler
+          is exhausted.
+
+    The equity curve therefore reconciles with the one produced by
+    Portfolio.create_equity_curve_dataframe, which allows thousands of
+    parameter sets to be screened quickly with only the final
+    candidates validated by the event-driven Backtest.
+
+    NOTE:
+        Signal functions should only move between long and short via
+        the flat state, since generate_naive_order ignores a LONG or
+        SHORT signal while a position is open.
+    """
+
+    def __init__(
+            self, csv_dir, symbol_list, initial_capital,
+            start_date, data_handler, strategy,
+            strategy_params_dict=None, quantity=100,
+            price_type="adj_close"
+            ):
+        """
+        Initializes the vectorized backtest.
+
+        Parameters
+        ----------
+        csv_dir : 'str'
+            The hard root to the CSV data directory.
+        symbol_list : 'list'
+            The list of symbol strings.
+        initial_capital : 'float'
+            The starting capital for the portfolio.
+        start_date : 'datetime'
+            The start datetime of the strategy.
+        data_handler : 'DataHandler'
+            An array-backed data handler, such as
+            HistoricCSVArrayDataHandler, that provides get_price_matrix.
+        strategy : 'Strategy'
+            A strategy implementing calculate_vectorized_signals.
+        strategy_params_dict : 'dict', optional
+            Keyword arguments passed to the Strategy. The default is None.
+        quantity : 'int', optional
+            The number of shares traded per signal. The default is 100.
+        price_type : 'str', optional
+            The bar field used for signals and fills. The default is
+            "adj_close".
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.initial_capital = initial_capital
+        self.start_date = start_date
+        self.quantity = quantity
+        self.price_type = price_type
+
+        self.data_handler_cls = data_handler
+        self.strategy_cls = strategy
+        self.strategy_params_dict = strategy_params_dict or {}
+
+        self.events = EventBus()
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+
+        self._generate_trading_instances()
+
+
+    def _generate_trading_instances(self):
+        """
+        Generates the data handler and strategy objects from their
+        class types.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        self.data_handler = self.data_handler_cls(
+            self.events, self.csv_dir, self.symbol_list
+        )
+        self.strategy = self.strategy_cls(
+            self.data_handler, self.events, **self.strategy_params_dict
+        )
+
+
+    def _run_backtest(self):
+        """
+        Computes the positions, fills and holdings for every bar and
+        builds the equity curve.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        prices = self.data_handler.get_price_matrix(self.price_type)
+        index = self.data_handler.get_datetime_index()
+
+        # Positions after each bar's fills
+        states = self.strategy.calculate_vectorized_signals(prices)
+        positions = states.astype(np.int64) * self.quantity
+
+        # Fills and their cost, charged to cash on the bar of the signal
+        trades = np.diff(positions, axis=0, prepend=0)
+        commission = calculate_ib_commissions(trades)
+        value = np.where(trades != 0, trades * prices, 0.0)
+        cost = (value + commission).sum(axis=1)
+
+        self.fills = self.orders = int(np.count_nonzero(trades))
+        self.signals = self.fills
+
+        cash_after = self.initial_capital - np.cumsum(cost)
+        commission_after = np.cumsum(commission.sum(axis=1))
+
+        # Each bar marks the positions and cash from before its fills,
+        # followed by a final row after the last bar's fills
+        held = np.concatenate([
+            np.zeros((1, len(self.symbol_list)), dtype=np.int64), positions
+        ])
+        marks = np.concatenate([prices, prices[-1:]])
+        cash = np.concatenate([[self.initial_capital], cash_after])
+        comm = np.concatenate([[0.0], commission_after])
+
+        holdings = held * marks
+        total = cash + holdings.sum(axis=1)
+
+        # Prepend the initial row at the start date
+        n_sym = len(self.symbol_list)
+        block = np.empty((len(total) + 1, n_sym + 3))
+        block[0, :n_sym] = 0.0
+        block[0, n_sym:] = (
+            self.initial_capital, 0.0, self.initial_capital
+        )
+        block[1:, :n_sym] = holdings
+        block[1:, n_sym] = cash
+        block[1:, n_sym + 1] = comm
+        block[1:, n_sym + 2] = total
+
+        datetimes = [self.start_date] + list(index) + [index[-1]]
+        curve = pd.DataFrame(
+            block, index=pd.Index(datetimes, name='datetime'),
+            columns=list(self.symbol_list) + ['cash', 'commission', 'total']
+        )
+        curve['returns'] = curve['total'].pct_change()
+        curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+        self.positions = positions
+        self.equity_curve = curve
+
+
+    def output_summary_stats(self, periods=252):
+        """
+        Creates a list of summary statistics in the same format as
+        Portfolio.output_summary_stats.
+
+        Parameters
+        ----------
+        periods : 'int', optional
+            The number of bars per year used to annualise the Sharpe
+            ratio. The default is 252.
+
+        Returns
+        -------
+        'list'
+            Returns a list of stats relating to portfolio performance
+
+        """
+
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        returns = self.equity_curve['returns']
+        pnl = self.equity_curve['equity_curve']
+
+        sharpe_ratio = create_sharpe_ratio(returns, periods=periods)
+        drawdown, max_dd, dd_duration = create_drawdowns(pnl)
+        self.equity_curve['drawdown'] = drawdown
+
+        stats = [("Total Return", "%0.2f%%" % ((total_return-1)*100.0)),
+                 ("Sharpe Ratio", "%0.2f" % sharpe_ratio),
+                 ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
+                 ("Drawdown Duration", "%d" % dd_duration)]
+        return stats
+
+
+    def simulate_trading(self):
+        """
+        Simulates the backtest and returns the portfolio performance.
+
+        Returns
+        -------
+        'list'
+            Returns a list of stats relating to portfolio performance
+
+        """
+
+        self._run_backtest()
+        return self.output_summary_stats()